@@ -0,0 +1,40 @@
+# Starts a directory ingestion job on the running server and follows it until it finishes.
+import argparse
+import sys
+import time
+
+import httpx
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest a directory (relative to INGEST_ROOT) into the knowledge base")
+    parser.add_argument("directory")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--poll-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # Indexes live in the server process, so the walk runs there and this only reports progress
+    with httpx.Client(base_url=f"{args.url}/api/v1", timeout=30) as client:
+        response = client.post(
+            "/documents/ingest-directory",
+            json={"directory": args.directory, "recursive": not args.no_recursive}
+        )
+        if response.status_code != 200:
+            print(f"Failed to start ingestion: {response.text}", file=sys.stderr)
+            sys.exit(1)
+        job_id = response.json()["job_id"]
+        print(f"Started {job_id} for {response.json()['directory']}")
+
+        while True:
+            time.sleep(args.poll_seconds)
+            job = client.get(f"/documents/ingest-directory/{job_id}").json()
+            print(
+                f"\r{job['files']} files: {job['indexed_documents']} indexed, "
+                f"{job['unchanged']} unchanged, {job['removed_documents']} removed, {job['failed']} failed",
+                end="", flush=True
+            )
+            if not job["running"]:
+                break
+
+    print(f"\n{job_id} {job['status']}")
+    sys.exit(0 if job["status"] == "completed" else 1)
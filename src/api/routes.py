@@ -1,32 +1,78 @@
 import logging
 import time
 import os
-import json
 import asyncio
+import json
+import threading
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile, File, BackgroundTasks
-from typing import Optional, List
+from fastapi import APIRouter, HTTPException, Depends, Header, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional, List, AsyncIterator
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from .schemas import QueryRequest, QueryResponse, HealthResponse
+from .schemas import QueryRequest, QueryResponse, HealthResponse, DirectoryIngestRequest
+from src.rag.bm25 import BM25Index
+from src.rag.query_cache import QueryResultCache
+from src.rag.hybrid_retriever import QueryRewriter
+from src.rag.llm_client import create_llm_client
+from src.embeddings.embedding_matrix import EmbeddingMatrix
+from src.ingestion.embedding_stage import BatchEmbeddingStage
+from src.ingestion.metadata_store import DocumentMetadataStore
+from src.ingestion.content_store import ContentStore
+from src.ingestion.chunker import DocumentChunker, StreamingChunker
+from src.ingestion.dedup import ChunkDeduplicator, hash_content
+from src.ingestion.document_loader import Document, DocumentLoader
+from src.ingestion.manifest import IngestManifest
+from src.ingestion.pipeline import IngestionPipeline, extract_and_chunk
+from src.config import get_settings
+from src.utils.cache import CacheManager
+from src.utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1", tags=["search"])
+settings = get_settings()
 
 # Initialize services (lazy loading)
 embedding_service = None
 vector_store = None
 hybrid_retriever = None
+reranker = None
 llm_client = None
+llm_client_lock = asyncio.Lock()
 
 # Storage
-uploaded_documents = {}
-document_chunks = []
 UPLOAD_DIR = "data/uploads"
-METADATA_FILE = "data/uploads/metadata.json"
-QUERY_CACHE = {}  # Simple in-memory cache for queries
-CACHE_EXPIRY_MINUTES = 60
+content_store = ContentStore(os.path.join(UPLOAD_DIR, "content.bin"))  # Extracted text, read via mmap
+uploaded_documents = DocumentMetadataStore(  # Status per document, findable by content hash
+    UPLOAD_DIR, on_legacy_content=content_store.put, indexed_fields=("content_hash",)
+)
+chunk_dedup = ChunkDeduplicator(os.path.join(UPLOAD_DIR, "chunk_refs"))  # Vector entry behind each chunk
+if settings.chunk_unit == "tokens":
+    # Chunks sized in the embedding model's own tokens, so none are truncated at encode time
+    chunker = DocumentChunker(settings.chunk_max_tokens, settings.chunk_overlap_tokens, tokenizer=settings.embedding_model)
+else:
+    chunker = DocumentChunker(chunk_size=512, chunk_overlap=50)
+ingestion_pipeline = IngestionPipeline(uploaded_documents, max_workers=settings.ingestion_workers)
+ingest_manifest = IngestManifest(settings.ingest_manifest_dir)  # Size, mtime and hash of each ingested source file
+directory_jobs = {}  # Progress of directory ingestion jobs, by job ID
+document_chunks = []
+bm25_index = BM25Index()  # Keyword index, kept in sync with document_chunks
+chunk_embeddings = EmbeddingMatrix()  # Semantic fallback when no vector store is available
+# chunk_embeddings covers a prefix of document_chunks; held while either side of that prefix changes
+chunk_embeddings_lock = threading.Lock()
+query_flights = SingleFlight()  # Coalesces identical in-flight /query requests
+# One manager holds the query and rerank caches, so /stats reports every cache's counters together
+cache_manager = CacheManager(
+    ttl_seconds=settings.query_cache_ttl_seconds,
+    max_entries=settings.query_cache_max_entries + settings.rerank_cache_max_entries
+)
+query_cache = QueryResultCache(
+    max_entries=settings.query_cache_max_entries,
+    ttl_seconds=settings.query_cache_ttl_seconds,
+    similarity_threshold=settings.query_cache_similarity_threshold,
+    cache=cache_manager
+)
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -118,124 +164,128 @@ via PII redaction, scalability for millions of docs).
 """
 
 def load_sample_documents():
-    global document_chunks, uploaded_documents
-    
-    # === FOOTBALL HISTORY DOCUMENT ===
-    football_doc_id = "football_history_001"
-    text = FOOTBALL_HISTORY_DOCUMENT.strip()
-    sentences = text.replace('\n', ' ').split('. ')
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    chunk_size = 512
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + '.'
-        if current_size + len(sentence) > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [sentence]
-            current_size = len(sentence)
-        else:
-            current_chunk.append(sentence)
-            current_size += len(sentence)
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    for i, chunk_text in enumerate(chunks):
-        document_chunks.append({
-            "chunk_id": f"{football_doc_id}_chunk_{i}",
-            "doc_id": football_doc_id,
-            "filename": "History_of_Football.txt",
-            "content": chunk_text,
-            "index": i
-        })
-    
-    uploaded_documents[football_doc_id] = {
-        "id": football_doc_id,
-        "filename": "History_of_Football.txt",
-        "size": len(FOOTBALL_HISTORY_DOCUMENT),
-        "uploaded_at": datetime.now().isoformat(),
-        "status": "ready",
-        "chunk_count": len(chunks),
-        "content": FOOTBALL_HISTORY_DOCUMENT
-    }
-    
-    logger.info(f"Football history document loaded: {len(chunks)} chunks")
-    
-    # === RAG ARCHITECTURE DOCUMENT ===
-    rag_doc_id = "sample_doc_001"
-    text2 = SAMPLE_DOCUMENT.strip()
-    sentences2 = text2.replace('\n', ' ').split('. ')
-    chunks2 = []
-    current_chunk2 = []
-    current_size2 = 0
-    
-    for sentence in sentences2:
-        sentence = sentence.strip() + '.'
-        if current_size2 + len(sentence) > chunk_size and current_chunk2:
-            chunks2.append(' '.join(current_chunk2))
-            current_chunk2 = [sentence]
-            current_size2 = len(sentence)
-        else:
-            current_chunk2.append(sentence)
-            current_size2 += len(sentence)
-    if current_chunk2:
-        chunks2.append(' '.join(current_chunk2))
-    
-    for i, chunk_text in enumerate(chunks2):
-        document_chunks.append({
-            "chunk_id": f"{rag_doc_id}_chunk_{i}",
-            "doc_id": rag_doc_id,
-            "filename": "RAG_System_Architecture.txt",
-            "content": chunk_text,
-            "index": i
-        })
+    samples = [
+        ("football_history_001", "History_of_Football.txt", FOOTBALL_HISTORY_DOCUMENT),
+        ("sample_doc_001", "RAG_System_Architecture.txt", SAMPLE_DOCUMENT),
+    ]
     
-    uploaded_documents[rag_doc_id] = {
-        "id": rag_doc_id,
-        "filename": "RAG_System_Architecture.txt",
-        "size": len(SAMPLE_DOCUMENT),
-        "uploaded_at": datetime.now().isoformat(),
-        "status": "ready",
-        "chunk_count": len(chunks2),
-        "content": SAMPLE_DOCUMENT
-    }
+    for doc_id, filename, text in samples:
+        chunks = index_document_text(doc_id, filename, text.strip())
+        uploaded_documents.put(doc_id, {
+            "id": doc_id,
+            "filename": filename,
+            "size": len(text),
+            "text_length": len(text.strip()),
+            "uploaded_at": datetime.now().isoformat(),
+            "status": "ready",
+            "chunk_count": len(chunks)
+        }, persist=False)
+        logger.info(f"Sample document {filename} loaded: {len(chunks)} chunks")
     
-    logger.info(f"RAG architecture document loaded: {len(chunks2)} chunks")
-    logger.info(f"Total documents: {len(uploaded_documents)}, Total chunks: {len(document_chunks)}")
+    logger.info(f"Sample documents loaded, total chunks: {len(document_chunks)}")
 
 
-def load_document_metadata():
-    if os.path.exists(METADATA_FILE):
-        try:
-            with open(METADATA_FILE, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.warning(f"Failed to load metadata: {e}")
-    return {}
+def index_document_text(doc_id: str, filename: str, text: str, char_spans: Optional[List[tuple]] = None) -> List[dict]:
+    return index_chunks(doc_id, filename, store_document_text(doc_id, text, char_spans))
 
 
-def save_document_metadata(docs):
-    try:
-        os.makedirs(os.path.dirname(METADATA_FILE), exist_ok=True)
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(docs, f, indent=2)
-    except Exception as e:
-        logger.error(f"Failed to save metadata: {e}")
+def store_document_text(doc_id: str, text: str, char_spans: Optional[List[tuple]] = None) -> List[tuple]:
+    # Text is written once to the content store; chunks only keep (doc_id, start, end) byte spans
+    content_store.put(doc_id, text)
+    if char_spans is None:
+        char_spans = list(chunker.iter_spans(text))
+    byte_spans = ContentStore.to_byte_spans(text, char_spans)
+    return [(start, end, text[char_start:char_end]) for (start, end), (char_start, char_end) in zip(byte_spans, char_spans)]
 
 
-# Load existing metadata on startup, THEN load sample documents
-uploaded_documents = load_document_metadata()
-load_sample_documents()  # Add sample documents after loading metadata
+def index_chunks(doc_id: str, filename: str, chunks: List[tuple], first_index: int = 0) -> List[dict]:
+    # chunks are (byte start, byte end, text); indexes continue from first_index for streamed documents
+    records = [
+        {
+            "chunk_id": f"{doc_id}_chunk_{i}",
+            "doc_id": doc_id,
+            "filename": filename,
+            "start": start,
+            "end": end,
+            "index": i
+        }
+        for i, (start, end, _) in enumerate(chunks, first_index)
+    ]
+    add_document_chunks(records, [text for _, _, text in chunks])
+    return records
+
+
+def add_document_chunks(chunks: List[dict], texts: List[str]):
+    new_chunks = [(chunk, text) for chunk, text in zip(chunks, texts) if chunk["chunk_id"] not in bm25_index]
+    document_chunks.extend(chunk for chunk, _ in new_chunks)
+    bm25_index.add_many((chunk["chunk_id"], text, chunk) for chunk, text in new_chunks)
+    # Cached answers may no longer reflect the corpus
+    query_cache.invalidate()
+
+
+def remove_document(doc_id: str):
+    # Drops a superseded document from every index before its new version is added
+    chunk_ids = [chunk["chunk_id"] for chunk in document_chunks if chunk["doc_id"] == doc_id]
+    bm25_index.remove(chunk_ids)
+    # chunk_embeddings covers a prefix of document_chunks; removing from both keeps them aligned
+    with chunk_embeddings_lock:
+        document_chunks[:] = [chunk for chunk in document_chunks if chunk["doc_id"] != doc_id]
+        chunk_embeddings.delete(chunk_ids)
+    content_store.delete(doc_id)
+    uploaded_documents.delete(doc_id)
+    
+    # Vector entries shared with other documents stay until their last chunk is gone
+    orphaned = chunk_dedup.release(doc_id)
+    vector_store_instance = get_vector_store()
+    if vector_store_instance != "fallback":
+        if orphaned is None:
+            vector_store_instance.delete_document(doc_id)
+        elif orphaned:
+            vector_store_instance.delete(orphaned)
+    query_cache.invalidate()
+
+
+def resume_duplicate(doc_id: str) -> bool:
+    # An identical upload is answered by the existing document only while that document is still
+    # being ingested or is searchable. A completed one that is missing from the in-memory indexes
+    # (after a restart) is restored from its stored text and chunk spans.
+    if ingestion_pipeline.is_running(doc_id):
+        return True
+    doc = uploaded_documents.get(doc_id) or {}
+    if doc.get("status") != "completed":
+        return False
+    if not doc.get("chunk_count") or f"{doc_id}_chunk_0" in bm25_index:
+        return True
+    return restore_document_chunks(doc_id, doc.get("filename"))
+
+
+def restore_document_chunks(doc_id: str, filename: str) -> bool:
+    spans = chunk_dedup.spans(doc_id)
+    if not spans or doc_id not in content_store:
+        return False
+    index_chunks(doc_id, filename, [(start, end, content_store.read(doc_id, start, end)) for start, end in spans])
+    logger.info(f"Restored {len(spans)} chunks of {doc_id} from the content store")
+    return True
+
+
+def get_chunk_text(chunk: dict) -> str:
+    return content_store.read(chunk["doc_id"], chunk["start"], chunk["end"])
+
+
+async def load_sample_documents_when_ready():
+    # Started from the app lifespan rather than at import, so importing the module never loads the
+    # tokenizer; it loads off the event loop and the samples are chunked once it is ready
+    await asyncio.to_thread(chunker.warm_up)
+    load_sample_documents()
 
 
 def get_embedding_service():
     global embedding_service
     if embedding_service is None:
         try:
-            from sentence_transformers import SentenceTransformer
-            embedding_service = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("[OK] Sentence-transformers initialized (384-dim)")
+            from src.embeddings.model_registry import get_model_registry
+            embedding_service = get_model_registry().acquire("sentence-transformer", settings.embedding_model)
+            logger.info(f"[OK] Sentence-transformers initialized ({settings.embedding_model})")
         except Exception as e:
             logger.warning(f"Sentence-transformers failed: {e}")
             embedding_service = "fallback"
@@ -246,8 +296,27 @@ def get_vector_store():
     global vector_store
     if vector_store is None:
         try:
-            from src.embeddings.vector_store_new import VectorStore
-            vector_store = VectorStore(db_type="chroma", collection_name="rag_docs")
+            from src.embeddings.vector_store import VectorStore
+            # Both backends' settings are passed, so falling back to IVF (no hnswlib) keeps its configuration
+            ann_params = {
+                "nprobe": settings.ann_nprobe,
+                "quantizer": settings.ann_quantizer,
+                "pq_subspaces": settings.ann_pq_subspaces,
+                "rescore_factor": settings.ann_rescore_factor,
+                "ef": settings.ann_ef_search
+            }
+            vector_store = VectorStore(
+                db_type=settings.vector_db_type,
+                collection_name="rag_docs",
+                persist_dir=settings.chroma_persist_dir,
+                pinecone_api_key=settings.pinecone_api_key,
+                pinecone_index_name=settings.pinecone_index_name,
+                ann_backend=settings.ann_backend,
+                ann_persist_dir=settings.ann_persist_dir,
+                # Chunk text is read back from the content store by span rather than kept twice
+                store_texts=False,
+                **ann_params
+            )
             logger.info("[OK] Vector store initialized")
         except Exception as e:
             logger.warning(f"Vector store failed: {e}")
@@ -260,7 +329,12 @@ def get_hybrid_retriever():
     if hybrid_retriever is None:
         try:
             from src.rag.hybrid_retriever import HybridRetriever
-            hybrid_retriever = HybridRetriever(alpha=0.7)
+            hybrid_retriever = HybridRetriever(
+                alpha=0.7,
+                bm25_index=bm25_index,
+                chunk_text=get_chunk_text,
+                fusion_method=settings.hybrid_fusion_method
+            )
             logger.info("[OK] Hybrid retriever initialized")
         except Exception as e:
             logger.warning(f"Hybrid retriever failed: {e}")
@@ -268,37 +342,68 @@ def get_hybrid_retriever():
     return hybrid_retriever
 
 
-def get_llm_client():
-    global llm_client
-    if llm_client is None:
-        # Try Ollama first (local, free, no API key needed)
+def get_reranker():
+    global reranker
+    if reranker is None:
         try:
-            import ollama
-            # Test connection to Ollama
-            ollama.list()
-            llm_client = ("ollama", ollama)
-            logger.info("[OK] Ollama local LLM initialized")
-            return llm_client
-        except Exception as e:
-            logger.info(f"[INFO] Ollama not available: {e}")
-        
-        # Try OpenAI if Ollama not available
-        try:
-            from openai import OpenAI
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key:
-                llm_client = ("openai", OpenAI(api_key=api_key))
-                logger.info("[OK] OpenAI GPT client initialized")
-                return llm_client
+            from src.rag.reranker import DocumentReranker
+            cache_manager.configure("rerank", max_entries=settings.rerank_cache_max_entries)
+            reranker = DocumentReranker(
+                model_name=settings.rerank_model,
+                batch_size=settings.rerank_batch_size,
+                max_length=settings.rerank_max_length,
+                score_cache=cache_manager,
+                latency_budget_ms=settings.rerank_latency_budget_ms,
+                probe_every=settings.rerank_probe_every
+            )
+            logger.info("[OK] Reranker initialized")
         except Exception as e:
-            logger.warning(f"OpenAI failed: {e}")
-        
-        # Fallback mode
-        logger.info("[INFO] No LLM available - using document excerpts mode")
-        llm_client = "fallback"
+            logger.warning(f"Reranker failed: {e}")
+            reranker = "fallback"
+    return reranker
+
+
+async def get_llm_client():
+    global llm_client
+    if llm_client is None:
+        async with llm_client_lock:
+            if llm_client is None:
+                client = await create_llm_client(
+                    api_key=settings.llm_api_key,
+                    api_base=settings.llm_api_base,
+                    timeout_seconds=settings.llm_timeout_seconds
+                )
+                if client is None:
+                    # Fallback mode
+                    logger.info("[INFO] No LLM available - using document excerpts mode")
+                llm_client = client or "fallback"
     return llm_client
 
 
+async def close_llm_client():
+    global llm_client
+    if llm_client not in (None, "fallback"):
+        await llm_client.aclose()
+    llm_client = None
+
+
+async def cancel_on_disconnect(http_request: Request, awaitable, poll_seconds: float = 0.5):
+    # Abandons this request's wait once the HTTP client has gone away; shared work is
+    # cancelled (closing its upstream connection) only when no other request still waits on it
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling generation")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @router.post("/documents/upload")
 async def upload_document(
     file: UploadFile = File(...),
@@ -321,63 +426,55 @@ async def upload_document(
         content = await file.read()
         logger.info(f"File read: {len(content)} bytes")
         
-        # === EXTRACT TEXT (FAST - 1-2 seconds max) ===
-        text_content, total_pages, extraction_error = extract_text_sync(content, file_ext)
-        
-        if extraction_error:
-            raise HTTPException(status_code=400, detail=f"Failed to extract text: {extraction_error}")
-        
-        logger.info(f"Text extracted: {len(text_content)} chars from {total_pages} pages")
+        # Re-uploading identical bytes returns the document already ingested from them
+        content_hash = await asyncio.to_thread(hash_content, content)
+        duplicate_id = uploaded_documents.find("content_hash", content_hash)
+        if duplicate_id is not None and not await asyncio.to_thread(resume_duplicate, duplicate_id):
+            # Failed, or left half-ingested by a worker that is gone: ingest the upload afresh
+            await asyncio.to_thread(remove_document, duplicate_id)
+        elif duplicate_id is not None:
+            duplicate = uploaded_documents[duplicate_id]
+            logger.info(f"Upload {file.filename} is identical to {duplicate_id}, skipping ingestion")
+            return {
+                "status": duplicate.get("status"),
+                "doc_id": duplicate_id,
+                "job_id": duplicate_id,
+                "filename": duplicate.get("filename"),
+                "duplicate": True,
+                "message": f"Identical document already ingested. Track progress at /documents/{duplicate_id}/status",
+                "file_size": len(content)
+            }
         
-        # Generate document ID
+        # Generate document ID; it doubles as the ingestion job ID
         doc_id = f"doc_{len(uploaded_documents) + 1}_{int(time.time())}"
         file_path = os.path.join(UPLOAD_DIR, f"{doc_id}_{file.filename}")
         
-        # Save file to disk
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-        with open(file_path, 'wb') as f:
-            f.write(content)
-        
-        # === CREATE CHUNKS FOR KEYWORD SEARCH (FAST - no embedding) ===
-        chunks = create_smart_chunks(text_content, chunk_size=512, overlap=50)
-        
-        # Store chunks in memory for keyword search
-        for i, chunk_text in enumerate(chunks):
-            document_chunks.append({
-                "chunk_id": f"{doc_id}_chunk_{i}",
-                "doc_id": doc_id,
-                "filename": file.filename,
-                "content": chunk_text,
-                "index": i
-            })
-        
-        # Store document metadata - READY immediately
-        uploaded_documents[doc_id] = {
+        uploaded_documents.put(doc_id, {
             "id": doc_id,
             "filename": file.filename,
             "file_path": file_path,
             "size": len(content),
+            "content_hash": content_hash,
             "uploaded_at": datetime.now().isoformat(),
-            "status": "ready",  # Ready for keyword search immediately!
-            "chunk_count": len(chunks),
-            "content": text_content,
+            "status": "processing",
+            "stage": "saving",
+            "stages": IngestionPipeline.initial_stages(),
+            "chunk_count": 0,
             "error": None
-        }
-        save_document_metadata(uploaded_documents)
+        })
         
-        logger.info(f"Document {doc_id} ready for search: {len(chunks)} chunks")
+        # Saving, extraction, indexing and embedding all run after the response is sent
+        job_id = ingestion_pipeline.start(
+            doc_id, process_document_background(doc_id, file_path, file.filename, content, file_ext)
+        )
         
-        # === RETURN SUCCESS - SEARCHABLE NOW ===
         return {
-            "status": "ready",
+            "status": "processing",
             "doc_id": doc_id,
+            "job_id": job_id,
             "filename": file.filename,
-            "message": f"Document ready! You can search it now.",
-            "file_size": len(content),
-            "pages": total_pages,
-            "chunks": len(chunks),
-            "text_length": len(text_content),
-            "preview": text_content[:300] + "..." if len(text_content) > 300 else text_content
+            "message": f"Document accepted. Track progress at /documents/{doc_id}/status",
+            "file_size": len(content)
         }
         
     except HTTPException:
@@ -387,159 +484,315 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-def extract_text_sync(content: bytes, file_ext: str) -> tuple:
-    try:
-        if file_ext == '.pdf':
-            import PyPDF2
-            import io
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-            text_content = "\n\n".join([page.extract_text() for page in pdf_reader.pages])
-            total_pages = len(pdf_reader.pages)
-            logger.info(f"PDF: {total_pages} pages extracted")
-            
-        elif file_ext in ['.docx', '.doc']:
-            import docx
-            import io
-            doc = docx.Document(io.BytesIO(content))
-            text_content = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
-            total_pages = len(doc.paragraphs)
-            logger.info(f"DOCX: {total_pages} paragraphs extracted")
-            
-        elif file_ext in ['.txt', '.md']:
-            text_content = content.decode('utf-8')
-            total_pages = 1
-            logger.info(f"Text: {len(text_content)} chars")
-        else:
-            text_content = content.decode('utf-8', errors='ignore')
-            total_pages = 1
-            
-        return text_content, total_pages, None
-    except Exception as e:
-        logger.error(f"Text extraction error: {e}")
-        return None, 0, str(e)
+def write_file(file_path: str, content: bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(content)
 
 
 async def process_document_background(doc_id: str, file_path: str, filename: str, content: bytes, file_ext: str):
-    try:
-        logger.info(f"Starting background embedding for {doc_id}")
-        
-        # === RETRIEVE EXTRACTED TEXT ===
-        text_content = uploaded_documents[doc_id].get("content")
-        if not text_content:
-            logger.error(f"No extracted text found for {doc_id}")
-            uploaded_documents[doc_id]["status"] = "error"
-            uploaded_documents[doc_id]["error"] = "Text content missing"
-            save_document_metadata(uploaded_documents)
-            return
-        
-        # === CHUNKING ===
-        chunks = create_smart_chunks(text_content, chunk_size=512, overlap=50)
-        total_chunks = len(chunks)
-        logger.info(f"Created {total_chunks} chunks for embedding")
-        
-        # === EMBEDDING & INCREMENTAL INDEXING ===
-        embedder = get_embedding_service()
-        vector_store_instance = get_vector_store()
+    logger.info(f"Starting ingestion for {doc_id}")
+    
+    # === SAVE FILE (worker thread) ===
+    async with ingestion_pipeline.stage(doc_id, "saving"):
+        await asyncio.to_thread(write_file, file_path, content)
+    
+    if file_ext == '.pdf':
+        # === STREAM PAGES: PARSE IN WORKER PROCESSES, CHUNK AND EMBED AS THEY ARRIVE ===
+        await index_and_embed_stream(doc_id, filename, stream_pdf_chunks(doc_id, file_path))
+        return
+    
+    # === EXTRACT TEXT AND CHUNK (worker process, off the event loop) ===
+    async with ingestion_pipeline.stage(doc_id, "extracting"):
+        text_content, total_pages, char_spans = await ingestion_pipeline.run_in_process(
+            extract_and_chunk, file_path, file_ext, chunker.chunk_size, chunker.chunk_overlap, chunker.tokenizer_name
+        )
+        logger.info(f"Text extracted: {len(text_content)} chars from {total_pages} pages")
+    
+    await index_and_embed_document(doc_id, filename, text_content, total_pages, char_spans)
+
+
+async def stream_pdf_chunks(doc_id: str, file_path: str) -> AsyncIterator[List[tuple]]:
+    streaming_chunker = StreamingChunker(chunker)
+    text_length = 0
+    async with ingestion_pipeline.stage(doc_id, "extracting") as report_progress:
+        async for start, end, total_pages, pages in ingestion_pipeline.stream_pdf_pages(file_path):
+            piece = "\n\n".join(pages)
+            if start:
+                piece = "\n\n" + piece
+            # Written as it arrives, so chunks from these pages are readable while later pages parse
+            await asyncio.to_thread(content_store.append, doc_id, piece)
+            text_length += len(piece)
+            uploaded_documents.update(doc_id, pages=total_pages, text_length=text_length)
+            report_progress(end / total_pages * 100)
+            
+            chunks = await asyncio.to_thread(streaming_chunker.feed, piece)
+            if chunks:
+                yield chunks
         
-        indexed_count = 0
-        batch_size = 10  # Index in batches for better performance
+        logger.info(f"Text extracted: {text_length} chars")
+    chunks = streaming_chunker.finish()
+    if chunks:
+        yield chunks
+
+
+async def index_and_embed_document(doc_id: str, filename: str, text_content: str, total_pages: Optional[int],
+                                   char_spans: Optional[List[tuple]], persist: bool = True) -> int:
+    uploaded_documents.update(doc_id, pages=total_pages, text_length=len(text_content))
+    
+    async def single_batch():
+        yield await asyncio.to_thread(store_document_text, doc_id, text_content, char_spans)
+    
+    return await index_and_embed_stream(doc_id, filename, single_batch(), persist)
+
+
+async def index_and_embed_stream(doc_id: str, filename: str, batches: AsyncIterator[List[tuple]],
+                                 persist: bool = True) -> int:
+    # Batches of (byte start, byte end, text) chunks, in document order. Indexing feeds a short
+    # queue that embedding drains, so the two overlap and only a few batches are held at once.
+    
+    # First use loads the model and opens the store; keep that off the event loop too
+    embedder = await asyncio.to_thread(get_embedding_service)
+    vector_store_instance = await asyncio.to_thread(get_vector_store)
+    embedding = embedder != "fallback" and vector_store_instance != "fallback"
+    queue = asyncio.Queue(maxsize=2)
+    counts = {"chunks": 0, "indexed": 0, "reused": 0, "written": 0}
+    
+    # === STORE TEXT AND INDEX CHUNKS FOR KEYWORD SEARCH ===
+    async def index_batches():
+        async with ingestion_pipeline.stage(doc_id, "indexing"):
+            async for chunks in batches:
+                records = await asyncio.to_thread(index_chunks, doc_id, filename, chunks, counts["chunks"])
+                counts["chunks"] += len(records)
+                uploaded_documents.update(doc_id, chunk_count=counts["chunks"], total_chunks=counts["chunks"])
+                if embedding:
+                    await queue.put((records, [text for _, _, text in chunks]))
+        await queue.put(None)
         
-        for batch_start in range(0, total_chunks, batch_size):
-            batch_end = min(batch_start + batch_size, total_chunks)
-            batch_chunks = chunks[batch_start:batch_end]
-            
-            chunk_ids = []
-            chunk_embeddings = []
-            chunk_metadata = []
-            chunk_texts = []
-            
-            for i, chunk_text in enumerate(batch_chunks, start=batch_start):
-                chunk_id = f"{doc_id}_chunk_{i}"
-                
-                # Store in memory for keyword search
-                document_chunks.append({
-                    "chunk_id": chunk_id,
-                    "doc_id": doc_id,
-                    "filename": filename,
-                    "content": chunk_text,
-                    "index": i
-                })
-                
-                # Prepare for vector store
-                if embedder != "fallback":
-                    try:
-                        embedding = embedder.encode(chunk_text, convert_to_numpy=True).tolist()
-                        chunk_ids.append(chunk_id)
-                        chunk_embeddings.append(embedding)
-                        chunk_metadata.append({
-                            "filename": filename,
-                            "doc_id": doc_id,
-                            "chunk_index": i
-                        })
-                        chunk_texts.append(chunk_text)
-                    except Exception as e:
-                        logger.error(f"Embedding error for chunk {i}: {e}")
-            
-            # === INCREMENTAL VECTOR STORE INSERTION ===
-            if vector_store_instance != "fallback" and chunk_embeddings:
-                try:
-                    vector_store_instance.add_documents(
-                        ids=chunk_ids,
-                        embeddings=chunk_embeddings,
-                        metadata=chunk_metadata,
-                        texts=chunk_texts
+        uploaded_documents.update(doc_id, status="ready")
+        logger.info(f"Document {doc_id} ready for keyword search: {counts['chunks']} chunks")
+    
+    # === EMBEDDING & INCREMENTAL INDEXING ===
+    async def embed_batches():
+        hashes, vector_ids, spans, new_ids, written = [], [], [], set(), set()
+        # Each batch is encoded in one call; the next batch encodes while this one is written
+        stage = BatchEmbeddingStage(embedder, batch_size=settings.embedding_batch_size)
+        try:
+            async with ingestion_pipeline.stage(doc_id, "embedding") as report_progress:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    records, chunks = item
+                    
+                    # Chunks whose text already has a vector entry share it; only new texts are embedded
+                    batch_hashes, batch_ids, new_positions = await asyncio.to_thread(
+                        chunk_dedup.assign, [record["chunk_id"] for record in records], chunks
                     )
-                    indexed_count += len(chunk_embeddings)
-                    progress = (batch_end / total_chunks) * 100
-                    logger.info(f"Embedded batch {batch_start}-{batch_end}/{total_chunks} ({progress:.1f}%)")
+                    hashes += batch_hashes
+                    vector_ids += batch_ids
+                    spans += [(record["start"], record["end"]) for record in records]
+                    new_ids.update(batch_ids[i] for i in new_positions)
+                    counts["reused"] += len(records) - len(new_positions)
+                    counts["indexed"] += len(records) - len(new_positions)
                     
-                    # Update progress in metadata
-                    uploaded_documents[doc_id]["indexed_chunks"] = indexed_count
-                    uploaded_documents[doc_id]["total_chunks"] = total_chunks
-                    save_document_metadata(uploaded_documents)
+                    async for batch_start, batch_end, embeddings in stage.run([chunks[i] for i in new_positions]):
+                        positions = new_positions[batch_start:batch_end]
+                        # === INCREMENTAL VECTOR STORE INSERTION ===
+                        try:
+                            await asyncio.to_thread(
+                                vector_store_instance.upsert,
+                                ids=[batch_ids[i] for i in positions],
+                                embeddings=embeddings,
+                                metadata=[
+                                    {
+                                        "filename": filename, "doc_id": doc_id, "chunk_index": records[i]["index"],
+                                        "start": records[i]["start"], "end": records[i]["end"]
+                                    }
+                                    for i in positions
+                                ],
+                                texts=[chunks[i] for i in positions]
+                            )
+                            written.update(batch_ids[i] for i in positions)
+                            counts["indexed"] += len(positions)
+                            logger.info(f"Embedded {counts['indexed']}/{counts['chunks']} chunks")
+                        except Exception as e:
+                            logger.warning(f"Vector store batch insertion failed: {e}")
                     
-                except Exception as e:
-                    logger.warning(f"Vector store batch insertion failed: {e}")
-        
-        # Update document status to complete
-        uploaded_documents[doc_id]["status"] = "completed"
-        uploaded_documents[doc_id]["chunk_count"] = total_chunks
-        uploaded_documents[doc_id]["indexed_chunks"] = indexed_count
-        save_document_metadata(uploaded_documents)
-        
-        logger.info(f"Background embedding complete for {doc_id}: {indexed_count}/{total_chunks} chunks embedded")
-        
+                    # Update progress in metadata
+                    uploaded_documents.update(doc_id, indexed_chunks=counts["indexed"])
+                    report_progress(counts["indexed"] / max(counts["chunks"], 1) * 100)
+        finally:
+            counts["written"] = len(written)
+            # Only entries that were actually written can be shared with later documents
+            await asyncio.to_thread(
+                chunk_dedup.commit, doc_id, hashes,
+                [None if vector_id in new_ids and vector_id not in written else vector_id for vector_id in vector_ids],
+                spans
+            )
+    
+    if embedding:
+        tasks = [asyncio.ensure_future(index_batches()), asyncio.ensure_future(embed_batches())]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # One side failed: stop the other rather than leave it waiting on the queue
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    else:
+        await index_batches()
+        ingestion_pipeline.skip_stage(doc_id, "embedding")
+    
+    if counts["written"] and persist:
+        await persist_vector_store()
+    
+    # Update document status to complete
+    uploaded_documents.update(
+        doc_id, status="completed", indexed_chunks=counts["indexed"], reused_chunks=counts["reused"]
+    )
+    logger.info(
+        f"Ingestion complete for {doc_id}: {counts['indexed']}/{counts['chunks']} chunks indexed, "
+        f"{counts['reused']} reused existing embeddings"
+    )
+    return counts["indexed"]
+
+
+async def persist_vector_store():
+    vector_store_instance = await asyncio.to_thread(get_vector_store)
+    if vector_store_instance == "fallback":
+        return
+    try:
+        await asyncio.to_thread(vector_store_instance.persist)
     except Exception as e:
-        logger.error(f"Background embedding error for {doc_id}: {str(e)}", exc_info=True)
-        uploaded_documents[doc_id]["status"] = "error"
-        uploaded_documents[doc_id]["error"] = str(e)
-        save_document_metadata(uploaded_documents)
+        logger.warning(f"Vector store persist failed: {e}")
+
+
+def resolve_ingest_directory(directory: str) -> str:
+    # Only directories under the configured ingest root can be read through the API
+    root = os.path.realpath(settings.ingest_root)
+    path = os.path.realpath(os.path.join(root, directory))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=400, detail=f"Directory must be inside {settings.ingest_root}")
+    if not os.path.isdir(path):
+        raise HTTPException(status_code=404, detail=f"Directory not found: {directory}")
+    return path
+
+
+@router.post("/documents/ingest-directory")
+async def ingest_directory(request: DirectoryIngestRequest):
+    path = resolve_ingest_directory(request.directory)
+    job_id = f"dir_{int(time.time() * 1000)}"
+    directory_jobs[job_id] = {
+        "job_id": job_id,
+        "directory": path,
+        "status": "processing",
+        "started_at": datetime.now().isoformat(),
+        "files": 0, "unchanged": 0, "loaded": 0, "failed": 0, "unreadable_dirs": 0,
+        "indexed_documents": 0, "removed_documents": 0,
+        "error": None
+    }
+    ingestion_pipeline.start(job_id, ingest_directory_background(job_id, path, request.recursive))
+    return {
+        "status": "processing",
+        "job_id": job_id,
+        "directory": path,
+        "message": f"Directory ingestion started. Track progress at /documents/ingest-directory/{job_id}"
+    }
 
 
-def create_smart_chunks(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
-    sentences = text.replace('\n', ' ').split('. ')
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + '.'
-        sentence_size = len(sentence)
-        
-        if current_size + sentence_size > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            # Keep last few sentences for overlap
-            overlap_sentences = current_chunk[-2:] if len(current_chunk) > 2 else current_chunk
-            current_chunk = overlap_sentences + [sentence]
-            current_size = sum(len(s) for s in current_chunk)
-        else:
-            current_chunk.append(sentence)
-            current_size += sentence_size
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+@router.get("/documents/ingest-directory/{job_id}")
+async def get_directory_job(job_id: str):
+    if job_id not in directory_jobs:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return {**directory_jobs[job_id], "running": ingestion_pipeline.is_running(job_id)}
+
+
+async def ingest_directory_background(job_id: str, directory: str, recursive: bool):
+    job = directory_jobs[job_id]
+    loader = DocumentLoader(max_file_size_mb=settings.max_file_size_mb)
+    # Workers parse and chunk; this loop indexes one document at a time while they run ahead
+    documents = loader.iter_documents(
+        directory, recursive, manifest=ingest_manifest, max_workers=settings.ingestion_workers,
+        chunk_params=(chunker.chunk_size, chunker.chunk_overlap, chunker.tokenizer_name), stream_pdfs=True
+    )
+    try:
+        while True:
+            document = await asyncio.to_thread(next, documents, None)
+            job.update(loader.stats)
+            if document is None:
+                break
+            await ingest_loaded_document(document)
+            job["indexed_documents"] += 1
+        await remove_deleted_sources(job, loader, directory, recursive)
+        job["status"] = "completed"
+    except Exception as e:
+        job.update(status="error", error=str(e))
+        raise
+    finally:
+        try:
+            # Shuts the worker pool down; still busy only if a cancelled next() is mid-flight
+            await asyncio.to_thread(documents.close)
+        except ValueError:
+            pass
+        job["finished_at"] = datetime.now().isoformat()
+        # One snapshot for the whole directory rather than one per file
+        if job["indexed_documents"] or job["removed_documents"]:
+            await persist_vector_store()
+
+
+async def remove_deleted_sources(job: dict, loader: DocumentLoader, directory: str, recursive: bool):
+    # Files deleted from the source tree since they were ingested leave the indexes and the manifest.
+    # A walk that could not read some directory saw only part of the tree, so nothing is pruned then.
+    if loader.stats["unreadable_dirs"]:
+        logger.warning(f"Not pruning {directory}: {loader.stats['unreadable_dirs']} directories were unreadable")
+        return
+    for path in await asyncio.to_thread(ingest_manifest.missing, directory, loader.seen_paths, recursive):
+        record = ingest_manifest.get(path)
+        await asyncio.to_thread(remove_document, record["doc_id"])
+        ingest_manifest.forget(path)
+        job["removed_documents"] += 1
+    if job["removed_documents"]:
+        logger.info(f"Removed {job['removed_documents']} documents whose source files were deleted from {directory}")
+
+
+async def ingest_loaded_document(document: Document):
+    previous = ingest_manifest.get(document.source)
+    if previous and previous["doc_id"] != document.doc_id:
+        await asyncio.to_thread(remove_document, previous["doc_id"])
     
-    return chunks if chunks else [text]
+    stages = IngestionPipeline.initial_stages()
+    stages["saving"] = {"status": "skipped", "progress": 100}
+    if not document.streamed:
+        stages["extracting"] = {"status": "done", "progress": 100}
+    uploaded_documents.put(document.doc_id, {
+        "id": document.doc_id,
+        "filename": document.metadata["file_name"],
+        "file_path": document.source,
+        "size": document.metadata["file_size_bytes"],
+        "content_hash": document.content_hash,
+        "uploaded_at": datetime.now().isoformat(),
+        "status": "processing",
+        "stage": "extracting" if document.streamed else "indexing",
+        "stages": stages,
+        "chunk_count": 0,
+        "error": None
+    })
+    if document.streamed:
+        # PDF pages parse in worker processes and are chunked and embedded as they arrive, as for uploads.
+        # Pieces are appended, so text left by an interrupted earlier run is dropped first.
+        await asyncio.to_thread(content_store.delete, document.doc_id)
+        await index_and_embed_stream(
+            document.doc_id, document.metadata["file_name"], stream_pdf_chunks(document.doc_id, document.source),
+            persist=False
+        )
+    else:
+        await index_and_embed_document(
+            document.doc_id, document.metadata["file_name"], document.content, None, document.spans, persist=False
+        )
+    # Recorded last: a file whose indexing failed is retried on the next run
+    ingest_manifest.record(document)
 
 
 @router.get("/documents/{doc_id}/status")
@@ -548,22 +801,23 @@ async def get_document_status(doc_id: str):
         raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
     
     doc = uploaded_documents[doc_id]
+    stages = doc.get("stages")
     
-    # Calculate progress percentage
-    progress = 0
-    if doc.get("status") in ["processing", "embedding"]:
-        total = doc.get("total_chunks", 0)
-        indexed = doc.get("indexed_chunks", 0)
-        if total > 0:
-            progress = (indexed / total) * 100
-    elif doc.get("status") == "completed":
-        progress = 100
+    # Overall progress averages the pipeline stages; documents without stage records are all-or-nothing
+    if stages:
+        progress = IngestionPipeline.overall_progress(stages)
+    else:
+        progress = 100 if doc.get("status") in ["ready", "completed"] else 0
     
     return {
         "doc_id": doc_id,
+        "job_id": doc_id,
         "filename": doc.get("filename"),
         "status": doc.get("status"),
+        "stage": doc.get("stage"),
+        "stages": stages or {},
         "progress": progress,
+        "running": ingestion_pipeline.is_running(doc_id),
         "indexed_chunks": doc.get("indexed_chunks", 0),
         "total_chunks": doc.get("total_chunks", 0),
         "chunk_count": doc.get("chunk_count", 0),
@@ -578,20 +832,21 @@ async def get_document_content(doc_id: str, limit: int = None):
         raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
     
     doc = uploaded_documents[doc_id]
-    content = doc.get("content", "")
     
-    if not content:
+    if doc_id not in content_store:
         raise HTTPException(status_code=404, detail="Content not yet extracted")
     
-    # Return full content or limited by parameter
+    # Return full content or limited by parameter; a limited read maps at most 4 bytes per character
     if limit:
-        content = content[:limit]
+        content = content_store.read(doc_id, 0, limit * 4)[:limit]
+    else:
+        content = content_store.read(doc_id)
     
     return {
         "doc_id": doc_id,
         "filename": doc.get("filename"),
         "content": content,
-        "total_length": len(doc.get("content", "")),
+        "total_length": doc.get("text_length", content_store.length(doc_id)),
         "status": doc.get("status")
     }
 
@@ -605,37 +860,22 @@ async def list_documents(skip: int = 0, limit: int = 10):
     }
 
 
-def create_smart_chunks(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
-    sentences = text.replace('\n', ' ').split('. ')
-    chunks = []
-    current_chunk = []
-    current_size = 0
-    
-    for sentence in sentences:
-        sentence = sentence.strip() + '.'
-        sentence_size = len(sentence)
-        
-        if current_size + sentence_size > chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            # Keep last few sentences for overlap
-            overlap_sentences = current_chunk[-2:] if len(current_chunk) > 2 else current_chunk
-            current_chunk = overlap_sentences + [sentence]
-            current_size = sum(len(s) for s in current_chunk)
-        else:
-            current_chunk.append(sentence)
-            current_size += sentence_size
-    
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
-    
-    return chunks if chunks else [text]
+NO_DOCUMENTS_MESSAGE = "📄 No documents uploaded yet. Upload a PDF/document to ask questions!"
+NO_RESULTS_MESSAGE = "❌ No relevant information found. Try:\n• Rephrasing your question\n• Uploading documents with this information\n• Being more specific"
 
 
 @router.post("/query", response_model=QueryResponse)
 async def query_documents(
     request: QueryRequest,
+    http_request: Request,
     x_api_key: Optional[str] = Header(None)
 ):
+    # Identical requests already in flight share one retrieval and generation
+    flight_key = (QueryResultCache.normalize(request.query),) + get_cache_params(request)
+    return await cancel_on_disconnect(http_request, query_flights.do(flight_key, lambda: answer_query(request)))
+
+
+async def answer_query(request: QueryRequest) -> QueryResponse:
     start_time = time.time()
     
     try:
@@ -644,7 +884,7 @@ async def query_documents(
         # Check documents
         if not document_chunks:
             return QueryResponse(
-                response="📄 No documents uploaded yet. Upload a PDF/document to ask questions!",
+                response=NO_DOCUMENTS_MESSAGE,
                 citations=[],
                 confidence_score=0.0,
                 retrieved_count=0,
@@ -652,180 +892,426 @@ async def query_documents(
                 processing_time_ms=(time.time() - start_time) * 1000
             )
         
-        # Get services
-        embedder = get_embedding_service()
-        vector_store_instance = get_vector_store()
-        hybrid_retriever_instance = get_hybrid_retriever()
+        # === RESPONSE CACHE (exact match) ===
+        cache_params = get_cache_params(request)
+        cache_generation = query_cache.generation
+        cached = query_cache.get(query, cache_params)
+        if cached is not None:
+            return cached.model_copy(update={"processing_time_ms": (time.time() - start_time) * 1000})
         
-        # === SEMANTIC SEARCH ===
-        semantic_results = []
-        if embedder != "fallback":
-            try:
-                query_embedding = embedder.encode(query, convert_to_numpy=True)
-                
-                # Use vector store if available
-                if vector_store_instance != "fallback":
-                    semantic_results = vector_store_instance.search(
-                        query_embedding.tolist(), 
-                        top_k=request.top_k * 2
-                    )
-                else:
-                    # In-memory semantic search
-                    import numpy as np
-                    for chunk in document_chunks:
-                        if 'embedding' not in chunk:
-                            chunk['embedding'] = embedder.encode(chunk['content'], convert_to_numpy=True)
-                    
-                    scores = []
-                    for chunk in document_chunks:
-                        similarity = np.dot(query_embedding, chunk['embedding']) / (
-                            np.linalg.norm(query_embedding) * np.linalg.norm(chunk['embedding'])
-                        )
-                        scores.append({
-                            'id': chunk['chunk_id'],
-                            'score': float(similarity),
-                            'text': chunk['content'],
-                            'metadata': {
-                                'filename': chunk['filename'],
-                                'chunk_index': chunk['index']
-                            }
-                        })
-                    
-                    scores.sort(key=lambda x: x['score'], reverse=True)
-                    semantic_results = scores[:request.top_k * 2]
-                
-                logger.info(f"Semantic search: {len(semantic_results)} results")
-            except Exception as e:
-                logger.error(f"Semantic search failed: {e}")
+        # === RETRIEVAL (may hit the semantic response cache) ===
+        cached, semantic_results, final_results, query_embedding = await retrieve_for_query(query, request.top_k, cache_params)
+        if cached is not None:
+            return cached.model_copy(update={"processing_time_ms": (time.time() - start_time) * 1000})
         
-        # === HYBRID RETRIEVAL ===
-        if hybrid_retriever_instance != "fallback" and semantic_results:
-            try:
-                final_results = hybrid_retriever_instance.retrieve(
-                    query=query,
-                    semantic_results=semantic_results,
-                    all_chunks=document_chunks,
-                    top_k=request.top_k
-                )
-                logger.info(f"Hybrid retrieval: {len(final_results)} results")
-            except Exception as e:
-                logger.error(f"Hybrid retrieval failed: {e}")
-                final_results = semantic_results[:request.top_k]
-        else:
-            # Fallback to keyword search when semantic search returns no results
-            logger.info("Using keyword search fallback")
-            final_results = keyword_search(query, document_chunks)[:request.top_k]
-            logger.info(f"Keyword search: {len(final_results)} results")
+        # === RERANKING ===
+        final_results = await rerank_results(query, final_results, request.rerank_k)
         
         # === LLM GENERATION ===
+        cacheable = True
         if final_results:
-            # Prepare context from top chunks
-            context_parts = []
-            for i, result in enumerate(final_results[:3], 1):
-                text = result.get('text', '')
-                filename = result.get('metadata', {}).get('filename', 'Unknown')
-                context_parts.append(f"[Source {i} - {filename}]:\n{text}")
-            
-            context = "\n\n".join(context_parts)
+            context = build_context(final_results)
             
             # Get LLM client
-            llm = get_llm_client()
+            llm = await get_llm_client()
             
             if llm != "fallback":
                 try:
-                    llm_type, llm_instance = llm
-                    
-                    if llm_type == "ollama":
-                        # Generate answer with Ollama (local LLM)
-                        # Run in thread so event loop stays free for health checks
-                        def _ollama_chat():
-                            return llm_instance.chat(
-                                model="llama3.2",
-                                messages=[
-                                    {"role": "system", "content": "You are a helpful AI assistant. Answer questions based ONLY on the provided document context. Always cite which source you used (e.g., [Source 1]). If the answer is not in the context, say so clearly. Be concise and accurate."},
-                                    {"role": "user", "content": f"Context from documents:\n\n{context}\n\nQuestion: {query}\n\nProvide a clear, accurate answer based on the context above. Cite sources."}
-                                ]
-                            )
-                        response = await asyncio.to_thread(_ollama_chat)
-                        response_text = response['message']['content']
-                        logger.info("[OK] Ollama LLM generation complete")
-                    
-                    elif llm_type == "openai":
-                        # Generate answer with OpenAI GPT
-                        completion = llm_instance.chat.completions.create(
-                            model="gpt-3.5-turbo",
-                            messages=[
-                                {"role": "system", "content": "You are a helpful AI assistant. Answer questions based on the provided document context. Always cite sources. If unsure, say so."},
-                                {"role": "user", "content": f"Context:\n\n{context}\n\nQuestion: {query}\n\nProvide a clear, accurate answer based on the context."}
-                            ],
-                            temperature=0.7,
-                            max_tokens=500
-                        )
-                        response_text = completion.choices[0].message.content
-                        logger.info("[OK] OpenAI LLM generation complete")
-                    else:
-                        response_text = f"**Found relevant information:**\n\n{context[:1500]}"
-                        
+                    response_text = await llm.generate(build_llm_messages(llm.provider, context, query))
+                    logger.info(f"[OK] {llm.provider} LLM generation complete")
                 except Exception as e:
                     logger.error(f"LLM generation failed: {e}")
-                    response_text = f"**Relevant excerpts from your documents:**\n\n{context[:1500]}\n\n*Based on keyword and semantic search from your uploaded documents.*"
+                    cacheable = False
+                    response_text = excerpts_response(context, llm_failed=True)
             else:
-                response_text = f"**Found relevant information:**\n\n{context[:1500]}"
-            
-            # Build citations
-            citations = [
-                {
-                    "id": result.get('id', ''),
-                    "score": result.get('score', 0.0),
-                    "metadata": {
-                        "filename": result.get('metadata', {}).get('filename', 'Unknown'),
-                        "chunk_index": result.get('metadata', {}).get('chunk_index', 0),
-                        "preview": result.get('text', '')[:150] + "..."
-                    }
-                }
-                for result in final_results
-            ]
+                response_text = excerpts_response(context)
             
-            confidence = final_results[0].get('score', 0.0) if final_results else 0.0
+            citations = build_citations(final_results)
+            confidence = final_results[0].get('score', 0.0)
         else:
-            response_text = "❌ No relevant information found. Try:\n• Rephrasing your question\n• Uploading documents with this information\n• Being more specific"
+            response_text = NO_RESULTS_MESSAGE
             citations = []
             confidence = 0.0
         
-        return QueryResponse(
+        query_response = QueryResponse(
             response=response_text,
             citations=citations,
             confidence_score=confidence,
-            retrieved_count=len(semantic_results) if semantic_results else 0,
+            retrieved_count=len(semantic_results),
             reranked_count=len(final_results),
             processing_time_ms=(time.time() - start_time) * 1000
         )
+        if cacheable:
+            query_cache.put(query, cache_params, query_response, query_embedding, generation=cache_generation)
+        return query_response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Query error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def keyword_search(query: str, chunks: List[dict]) -> List[dict]:
-    query_words = set(query.lower().split())
-    scored_chunks = []
-    
-    for chunk in chunks:
-        chunk_words = set(chunk['content'].lower().split())
-        overlap = len(query_words & chunk_words)
-        if overlap > 0:
-            scored_chunks.append({
-                'id': chunk.get('chunk_id', ''),
-                'score': overlap / len(query_words),
-                'text': chunk['content'],
-                'metadata': {
-                    'filename': chunk.get('filename', 'Unknown'),
-                    'chunk_index': chunk.get('index', 0)
-                }
+@router.post("/query/stream")
+async def query_documents_stream(
+    request: QueryRequest,
+    x_api_key: Optional[str] = Header(None)
+):
+    # Server-Sent Events: one "citations" event, then "token" events, then "done" (or "error")
+    return StreamingResponse(
+        stream_query_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_query_events(request: QueryRequest) -> AsyncIterator[str]:
+    start_time = time.time()
+    query = request.query
+    
+    def elapsed_ms():
+        return (time.time() - start_time) * 1000
+    
+    def replay(response: QueryResponse, cached: bool):
+        # Complete answers (cache hits, canned messages) are sent as a single token event
+        yield sse_event("citations", {
+            "citations": [citation.model_dump() for citation in response.citations],
+            "confidence_score": response.confidence_score,
+            "retrieved_count": response.retrieved_count,
+            "reranked_count": response.reranked_count
+        })
+        yield sse_event("token", {"text": response.response})
+        yield sse_event("done", {"processing_time_ms": elapsed_ms(), "time_to_first_token_ms": elapsed_ms(), "cached": cached})
+    
+    try:
+        if not document_chunks:
+            for event in replay(QueryResponse(response=NO_DOCUMENTS_MESSAGE, confidence_score=0.0, retrieved_count=0,
+                                              reranked_count=0, processing_time_ms=0), cached=False):
+                yield event
+            return
+        
+        cache_params = get_cache_params(request)
+        cache_generation = query_cache.generation
+        cached = query_cache.get(query, cache_params)
+        if cached is None:
+            cached, semantic_results, final_results, query_embedding = await retrieve_for_query(query, request.top_k, cache_params)
+        if cached is not None:
+            for event in replay(cached, cached=True):
+                yield event
+            return
+        final_results = await rerank_results(query, final_results, request.rerank_k)
+        
+        # Citations go out before generation starts so clients can render sources immediately
+        citations = build_citations(final_results)
+        confidence = final_results[0].get('score', 0.0) if final_results else 0.0
+        yield sse_event("citations", {
+            "citations": citations,
+            "confidence_score": confidence,
+            "retrieved_count": len(semantic_results),
+            "reranked_count": len(final_results)
+        })
+        
+        parts = []
+        first_token_ms = None
+        cacheable = True
+        if not final_results:
+            parts.append(NO_RESULTS_MESSAGE)
+        else:
+            context = build_context(final_results)
+            llm = await get_llm_client()
+            if llm == "fallback":
+                parts.append(excerpts_response(context))
+            else:
+                try:
+                    # A client disconnect cancels this generator, which closes the upstream stream
+                    async for delta in llm.stream(build_llm_messages(llm.provider, context, query)):
+                        if first_token_ms is None:
+                            first_token_ms = elapsed_ms()
+                            logger.info(f"Time to first token: {first_token_ms:.0f}ms")
+                        parts.append(delta)
+                        yield sse_event("token", {"text": delta})
+                except Exception as e:
+                    logger.error(f"LLM streaming failed: {e}")
+                    cacheable = False
+                    if not parts:
+                        parts.append(excerpts_response(context, llm_failed=True))
+        
+        # Non-streamed answers (fallbacks, canned messages) go out as one token event
+        if first_token_ms is None:
+            first_token_ms = elapsed_ms()
+            yield sse_event("token", {"text": "".join(parts)})
+        
+        if cacheable:
+            query_cache.put(query, cache_params, QueryResponse(
+                response="".join(parts),
+                citations=citations,
+                confidence_score=confidence,
+                retrieved_count=len(semantic_results),
+                reranked_count=len(final_results),
+                processing_time_ms=elapsed_ms()
+            ), query_embedding, generation=cache_generation)
+        
+        yield sse_event("done", {"processing_time_ms": elapsed_ms(), "time_to_first_token_ms": first_token_ms, "cached": False})
+        
+    except Exception as e:
+        logger.error(f"Streaming query error: {str(e)}", exc_info=True)
+        yield sse_event("error", {"detail": str(e)})
+
+
+def get_cache_params(request: QueryRequest) -> tuple:
+    return (request.top_k, request.rerank_k, request.use_hybrid_search, request.include_sources)
+
+
+async def retrieve_for_query(query: str, top_k: int, cache_params: tuple) -> tuple:
+    # Returns (cached response, semantic results, final results, query embedding)
+    # The first query may load the model and open the index; keep that off the event loop
+    embedder = await asyncio.to_thread(get_embedding_service)
+    vector_store_instance = await asyncio.to_thread(get_vector_store)
+    hybrid_retriever_instance = await asyncio.to_thread(get_hybrid_retriever)
+    
+    # === QUERY VARIANTS (original first, duplicates after normalization dropped) ===
+    variants = [query]
+    if settings.use_query_rewriting:
+        normalized = {QueryResultCache.normalize(query)}
+        for variant in QueryRewriter().rewrite(query)[1:]:
+            if len(variants) >= settings.query_rewrite_max_variants:
+                break
+            if variant.strip() and QueryResultCache.normalize(variant) not in normalized:
+                normalized.add(QueryResultCache.normalize(variant))
+                variants.append(variant)
+    
+    # === QUERY EMBEDDING (all variants in one batched call) ===
+    variant_embeddings = None
+    query_embedding = None
+    if embedder != "fallback":
+        try:
+            variant_embeddings = await asyncio.to_thread(embedder.encode, variants, convert_to_numpy=True)
+            query_embedding = variant_embeddings[0]
+            
+            # === RESPONSE CACHE (semantically similar query) ===
+            cached = query_cache.get_similar(cache_params, query_embedding)
+            if cached is not None:
+                return cached, [], [], query_embedding
+            
+            if vector_store_instance == "fallback":
+                await asyncio.to_thread(embed_pending_chunks, embedder)
+        except Exception as e:
+            logger.error(f"Query embedding failed: {e}")
+            variant_embeddings = None
+    
+    # === SEMANTIC + KEYWORD SEARCH (fanned out per variant) ===
+    # Slots are taken inside the worker thread: cancelling a task does not stop its thread, so a
+    # search cut off by the timeout holds its slot until it really finishes, and extra-variant
+    # searches that have not started by then are skipped instead of running unobserved
+    slots = threading.BoundedSemaphore(settings.multi_query_concurrency)
+    abandoned = threading.Event()
+    
+    def bounded(optional: bool, search, *args):
+        with slots:
+            if optional and abandoned.is_set():
+                return None
+            return search(*args)
+    
+    def run_search(optional: bool, search, *args):
+        return asyncio.ensure_future(asyncio.to_thread(bounded, optional, search, *args))
+    
+    # All variants share one batched vector search; keyword searches run one per variant
+    semantic_tasks, keyword_tasks = [], []
+    if variant_embeddings is not None:
+        semantic_tasks.append(run_search(False, semantic_search_batch, variant_embeddings, top_k * 2))
+    for i, variant in enumerate(variants):
+        keyword_tasks.append(run_search(i > 0, keyword_search, variant, top_k * 2))
+    
+    # Extra variants get the latency cap; the original query's searches always complete
+    all_tasks = semantic_tasks + keyword_tasks
+    _, pending = await asyncio.wait(all_tasks, timeout=settings.multi_query_timeout_ms / 1000)
+    original_tasks = [tasks[0] for tasks in (semantic_tasks, keyword_tasks) if tasks]
+    late = [task for task in pending if task not in original_tasks]
+    abandoned.set()
+    for task in late:
+        task.cancel()
+    if late:
+        logger.info(f"Multi-query: dropped {len(late)} searches over the {settings.multi_query_timeout_ms}ms cap")
+    await asyncio.gather(*original_tasks, return_exceptions=True)
+    
+    def collect(tasks: list) -> List[List[dict]]:
+        lists = []
+        for task in tasks:
+            if task.cancelled():
+                continue
+            if task.exception() is not None:
+                logger.error(f"Search failed: {task.exception()}")
+                continue
+            lists.append(task.result())
+        return lists
+    
+    semantic_lists = [results for batch in collect(semantic_tasks) for results in batch if results]
+    keyword_lists = collect(keyword_tasks)
+    semantic_results = list({result['id']: result for results in semantic_lists for result in results}.values())
+    logger.info(f"Semantic search: {len(semantic_results)} results from {len(variants)} query variants")
+    
+    # === HYBRID RETRIEVAL ===
+    if hybrid_retriever_instance != "fallback" and semantic_lists:
+        try:
+            final_results = hybrid_retriever_instance.fuse(semantic_lists, keyword_lists, top_k=top_k)
+            logger.info(f"Hybrid retrieval: {len(final_results)} results")
+        except Exception as e:
+            logger.error(f"Hybrid retrieval failed: {e}")
+            final_results = semantic_lists[0][:top_k]
+    elif len(keyword_lists) > 1 and hybrid_retriever_instance != "fallback":
+        # Keyword-only fallback across variants
+        final_results = hybrid_retriever_instance.fuse([], keyword_lists, top_k=top_k)
+        logger.info(f"Keyword search: {len(final_results)} results")
+    else:
+        # Fallback to keyword search when semantic search returns no results
+        logger.info("Using keyword search fallback")
+        final_results = keyword_lists[0][:top_k] if keyword_lists else []
+        logger.info(f"Keyword search: {len(final_results)} results")
+    
+    return None, semantic_results, final_results, query_embedding
+
+
+def embed_pending_chunks(embedder):
+    # In-memory semantic search: embed chunks added since the last query in one batch.
+    # Concurrent queries wait here rather than embedding and appending the same prefix twice.
+    with chunk_embeddings_lock:
+        pending = document_chunks[len(chunk_embeddings):]
+        if pending:
+            chunk_embeddings.add(
+                [chunk['chunk_id'] for chunk in pending],
+                embedder.encode([get_chunk_text(chunk) for chunk in pending], convert_to_numpy=True),
+                [{'filename': chunk['filename'], 'chunk_index': chunk['index'], 'span': chunk} for chunk in pending]
+            )
+
+
+def semantic_search_batch(query_embeddings, top_k: int) -> List[List[dict]]:
+    vector_store_instance = get_vector_store()
+    if vector_store_instance != "fallback":
+        return [resolve_vector_hits(results) for results in vector_store_instance.search_batch(query_embeddings, top_k=top_k)]
+    
+    batches = chunk_embeddings.search_many(query_embeddings, top_k=top_k)
+    # Only the returned chunks are read back from the content store
+    for results in batches:
+        for result in results:
+            metadata = dict(result['metadata'])
+            result['text'] = get_chunk_text(metadata.pop('span'))
+            result['metadata'] = metadata
+    return batches
+
+
+def resolve_vector_hits(results: List[dict]) -> List[dict]:
+    # A shared vector entry carries the metadata of whichever document wrote it first. Each live
+    # owner is returned as its own chunk instead, under the id the keyword index uses for it.
+    resolved = []
+    filenames = {}
+    for result in results:
+        owners = chunk_dedup.owners(result['id'])
+        text = result.get('text')
+        if not text:
+            span = next(((doc_id, start, end) for doc_id, _, start, end in owners if start is not None), None)
+            if span is not None:
+                text = content_store.read(*span)
+            elif 'start' in result['metadata']:
+                text = get_chunk_text(result['metadata'])
+        if not owners:
+            resolved.append(dict(result, text=text or ""))
+            continue
+        for doc_id, index, _, _ in owners:
+            if doc_id not in filenames:
+                filenames[doc_id] = (uploaded_documents.get(doc_id) or {}).get("filename")
+            resolved.append({
+                'id': f"{doc_id}_chunk_{index}",
+                'score': result['score'],
+                'metadata': {'filename': filenames[doc_id], 'doc_id': doc_id, 'chunk_index': index},
+                'text': text or ""
             })
+    return resolved
+
+
+async def rerank_results(query: str, results: List[dict], rerank_k: int) -> List[dict]:
+    if not settings.enable_reranking or len(results) <= rerank_k:
+        return results
+    
+    # The first call loads the cross-encoder; keep that off the event loop
+    reranker_instance = await asyncio.to_thread(get_reranker)
+    if reranker_instance == "fallback":
+        return results[:rerank_k]
     
-    scored_chunks.sort(key=lambda x: x['score'], reverse=True)
-    return scored_chunks
+    # Cross-encoder scoring is CPU/GPU bound; the reranker skips itself when over its latency budget
+    return await asyncio.to_thread(reranker_instance.rerank, query, results, rerank_k)
+
+
+def build_context(final_results: List[dict]) -> str:
+    # Prepare context from top chunks
+    context_parts = []
+    for i, result in enumerate(final_results[:3], 1):
+        text = result.get('text', '')
+        filename = result.get('metadata', {}).get('filename', 'Unknown')
+        context_parts.append(f"[Source {i} - {filename}]:\n{text}")
+    return "\n\n".join(context_parts)
+
+
+def build_citations(final_results: List[dict]) -> List[dict]:
+    return [
+        {
+            "id": result.get('id', ''),
+            "score": result.get('score', 0.0),
+            "metadata": {
+                "filename": result.get('metadata', {}).get('filename', 'Unknown'),
+                "chunk_index": result.get('metadata', {}).get('chunk_index', 0),
+                "preview": result.get('text', '')[:150] + "..."
+            }
+        }
+        for result in final_results
+    ]
+
+
+def excerpts_response(context: str, llm_failed: bool = False) -> str:
+    if llm_failed:
+        return f"**Relevant excerpts from your documents:**\n\n{context[:1500]}\n\n*Based on keyword and semantic search from your uploaded documents.*"
+    return f"**Found relevant information:**\n\n{context[:1500]}"
+
+
+def build_llm_messages(llm_type: str, context: str, query: str) -> List[dict]:
+    if llm_type == "ollama":
+        return [
+            {"role": "system", "content": "You are a helpful AI assistant. Answer questions based ONLY on the provided document context. Always cite which source you used (e.g., [Source 1]). If the answer is not in the context, say so clearly. Be concise and accurate."},
+            {"role": "user", "content": f"Context from documents:\n\n{context}\n\nQuestion: {query}\n\nProvide a clear, accurate answer based on the context above. Cite sources."}
+        ]
+    return [
+        {"role": "system", "content": "You are a helpful AI assistant. Answer questions based on the provided document context. Always cite sources. If unsure, say so."},
+        {"role": "user", "content": f"Context:\n\n{context}\n\nQuestion: {query}\n\nProvide a clear, accurate answer based on the context."}
+    ]
+
+
+def keyword_search(query: str, top_k: int = 5) -> List[dict]:
+    return [
+        {
+            'id': chunk_id,
+            'score': score,
+            'text': get_chunk_text(chunk),
+            'metadata': {
+                'filename': chunk.get('filename', 'Unknown'),
+                'chunk_index': chunk.get('index', 0)
+            }
+        }
+        for chunk_id, score, chunk in bm25_index.search(query, top_k, normalize=True)
+    ]
+
+
+@router.get("/stats")
+async def get_stats():
+    return {
+        "caches": cache_manager.stats(),
+        "query_cache_generation": query_cache.generation,
+        "query_flights": query_flights.stats,
+        "documents": len(uploaded_documents),
+        "chunks": len(document_chunks)
+    }
 
 
 @router.get("/health", response_model=HealthResponse)
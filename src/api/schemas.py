@@ -40,6 +40,11 @@ class DocumentUploadRequest(BaseModel):
     source: Optional[str] = None
 
 
+class DirectoryIngestRequest(BaseModel):
+    directory: str = Field(..., min_length=1)  # Relative to the configured ingest root
+    recursive: bool = Field(default=True)
+
+
 class HealthResponse(BaseModel):
     status: str
     version: str
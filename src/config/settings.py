@@ -35,7 +35,7 @@ class Settings(BaseSettings):
     pinecone_api_key: Optional[str] = Field(default=None, alias="PINECONE_API_KEY")
     pinecone_index_name: str = Field(default="knowledge-base")
     pinecone_environment: str = Field(default="us-east1-aws")
-    chroma_persist_dir: str = Field(default="./data/chroma_db")
+    chroma_persist_dir: str = Field(default="./data/chroma")
     
     # Embedding settings (using local sentence-transformers by default - no API key needed)
     embedding_model: str = Field(default="all-MiniLM-L6-v2")
@@ -51,18 +51,51 @@ class Settings(BaseSettings):
     llm_api_base: Optional[str] = Field(default=None, alias="OPENAI_API_BASE")
     llm_temperature: float = Field(default=0.7)
     llm_max_tokens: int = Field(default=2048)
+    llm_timeout_seconds: float = Field(default=60.0)
     
     # Ingestion settings
     chunk_size: int = Field(default=1024)
     chunk_overlap: int = Field(default=128)
     max_file_size_mb: int = Field(default=100)
     supported_formats: str = Field(default="pdf,docx,txt,md")
+    ingestion_workers: int = Field(default=2)
+    chunk_unit: str = Field(default="tokens")  # tokens (embedding model tokenizer) or chars
+    chunk_max_tokens: int = Field(default=256)  # all-MiniLM-L6-v2 truncates input at 256 tokens
+    chunk_overlap_tokens: int = Field(default=32)
+    ingest_root: str = Field(default="./data/ingest")  # Directory ingestion only reads below this path
+    ingest_manifest_dir: str = Field(default="./data/ingest_manifest")
     
     # RAG settings
     retrieve_top_k: int = Field(default=5)
     rerank_top_k: int = Field(default=3)
     use_query_rewriting: bool = Field(default=True)
+    query_rewrite_max_variants: int = Field(default=3)
+    multi_query_concurrency: int = Field(default=4)
+    multi_query_timeout_ms: float = Field(default=500.0)
     enable_hybrid_search: bool = Field(default=True)
+    hybrid_fusion_method: str = Field(default="rrf")  # rrf, combsum or combmnz
+    enable_reranking: bool = Field(default=True)
+    rerank_model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    rerank_batch_size: int = Field(default=32)
+    rerank_max_length: int = Field(default=512)
+    rerank_latency_budget_ms: float = Field(default=300.0)
+    rerank_probe_every: int = Field(default=10)
+    rerank_cache_max_entries: int = Field(default=10000)
+    
+    # Local ANN index settings (used when Chroma/Pinecone are unavailable)
+    ann_backend: str = Field(default="ivf")  # ivf (NumPy) or hnsw (needs hnswlib)
+    ann_persist_dir: str = Field(default="./data/ann_index")
+    ann_nprobe: int = Field(default=8)
+    ann_ef_search: int = Field(default=64)
+    ann_quantizer: Optional[str] = Field(default=None)  # sq8 (4x smaller) or pq (~16x smaller); ivf only
+    ann_pq_subspaces: Optional[int] = Field(default=None)
+    ann_rescore_factor: int = Field(default=4)  # 0 skips the full-precision re-score
+    
+    # Query cache settings
+    query_cache_max_entries: int = Field(default=512)
+    query_cache_ttl_seconds: int = Field(default=3600)
+    query_cache_similarity_threshold: float = Field(default=0.95)
+    cache_sweep_interval_seconds: float = Field(default=60.0)  # Background expiry of cached entries; 0 disables
     
     # MLflow settings
     mlflow_tracking_uri: str = Field(default="http://localhost:5000")
@@ -1,5 +1,30 @@
 """Embedding generation and vector database integration."""
 from .embedding_service import EmbeddingService
-from .vector_store import VectorStore
+from .vector_store import VectorStore, VectorBackend, ChromaBackend, PineconeBackend, LocalBackend
+from .embedding_matrix import EmbeddingMatrix, as_float32_matrix
+from .model_registry import ModelRegistry, get_model_registry
+from .embedding_cache import EmbeddingCache
+from .ann_index import IVFFlatIndex, HNSWIndex, AnnCollection, create_ann_index, load_ann_index
+from .quantization import ScalarQuantizer, ProductQuantizer, create_quantizer
 
-__all__ = ["EmbeddingService", "VectorStore"]
+__all__ = [
+    "EmbeddingService",
+    "VectorStore",
+    "VectorBackend",
+    "ChromaBackend",
+    "PineconeBackend",
+    "LocalBackend",
+    "EmbeddingMatrix",
+    "as_float32_matrix",
+    "ModelRegistry",
+    "get_model_registry",
+    "EmbeddingCache",
+    "IVFFlatIndex",
+    "HNSWIndex",
+    "AnnCollection",
+    "create_ann_index",
+    "load_ann_index",
+    "ScalarQuantizer",
+    "ProductQuantizer",
+    "create_quantizer",
+]
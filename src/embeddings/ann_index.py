@@ -0,0 +1,805 @@
+import json
+import logging
+import math
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+from src.ingestion.metadata_store import replay_journal
+from .embedding_matrix import as_float32_matrix
+from .quantization import cluster_sums, create_quantizer, load_quantizer, save_quantizer
+
+logger = logging.getLogger(__name__)
+
+SearchResults = Tuple[List[List[str]], List[np.ndarray]]
+
+
+def _as_unit_rows(vectors, dimension: Optional[int] = None) -> np.ndarray:
+    vectors = as_float32_matrix(vectors, dimension)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= scores.size:
+        top = np.arange(scores.size)
+    else:
+        top = np.argpartition(scores, -k)[-k:]
+    return top[np.argsort(scores[top])[::-1]]
+
+
+def _write_atomic(path: str, write) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class IVFFlatIndex:
+
+    backend = "ivf"
+    PARAMS = ("nlist", "nprobe", "train_threshold", "kmeans_iterations", "seed",
+              "quantizer", "pq_subspaces", "rescore_factor")
+    # k-means wants a few dozen points per centroid to place it well
+    MIN_POINTS_PER_LIST = 39
+    BLOCK_ROWS = 65536
+
+    def __init__(self, dimension: int, nlist: Optional[int] = None, nprobe: int = 8,
+                 train_threshold: int = 4096, kmeans_iterations: int = 10, seed: int = 0,
+                 quantizer: Optional[str] = None, pq_subspaces: Optional[int] = None, rescore_factor: int = 4):
+        self.dimension = dimension
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.kmeans_iterations = kmeans_iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_on = 0
+        # With a quantizer the base segment is scanned through its codes; rescore_factor * top_k
+        # candidates are then re-ranked against the full vectors (0 returns the approximate scores)
+        self.quantizer_kind = quantizer
+        self.pq_subspaces = pq_subspaces
+        self.rescore_factor = rescore_factor
+        self.quantizer = None
+
+        # Base segment: rows grouped by list, list l at base[offsets[l]:offsets[l + 1]]; memory-mapped after load
+        self._base = np.empty((0, dimension), dtype=np.float32)
+        self._base_codes: Optional[np.ndarray] = None
+        self._offsets = np.zeros(2, dtype=np.int64)
+        # Delta segment: rows inserted since the last build/load, tracked per list
+        self._delta = np.empty((256, dimension), dtype=np.float32)
+        self._delta_size = 0
+        self._delta_lists: List[List[int]] = [[]]
+        self._delta_assignments: List[int] = []  # List of each delta row, in insertion order
+        self._tombstones: List[int] = []  # Rows deleted since the base segment was written
+
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._alive = np.zeros(256, dtype=bool)
+        self._lock = threading.RLock()
+
+        # What the files at _path already hold; save() appends only the rest
+        self._path: Optional[str] = None
+        self._generation = 0
+        self._base_dirty = True
+        self._saved_delta = 0
+        self._saved_tombstones = 0
+        self._delta_log_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._rows
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        if len(ids) == 0:
+            return
+        vectors = _as_unit_rows(vectors, self.dimension)
+
+        with self._lock:
+            # Re-adding an id replaces its vector
+            self.delete([doc_id for doc_id in ids if doc_id in self._rows])
+
+            lists = self._assign(vectors) if self.is_trained else np.zeros(len(ids), dtype=np.int64)
+            start = self._delta_size
+            self._reserve_delta(start + len(ids))
+            self._delta[start:start + len(ids)] = vectors
+            self._delta_size += len(ids)
+
+            base_size = len(self._base)
+            self._reserve_alive(base_size + self._delta_size)
+            for i, (doc_id, list_no) in enumerate(zip(ids, lists)):
+                row = base_size + start + i
+                self._delta_lists[list_no].append(start + i)
+                self._rows[doc_id] = row
+                self._alive[row] = True
+            self._ids.extend(ids)
+            self._delta_assignments.extend(lists.tolist())
+
+            if not self.is_trained and len(self._rows) >= self.train_threshold:
+                self.build()
+            elif self.is_trained and len(self._rows) > 8 * self.trained_on:
+                # The corpus has outgrown the clustering it was trained on
+                self.build()
+
+    def delete(self, ids: Sequence[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is not None:
+                    self._alive[row] = False
+                    self._tombstones.append(row)
+                    removed += 1
+        return removed
+
+    def search(self, queries, top_k: int = 5, nprobe: Optional[int] = None) -> SearchResults:
+        queries = _as_unit_rows(queries, self.dimension)
+        nprobe = nprobe or self.nprobe
+
+        with self._lock:
+            if not self._rows or top_k <= 0:
+                return [[] for _ in queries], [np.empty(0, dtype=np.float32) for _ in queries]
+
+            if self.is_trained:
+                coarse = queries @ self.centroids.T
+                probes = [_top_k(row, min(nprobe, len(self.centroids))) for row in coarse]
+            else:
+                probes = [np.zeros(1, dtype=np.int64) for _ in queries]
+
+            base_size = len(self._base)
+            codes = self._base_codes
+            all_ids, all_scores = [], []
+            for query, lists in zip(queries, probes):
+                rows, scores = [], []
+                table = self.quantizer.distance_table(query) if codes is not None else None
+                for list_no in lists:
+                    start, end = self._offsets[list_no], self._offsets[list_no + 1]
+                    if end > start:
+                        rows.append(np.arange(start, end))
+                        if codes is not None:
+                            scores.append(self.quantizer.scores(table, codes[start:end]))
+                        else:
+                            scores.append(self._base[start:end] @ query)
+                    delta_rows = self._delta_lists[list_no]
+                    if delta_rows:
+                        delta_rows = np.asarray(delta_rows)
+                        rows.append(delta_rows + base_size)
+                        scores.append(self._delta[delta_rows] @ query)
+
+                if not rows:
+                    all_ids.append([])
+                    all_scores.append(np.empty(0, dtype=np.float32))
+                    continue
+
+                rows = np.concatenate(rows)
+                scores = np.concatenate(scores)
+                alive = self._alive[rows]
+                rows, scores = rows[alive], scores[alive]
+                if codes is not None and self.rescore_factor:
+                    # Only the shortlist touches full-precision vectors (on disk once saved)
+                    shortlist = _top_k(scores, top_k * self.rescore_factor)
+                    rows = rows[shortlist]
+                    scores = self._row_vectors(rows) @ query
+                top = _top_k(scores, top_k)
+                all_ids.append([self._ids[row] for row in rows[top]])
+                all_scores.append(scores[top])
+
+            return all_ids, all_scores
+
+    def build(self) -> None:
+        with self._lock:
+            rows = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+            if len(rows) == 0:
+                return
+
+            nlist = self.nlist or max(1, int(4 * math.sqrt(len(rows))))
+            nlist = max(1, min(nlist, len(rows) // self.MIN_POINTS_PER_LIST or 1))
+            # Centroids and quantizer train on a sample; only the sample is gathered into one matrix
+            rng = np.random.default_rng(self.seed)
+            sample = self._row_vectors(np.sort(rng.choice(rows, min(len(rows), 256 * nlist), replace=False)))
+            self.centroids = self._kmeans(sample, nlist)
+            self.trained_on = len(rows)
+            if self.quantizer_kind:
+                params = {"subspaces": self.pq_subspaces} if self.quantizer_kind == "pq" else {}
+                self.quantizer = create_quantizer(self.quantizer_kind, self.dimension, **params)
+                self.quantizer.train(sample)
+            self._rebuild(rows)
+            logger.info(f"IVF index built: {len(rows)} vectors in {nlist} lists")
+
+    def save(self, path: str, compact: bool = False) -> None:
+        # Rows added and deleted since the last save are appended to the delta segment files.
+        # The base segment is rewritten only when compacting (asked for, after a rebuild, or once
+        # the delta has grown to a sizeable fraction of the base).
+        with self._lock:
+            pending = self._delta_size + len(self._tombstones)
+            if compact and not pending and not self._base_dirty and self._path == path:
+                return
+            if compact or self._base_dirty or self._path != path or not self._generation \
+                    or pending > max(self.train_threshold, len(self._base) // 2):
+                self._write_base(path)
+            else:
+                self._write_delta(path)
+
+    @classmethod
+    def load(cls, path: str, **overrides) -> "IVFFlatIndex":
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        params = {
+            key: header[key]
+            for key in ("nlist", "nprobe", "train_threshold", "quantizer", "pq_subspaces", "rescore_factor")
+            if key in header
+        }
+        params.update(overrides)
+        index = cls(header["dimension"], **params)
+        index._open(path, header)
+        logger.info(f"Loaded IVF index ({len(index)} vectors) from {path}")
+        return index
+
+    def _write_base(self, path: str) -> None:
+        generation = self._generation + 1
+        prefix = f"g{generation}-"
+        order, offsets = self._live_order()
+
+        os.makedirs(path, exist_ok=True)
+        # Rows are copied block by block, so the new segment is never held in memory as a whole
+        vectors = np.lib.format.open_memmap(
+            os.path.join(path, f"{prefix}vectors.npy"), mode="w+", dtype=np.float32,
+            shape=(len(order), self.dimension)
+        )
+        for start in range(0, len(order), self.BLOCK_ROWS):
+            vectors[start:start + self.BLOCK_ROWS] = self._row_vectors(order[start:start + self.BLOCK_ROWS])
+        vectors.flush()
+        if self.quantizer is not None:
+            # Base rows keep the codes they have; only delta rows are encoded
+            in_base = order < len(self._base)
+            codes = np.empty((len(order), self._base_codes.shape[1]), dtype=self._base_codes.dtype)
+            codes[in_base] = self._base_codes[order[in_base]]
+            if not in_base.all():
+                codes[~in_base] = self._encode_blocks(self._delta[order[~in_base] - len(self._base)])
+            np.save(os.path.join(path, f"{prefix}codes.npy"), codes)
+            with open(os.path.join(path, f"{prefix}quantizer.npz"), "wb") as f:
+                save_quantizer(self.quantizer, f)
+        del vectors
+        np.save(os.path.join(path, f"{prefix}offsets.npy"), offsets)
+        if self.is_trained:
+            np.save(os.path.join(path, f"{prefix}centroids.npy"), self.centroids)
+        with open(os.path.join(path, f"{prefix}ids.json"), "w", encoding="utf-8") as f:
+            json.dump([self._ids[row] for row in order.tolist()], f)
+
+        header = self._header(generation, 0, 0)
+        # The header is replaced last, so a crash mid-save leaves the previous header pointing at whole files
+        _write_atomic(os.path.join(path, "index.json"), lambda f: f.write(json.dumps(header).encode("utf-8")))
+        if self._path == path:
+            self._remove_generation(path, self._generation)
+        logger.info(f"Saved IVF index ({len(order)} vectors) to {path}")
+
+        # Reopen from disk so the full vectors are paged in on demand rather than held in RAM
+        self._open(path, header)
+
+    def _write_delta(self, path: str) -> None:
+        new_rows = self._delta_size - self._saved_delta
+        deleted = self._tombstones[self._saved_tombstones:]
+        if not new_rows and not deleted:
+            return
+
+        prefix = self._prefix(self._generation)
+        base_size = len(self._base)
+        # Both files are cut back to what the header committed, dropping anything a crashed save left behind
+        with open(os.path.join(path, f"{prefix}delta.f32"), "ab") as f:
+            f.truncate(self._saved_delta * self.dimension * 4)
+            f.write(self._delta[self._saved_delta:self._delta_size].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        entry = {
+            "ids": self._ids[base_size + self._saved_delta:base_size + self._delta_size],
+            "lists": self._delta_assignments[self._saved_delta:],
+            "deleted": deleted
+        }
+        with open(os.path.join(path, f"{prefix}delta.log"), "ab") as f:
+            f.truncate(self._delta_log_bytes)
+            f.write((json.dumps(entry) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            log_bytes = f.tell()
+
+        header = self._header(self._generation, self._delta_size, log_bytes)
+        _write_atomic(os.path.join(path, "index.json"), lambda f: f.write(json.dumps(header).encode("utf-8")))
+        self._saved_delta = self._delta_size
+        self._saved_tombstones = len(self._tombstones)
+        self._delta_log_bytes = log_bytes
+        logger.debug(f"Saved IVF delta ({new_rows} rows, {len(deleted)} deletions) to {path}")
+
+    def _header(self, generation: int, delta_rows: int, delta_log_bytes: int) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "dimension": self.dimension,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "train_threshold": self.train_threshold,
+            "quantizer": self.quantizer_kind,
+            "pq_subspaces": self.pq_subspaces,
+            "rescore_factor": self.rescore_factor,
+            "trained": self.is_trained,
+            "trained_on": self.trained_on,
+            "quantized": self.quantizer is not None,
+            "generation": generation,
+            "delta_rows": delta_rows,
+            "delta_log_bytes": delta_log_bytes
+        }
+
+    @staticmethod
+    def _prefix(generation: int) -> str:
+        # Generation 0 is the single-file layout written before delta segments existed
+        return f"g{generation}-" if generation else ""
+
+    def _remove_generation(self, path: str, generation: int) -> None:
+        prefix = self._prefix(generation)
+        for name in ("vectors.npy", "codes.npy", "quantizer.npz", "offsets.npy", "centroids.npy",
+                     "ids.json", "delta.f32", "delta.log"):
+            try:
+                os.remove(os.path.join(path, prefix + name))
+            except FileNotFoundError:
+                pass
+
+    def _open(self, path: str, header: Dict[str, Any]) -> None:
+        generation = header.get("generation", 0)
+        prefix = self._prefix(generation)
+        if "ids" in header:
+            ids = header["ids"]
+        else:
+            with open(os.path.join(path, f"{prefix}ids.json"), "r", encoding="utf-8") as f:
+                ids = json.load(f)
+        if header["trained"]:
+            self.centroids = np.load(os.path.join(path, f"{prefix}centroids.npy"))
+            self.trained_on = header["trained_on"]
+        if header.get("quantized"):
+            # Codes are the part scanned on every query, so they are the part kept resident
+            self.quantizer = load_quantizer(os.path.join(path, f"{prefix}quantizer.npz"))
+            self._base_codes = np.load(os.path.join(path, f"{prefix}codes.npy"))
+        else:
+            self._base_codes = None
+
+        # Vectors stay on disk; pages are read as probed lists are scanned or shortlists rescored
+        self._base = np.load(os.path.join(path, f"{prefix}vectors.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, f"{prefix}offsets.npy"))
+        self._delta = np.empty((256, self.dimension), dtype=np.float32)
+        self._delta_size = 0
+        self._delta_lists = [[] for _ in range(len(self._offsets) - 1)]
+        self._delta_assignments = []
+        self._tombstones = []
+        self._ids = list(ids)
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._alive = np.ones(max(len(ids), 256), dtype=bool)
+        self._path = path
+        self._generation = generation
+        self._base_dirty = False
+
+        delta_rows = header.get("delta_rows", 0)
+        if delta_rows:
+            self._delta = np.fromfile(
+                os.path.join(path, f"{prefix}delta.f32"), dtype=np.float32, count=delta_rows * self.dimension
+            ).reshape(delta_rows, self.dimension)
+            with open(os.path.join(path, f"{prefix}delta.log"), "rb") as f:
+                log = f.read(header["delta_log_bytes"])
+            self._reserve_alive(len(ids) + delta_rows)
+            for line in log.splitlines():
+                self._replay_delta(json.loads(line))
+        self._saved_delta = self._delta_size
+        self._saved_tombstones = len(self._tombstones)
+        self._delta_log_bytes = header.get("delta_log_bytes", 0)
+
+    def _replay_delta(self, entry: Dict[str, Any]) -> None:
+        base_size = len(self._base)
+        for doc_id, list_no in zip(entry["ids"], entry["lists"]):
+            row = base_size + self._delta_size
+            self._delta_lists[list_no].append(self._delta_size)
+            self._delta_assignments.append(list_no)
+            self._delta_size += 1
+            self._rows[doc_id] = row
+            self._alive[row] = True
+            self._ids.append(doc_id)
+        for row in entry["deleted"]:
+            # A re-added id has moved on to a later row; only a tombstone for its current row removes it
+            self._alive[row] = False
+            self._tombstones.append(row)
+            if self._rows.get(self._ids[row]) == row:
+                del self._rows[self._ids[row]]
+
+    def _live_order(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Live rows grouped by list: each list's base rows, then the delta rows assigned to it
+        base_size = len(self._base)
+        groups = []
+        for list_no, delta_rows in enumerate(self._delta_lists):
+            rows = np.concatenate([
+                np.arange(self._offsets[list_no], self._offsets[list_no + 1], dtype=np.int64),
+                np.asarray(delta_rows, dtype=np.int64) + base_size
+            ])
+            groups.append(rows[self._alive[rows]])
+        counts = [len(rows) for rows in groups]
+        return np.concatenate(groups), np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def _row_vectors(self, rows: np.ndarray) -> np.ndarray:
+        base_size = len(self._base)
+        vectors = np.empty((len(rows), self.dimension), dtype=np.float32)
+        in_base = rows < base_size
+        vectors[in_base] = self._base[rows[in_base]]
+        vectors[~in_base] = self._delta[rows[~in_base] - base_size]
+        return vectors
+
+    def _rebuild(self, rows: np.ndarray) -> None:
+        # Rows are read in blocks twice (assign, then copy in list order), so the only full
+        # float32 matrix is the new base segment itself
+        lists = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            lists[start:start + self.BLOCK_ROWS] = self._assign(self._row_vectors(rows[start:start + self.BLOCK_ROWS]))
+        order = np.argsort(lists, kind="stable")
+        ordered_rows = rows[order]
+        ids = [self._ids[row] for row in ordered_rows.tolist()]
+        base = np.empty((len(rows), self.dimension), dtype=np.float32)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            base[start:start + self.BLOCK_ROWS] = self._row_vectors(ordered_rows[start:start + self.BLOCK_ROWS])
+        self._base = base
+        self._base_codes = self._encode_blocks(base) if self.quantizer is not None else None
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(self.centroids)))]).astype(np.int64)
+        self._delta = np.empty((256, self.dimension), dtype=np.float32)
+        self._delta_size = 0
+        self._delta_lists = [[] for _ in range(len(self.centroids))]
+        self._delta_assignments = []
+        self._tombstones = []
+        self._ids = ids
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._alive = np.ones(max(len(ids), 256), dtype=bool)
+        self._base_dirty = True
+        self._saved_delta = self._saved_tombstones = 0
+
+    def _encode_blocks(self, vectors: np.ndarray) -> np.ndarray:
+        return np.concatenate([
+            self.quantizer.encode(vectors[start:start + self.BLOCK_ROWS])
+            for start in range(0, max(len(vectors), 1), self.BLOCK_ROWS)
+        ])
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        # Assignment in blocks keeps the (rows x nlist) score matrix small
+        lists = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.BLOCK_ROWS):
+            block = vectors[start:start + self.BLOCK_ROWS]
+            lists[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return lists
+
+    def _kmeans(self, sample: np.ndarray, nlist: int) -> np.ndarray:
+        # Spherical k-means; centroids stay unit length so inner product ranks lists
+        rng = np.random.default_rng(self.seed)
+        sample_size = len(sample)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums, counts = cluster_sums(sample, assignment, nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty lists from random sample points
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _as_unit_rows(sums)
+        return centroids
+
+    def _reserve_delta(self, required: int) -> None:
+        if required <= len(self._delta):
+            return
+        grown = np.empty((max(required, 2 * len(self._delta)), self.dimension), dtype=np.float32)
+        grown[:self._delta_size] = self._delta[:self._delta_size]
+        self._delta = grown
+
+    def _reserve_alive(self, required: int) -> None:
+        if required <= len(self._alive):
+            return
+        grown = np.zeros(max(required, 2 * len(self._alive)), dtype=bool)
+        grown[:len(self._alive)] = self._alive
+        self._alive = grown
+
+
+class HNSWIndex:
+
+    backend = "hnsw"
+    PARAMS = ("ef", "ef_construction", "M", "max_elements")
+
+    def __init__(self, dimension: int, ef: int = 64, ef_construction: int = 200, M: int = 16,
+                 max_elements: int = 10000):
+        import hnswlib
+        self.dimension = dimension
+        self.ef = ef
+        self.ef_construction = ef_construction
+        self.M = M
+        self._index = hnswlib.Index(space="cosine", dim=dimension)
+        self._index.init_index(max_elements=max_elements, ef_construction=ef_construction, M=M)
+        self._index.set_ef(ef)
+        self._labels: Dict[str, int] = {}
+        self._ids: Dict[int, str] = {}
+        self._next_label = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._labels
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        if len(ids) == 0:
+            return
+        vectors = _as_unit_rows(vectors, self.dimension)
+
+        with self._lock:
+            self.delete([doc_id for doc_id in ids if doc_id in self._labels])
+            labels = np.arange(self._next_label, self._next_label + len(ids))
+            self._next_label += len(ids)
+
+            capacity = self._index.get_max_elements()
+            if self._next_label > capacity:
+                self._index.resize_index(max(self._next_label, 2 * capacity))
+
+            self._index.add_items(vectors, labels)
+            for doc_id, label in zip(ids, labels.tolist()):
+                self._labels[doc_id] = label
+                self._ids[label] = doc_id
+
+    def delete(self, ids: Sequence[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in ids:
+                label = self._labels.pop(doc_id, None)
+                if label is not None:
+                    self._index.mark_deleted(label)
+                    del self._ids[label]
+                    removed += 1
+        return removed
+
+    def search(self, queries, top_k: int = 5, ef: Optional[int] = None) -> SearchResults:
+        queries = _as_unit_rows(queries, self.dimension)
+        with self._lock:
+            k = min(top_k, len(self._labels))
+            if k <= 0:
+                return [[] for _ in queries], [np.empty(0, dtype=np.float32) for _ in queries]
+
+            self._index.set_ef(max(ef or self.ef, k))
+            labels, distances = self._index.knn_query(queries, k=k)
+            self._index.set_ef(self.ef)
+            return (
+                [[self._ids[label] for label in row] for row in labels.tolist()],
+                list(1.0 - distances)
+            )
+
+    def save(self, path: str, compact: bool = False) -> None:
+        # hnswlib only writes whole graphs
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            self._index.save_index(os.path.join(path, "hnsw.bin"))
+            header = {
+                "backend": self.backend,
+                "dimension": self.dimension,
+                "ef": self.ef,
+                "ef_construction": self.ef_construction,
+                "M": self.M,
+                "next_label": self._next_label,
+                "labels": self._labels
+            }
+            _write_atomic(os.path.join(path, "index.json"), lambda f: f.write(json.dumps(header).encode("utf-8")))
+
+    @classmethod
+    def load(cls, path: str, **overrides) -> "HNSWIndex":
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+
+        params = {key: header[key] for key in ("ef", "ef_construction", "M")}
+        params.update(overrides)
+        index = cls(header["dimension"], **params)
+        # hnswlib reads its graph into memory; only the IVF backend is memory-mapped
+        index._index.load_index(os.path.join(path, "hnsw.bin"), max_elements=max(header["next_label"], 1))
+        index._index.set_ef(index.ef)
+        index._labels = header["labels"]
+        index._ids = {label: doc_id for doc_id, label in index._labels.items()}
+        index._next_label = header["next_label"]
+        return index
+
+
+ANN_BACKENDS = {"ivf": IVFFlatIndex, "hnsw": HNSWIndex}
+
+
+def create_ann_index(backend: str, dimension: int, **params):
+    if backend not in ANN_BACKENDS:
+        raise ValueError(f"Unknown ANN backend: {backend}")
+    # Settings for every backend may be passed; each index takes the ones it understands
+    index_class = ANN_BACKENDS[backend]
+    return index_class(dimension, **{key: value for key, value in params.items() if key in index_class.PARAMS})
+
+
+def load_ann_index(path: str, **overrides):
+    with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+        backend = json.load(f)["backend"]
+    return ANN_BACKENDS[backend].load(path, **overrides)
+
+
+class AnnCollection:
+
+    SEARCH_PARAMS = ("nprobe", "ef", "rescore_factor")
+
+    def __init__(self, path: Optional[str] = None, backend: str = "ivf", store_texts: bool = True,
+                 **index_params):
+        self.path = path
+        self.backend = backend
+        # Without store_texts only metadata is kept; callers resolve text from their own store
+        self.store_texts = store_texts
+        self.index_params = index_params
+        self.index = None
+        self.metadata: Dict[str, Dict[str, Any]] = {}
+        self.texts: Dict[str, str] = {}
+        self._dirty = False
+        # Payload changes since the last save, journaled on top of the latest snapshot
+        self._changed: Dict[str, bool] = {}
+        self._payload_generation = 0
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+
+        if backend == "hnsw":
+            # Fail at construction, not on the first insert, when the optional dependency is missing
+            import hnswlib  # noqa: F401
+        if path and os.path.exists(os.path.join(path, "index.json")):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.index) if self.index is not None else 0
+
+    def add(self, ids: List[str], embeddings, metadata: Optional[List[Dict[str, Any]]] = None,
+            texts: Optional[List[str]] = None) -> None:
+        if not ids:
+            return
+        vectors = as_float32_matrix(embeddings)
+        with self._lock:
+            if self.index is None:
+                self.index = create_ann_index(self.backend, vectors.shape[1], **self.index_params)
+            self.index.add(ids, vectors)
+            for i, doc_id in enumerate(ids):
+                self.metadata[doc_id] = metadata[i] if metadata is not None else {}
+                if self.store_texts:
+                    self.texts[doc_id] = texts[i] if texts is not None else ""
+                else:
+                    # Text saved before store_texts was turned off goes as its entry is replaced
+                    self.texts.pop(doc_id, None)
+                self._changed[doc_id] = True
+            self._dirty = True
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            if self.index is None:
+                return 0
+            for doc_id in ids:
+                if self.metadata.pop(doc_id, None) is not None:
+                    self._changed[doc_id] = False
+                self.texts.pop(doc_id, None)
+            removed = self.index.delete(ids)
+            self._dirty = self._dirty or removed > 0
+            return removed
+
+    def search(self, query_embedding, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_many(query_embedding, top_k)[0]
+
+    def search_many(self, query_embeddings, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        queries = as_float32_matrix(query_embeddings)
+        if self.index is None or top_k <= 0:
+            return [[] for _ in queries]
+        all_ids, all_scores = self.index.search(queries, top_k)
+        return [
+            [
+                {
+                    "id": doc_id,
+                    "score": float(score),
+                    "metadata": self.metadata.get(doc_id, {}),
+                    "text": self.texts.get(doc_id, "")
+                }
+                for doc_id, score in zip(ids, scores)
+            ]
+            for ids, scores in zip(all_ids, all_scores)
+        ]
+
+    def save(self, compact: bool = False) -> None:
+        # Writes what changed since the last save; full snapshots only when compacting
+        # or once the payload journal outgrows the payload itself
+        with self._lock:
+            if not self.path or self.index is None or not (self._dirty or compact):
+                return
+            self.index.save(self.path, compact=compact)
+            if compact and not self._dirty and not self._journal_entries and self._payload_generation:
+                return
+            if compact or not self._payload_generation \
+                    or self._journal_entries + len(self._changed) > max(len(self.metadata), 1024):
+                self._write_payload_snapshot()
+            else:
+                self._append_payload_journal()
+            self._changed = {}
+            self._dirty = False
+
+    def _write_payload_snapshot(self) -> None:
+        # Each snapshot names its own journal, so a crash between the two never replays stale entries
+        generation = self._payload_generation + 1
+        payload = {"generation": generation, "metadata": self.metadata, "texts": self.texts}
+        _write_atomic(os.path.join(self.path, "payload.json"), lambda f: f.write(json.dumps(payload).encode("utf-8")))
+        if self._payload_generation:
+            try:
+                os.remove(self._journal_path(self._payload_generation))
+            except FileNotFoundError:
+                pass
+        self._payload_generation = generation
+        self._journal_entries = 0
+
+    def _append_payload_journal(self) -> None:
+        lines = []
+        for doc_id, present in self._changed.items():
+            if not present:
+                lines.append(json.dumps({"id": doc_id, "deleted": True}))
+            elif doc_id in self.metadata:
+                entry = {"id": doc_id, "metadata": self.metadata[doc_id]}
+                if doc_id in self.texts:
+                    entry["text"] = self.texts[doc_id]
+                lines.append(json.dumps(entry))
+        with open(self._journal_path(self._payload_generation), "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_entries += len(lines)
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"payload-{generation}.log")
+
+    def load(self) -> None:
+        with self._lock:
+            self.index = load_ann_index(self.path)
+            if self.index.backend != self.backend:
+                logger.warning(f"Index at {self.path} is {self.index.backend}, not {self.backend}; keeping it")
+                self.backend = self.index.backend
+            # Search-time parameters follow the current settings rather than the saved ones
+            for key, value in self.index_params.items():
+                if key in self.SEARCH_PARAMS and hasattr(self.index, key):
+                    setattr(self.index, key, value)
+            rebuilt = False
+            quantizer = self.index_params.get("quantizer")
+            if self.index.backend == "ivf" and quantizer != self.index.quantizer_kind:
+                # Switching compression needs codes for every row; rebuild once and mark for saving
+                logger.info(f"Re-encoding {self.path} with quantizer {quantizer}")
+                self.index.quantizer_kind = quantizer
+                self.index.pq_subspaces = self.index_params.get("pq_subspaces")
+                self.index.quantizer = None
+                if self.index.is_trained:
+                    self.index.build()
+                    rebuilt = True
+            self._load_payload()
+            self._dirty = rebuilt
+
+    def _load_payload(self) -> None:
+        payload_path = os.path.join(self.path, "payload.json")
+        if not os.path.exists(payload_path):
+            return
+        with open(payload_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        self.metadata = payload.get("metadata", {})
+        self.texts = payload.get("texts", {})
+        self._payload_generation = payload.get("generation", 0)
+        self._journal_entries = 0
+        if not self._payload_generation:
+            return
+        for entry in replay_journal(self._journal_path(self._payload_generation)):
+            self._journal_entries += 1
+            if entry.get("deleted"):
+                self.metadata.pop(entry["id"], None)
+                self.texts.pop(entry["id"], None)
+            else:
+                self.metadata[entry["id"]] = entry["metadata"]
+                if "text" in entry:
+                    self.texts[entry["id"]] = entry["text"]
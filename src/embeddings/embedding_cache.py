@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional
+import numpy as np
+
+from src.utils.cache import CacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = None, persist_path: Optional[str] = None,
+                 cache: Optional[CacheManager] = None, namespace: str = "embedding",
+                 sweep_interval_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        # Entries live in a CacheManager namespace, bounded by count and by vector bytes
+        self.cache = cache if cache is not None else CacheManager(
+            max_entries=max_entries, sweep_interval_seconds=sweep_interval_seconds
+        )
+        self.namespace = namespace
+        self.cache.configure(
+            namespace, ttl_seconds=float("inf") if ttl_seconds is None else ttl_seconds,
+            max_entries=max_entries, max_bytes=max_bytes
+        )
+
+        if persist_path and os.path.exists(f"{persist_path}.npy"):
+            self.load(persist_path)
+
+    def __len__(self) -> int:
+        return self.cache.stats(self.namespace)["entries"]
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.cache.get(self.make_key(model, text), self.namespace)
+
+    def put(self, model: str, text: str, embedding: np.ndarray) -> None:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.nbytes > self.max_bytes:
+            return
+        self.cache.set(self.make_key(model, text), embedding, namespace=self.namespace, size=embedding.nbytes)
+
+    def clear(self) -> None:
+        self.cache.clear(self.namespace)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {self.namespace: self.cache.stats(self.namespace)}
+
+    def save(self, path: Optional[str] = None) -> None:
+        path = path or self.persist_path
+        if not path:
+            raise ValueError("No persist path configured for embedding cache")
+
+        entries = self.cache.items(self.namespace)
+        keys = [key for key, _ in entries]
+        vectors = [vector.ravel() for _, vector in entries]
+
+        # Vectors of any dimension are stored back to back in one flat float32 file
+        offsets = np.cumsum([0] + [v.size for v in vectors]).tolist()
+        flat = np.concatenate(vectors) if vectors else np.empty(0, dtype=np.float32)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f"{path}.npy.tmp", "wb") as f:
+            np.save(f, flat)
+        with open(f"{path}.json.tmp", "w") as f:
+            json.dump({"keys": keys, "offsets": offsets}, f)
+        os.replace(f"{path}.npy.tmp", f"{path}.npy")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+        logger.info(f"Saved {len(keys)} cached embeddings to {path}")
+
+    def load(self, path: Optional[str] = None) -> int:
+        path = path or self.persist_path
+        try:
+            with open(f"{path}.json") as f:
+                index = json.load(f)
+            flat = np.load(f"{path}.npy", mmap_mode="r")
+        except Exception as e:
+            logger.warning(f"Failed to load embedding cache from {path}: {e}")
+            return 0
+
+        keys, offsets = index["keys"], index["offsets"]
+        # Entries are views into the memory-mapped file; pages are read on first use
+        for i, key in enumerate(keys):
+            embedding = flat[offsets[i]:offsets[i + 1]]
+            self.cache.set(key, embedding, namespace=self.namespace, size=embedding.nbytes)
+
+        logger.info(f"Loaded {len(keys)} cached embeddings from {path}")
+        return len(keys)
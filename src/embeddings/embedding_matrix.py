@@ -0,0 +1,131 @@
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def as_float32_matrix(embeddings, dimension: Optional[int] = None) -> np.ndarray:
+    # A C-contiguous float32 (n, d) array passes through untouched; anything else is converted once, in bulk
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.ndim == 2:
+        return matrix
+    if matrix.size == 0:
+        return matrix.reshape(0, dimension or 0)
+    return matrix.reshape(-1, dimension or matrix.shape[-1])
+
+
+class EmbeddingMatrix:
+
+    def __init__(self, dimension: Optional[int] = None, initial_capacity: int = 1024):
+        self.dimension = dimension
+        self._capacity = max(1, initial_capacity)
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.texts: List[str] = []
+        self._lock = threading.RLock()
+
+        if dimension is not None:
+            self._matrix = np.empty((self._capacity, dimension), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def add(self, ids: List[str], embeddings, metadata: Optional[List[Dict[str, Any]]] = None,
+            texts: Optional[List[str]] = None) -> None:
+        if not ids:
+            return
+
+        vectors = self._normalize(as_float32_matrix(embeddings))
+
+        with self._lock:
+            if self._matrix is None:
+                self.dimension = vectors.shape[1]
+                self._capacity = max(self._capacity, len(ids))
+                self._matrix = np.empty((self._capacity, self.dimension), dtype=np.float32)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dimension}")
+
+            self._reserve(self._size + len(ids))
+            self._matrix[self._size:self._size + len(ids)] = vectors
+            self._size += len(ids)
+
+            self.ids.extend(ids)
+            self.metadata.extend(metadata if metadata is not None else [{} for _ in ids])
+            self.texts.extend(texts if texts is not None else ["" for _ in ids])
+
+    def delete(self, ids: List[str]) -> int:
+        with self._lock:
+            drop = set(ids)
+            keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in drop]
+            removed = self._size - len(keep)
+            if removed:
+                # Compact in place so the live rows stay one contiguous block
+                self._matrix[:len(keep)] = self._matrix[keep]
+                self._size = len(keep)
+                self.ids = [self.ids[i] for i in keep]
+                self.metadata = [self.metadata[i] for i in keep]
+                self.texts = [self.texts[i] for i in keep]
+            return removed
+
+    def search(self, query_embedding, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.search_many(query_embedding, top_k)[0]
+
+    def search_many(self, query_embeddings, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        queries = self._normalize(as_float32_matrix(query_embeddings))
+        with self._lock:
+            if self._size == 0 or top_k <= 0:
+                return [[] for _ in queries]
+
+            # One BLAS matrix product scores every query against all stored (unit-length) vectors
+            scores = queries @ self._matrix[:self._size].T
+
+            k = min(top_k, self._size)
+            if k < self._size:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+            else:
+                top = np.broadcast_to(np.arange(self._size), scores.shape)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            top = np.take_along_axis(top, np.argsort(-top_scores, axis=1), axis=1)
+
+            return [
+                [
+                    {
+                        "id": self.ids[i],
+                        "score": float(row_scores[i]),
+                        "metadata": self.metadata[i],
+                        "text": self.texts[i]
+                    }
+                    for i in row
+                ]
+                for row, row_scores in zip(top, scores)
+            ]
+
+    def _reserve(self, required: int) -> None:
+        if required <= self._capacity:
+            return
+
+        new_capacity = self._capacity
+        while new_capacity < required:
+            new_capacity *= 2
+
+        grown = np.empty((new_capacity, self.dimension), dtype=np.float32)
+        grown[:self._size] = self._matrix[:self._size]
+        self._matrix = grown
+        self._capacity = new_capacity
+        logger.debug(f"Embedding matrix grown to {new_capacity} rows")
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
@@ -2,33 +2,47 @@ import logging
 from typing import List, Optional
 import numpy as np
 
+from .model_registry import get_model_registry
+from .embedding_cache import EmbeddingCache
+
 logger = logging.getLogger(__name__)
 
 
 class EmbeddingService:
     
-    def __init__(self, model: str = "text-embedding-ada-002", api_key: Optional[str] = None):
+    def __init__(self, model: str = "text-embedding-ada-002", api_key: Optional[str] = None,
+                 cache: Optional[EmbeddingCache] = None):
         self.model = model
         self.api_key = api_key
         self.provider = self._detect_provider(model)
-        self._embedding_cache = {}
+        self._embedding_cache = cache if cache is not None else EmbeddingCache()
+        self._model = None
+    
+    @property
+    def cache_stats(self) -> dict:
+        return self._embedding_cache.stats()
     
     def embed_text(self, text: str) -> np.ndarray:
-        if text in self._embedding_cache:
-            return self._embedding_cache[text]
+        embedding = self._embedding_cache.get(self.model, text)
+        if embedding is not None:
+            return embedding
         
         embedding = self._generate_embedding(text)
-        self._embedding_cache[text] = embedding
+        self._embedding_cache.put(self.model, text, embedding)
         return embedding
     
     def embed_texts(self, texts: List[str], batch_size: int = 10) -> List[np.ndarray]:
-        embeddings = []
+        embeddings = [self._embedding_cache.get(self.model, text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_embeddings = self._generate_batch_embeddings(batch)
-            embeddings.extend(batch_embeddings)
-            logger.debug(f"Generated embeddings for batch {i//batch_size + 1}")
+        # Only texts that are not cached are sent to the model
+        for start in range(0, len(missing), batch_size):
+            batch_indices = missing[start:start + batch_size]
+            batch_embeddings = self._generate_batch_embeddings([texts[i] for i in batch_indices])
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                embeddings[i] = embedding
+                self._embedding_cache.put(self.model, texts[i], embedding)
+            logger.debug(f"Generated embeddings for batch {start//batch_size + 1}")
         
         return embeddings
     
@@ -78,10 +92,20 @@ class EmbeddingService:
             logger.warning("OpenAI client not installed, using random embeddings")
             return [np.random.rand(1536).astype(np.float32) for _ in texts]
     
+    def _get_model(self):
+        # Shared per process through the registry instead of reloading weights per call
+        if self._model is None:
+            self._model = get_model_registry().acquire("sentence-transformer", self.model)
+        return self._model
+    
+    def close(self) -> None:
+        if self._model is not None:
+            get_model_registry().release("sentence-transformer", self.model)
+            self._model = None
+    
     def _huggingface_embed(self, text: str) -> np.ndarray:
         try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer(self.model)
+            model = self._get_model()
             embedding = model.encode(text, convert_to_numpy=True)
             return embedding.astype(np.float32)
         except ImportError:
@@ -90,8 +114,7 @@ class EmbeddingService:
     
     def _huggingface_embed_batch(self, texts: List[str]) -> List[np.ndarray]:
         try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer(self.model)
+            model = self._get_model()
             embeddings = model.encode(texts, convert_to_numpy=True, batch_size=32)
             return [emb.astype(np.float32) for emb in embeddings]
         except ImportError:
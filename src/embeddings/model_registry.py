@@ -0,0 +1,109 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ModelKey = Tuple[str, str]
+
+
+def _load_sentence_transformer(name: str, **kwargs):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, **kwargs)
+
+
+def _load_cross_encoder(name: str, **kwargs):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name, **kwargs)
+
+
+class ModelRegistry:
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[..., Any]] = {
+            "sentence-transformer": _load_sentence_transformer,
+            "cross-encoder": _load_cross_encoder,
+        }
+        self._models: Dict[ModelKey, Any] = {}
+        self._refcounts: Dict[ModelKey, int] = {}
+        self._load_locks: Dict[ModelKey, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register_loader(self, kind: str, loader: Callable[..., Any]) -> None:
+        with self._lock:
+            self._loaders[kind] = loader
+
+    def acquire(self, kind: str, name: str, **kwargs) -> Any:
+        model = self._get_or_load(kind, name, **kwargs)
+        with self._lock:
+            self._refcounts[(kind, name)] = self._refcounts.get((kind, name), 0) + 1
+        return model
+
+    def release(self, kind: str, name: str, unload: bool = False) -> int:
+        key = (kind, name)
+        with self._lock:
+            count = max(0, self._refcounts.get(key, 0) - 1)
+            self._refcounts[key] = count
+            if count == 0 and unload:
+                self._unload(key)
+        return count
+
+    def warm_up(self, models: Iterable[Tuple[str, str]]) -> None:
+        for kind, name in models:
+            try:
+                self._get_or_load(kind, name)
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {kind} '{name}': {e}")
+
+    def get(self, kind: str, name: str) -> Optional[Any]:
+        return self._models.get((kind, name))
+
+    def is_loaded(self, kind: str, name: str) -> bool:
+        return (kind, name) in self._models
+
+    def refcount(self, kind: str, name: str) -> int:
+        return self._refcounts.get((kind, name), 0)
+
+    def unload_unused(self) -> int:
+        with self._lock:
+            unused = [key for key in self._models if self._refcounts.get(key, 0) == 0]
+            for key in unused:
+                self._unload(key)
+        return len(unused)
+
+    def _get_or_load(self, kind: str, name: str, **kwargs) -> Any:
+        key = (kind, name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if kind not in self._loaders:
+                raise ValueError(f"No loader registered for model kind: {kind}")
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Per-model lock so concurrent first callers wait for a single load
+        with load_lock:
+            model = self._models.get(key)
+            if model is None:
+                logger.info(f"Loading {kind} model '{name}'")
+                model = self._loaders[kind](name, **kwargs)
+                self._models[key] = model
+        return model
+
+    def _unload(self, key: ModelKey) -> None:
+        if self._models.pop(key, None) is not None:
+            logger.info(f"Unloaded {key[0]} model '{key[1]}'")
+
+
+_registry: Optional[ModelRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
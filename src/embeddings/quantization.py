@@ -0,0 +1,172 @@
+import logging
+from typing import Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows decoded per step when scoring codes, so temporaries stay a few MB
+SCORE_BLOCK_ROWS = 16384
+
+
+def cluster_sums(vectors: np.ndarray, assignment: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Sort once and reduce contiguous runs; far cheaper than np.add.at's unbuffered scatter
+    counts = np.bincount(assignment, minlength=k)
+    sums = np.zeros((k, vectors.shape[1]), dtype=np.float64)
+    nonempty = counts > 0
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    sums[nonempty] = np.add.reduceat(vectors[np.argsort(assignment, kind="stable")], starts[nonempty], axis=0)
+    return sums, counts
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        assignment = np.argmax(vectors @ centroids.T - 0.5 * np.einsum("ij,ij->i", centroids, centroids), axis=1)
+        sums, counts = cluster_sums(vectors, assignment, k)
+        empty = counts == 0
+        centroids = (sums / np.maximum(counts, 1)[:, None]).astype(np.float32)
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+class ScalarQuantizer:
+    # int8 per dimension: 4x smaller than float32
+
+    kind = "sq8"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.low: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension
+
+    def train(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        step = (vectors.max(axis=0) - self.low) / 255.0
+        step[step == 0] = 1.0
+        self.step = step.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.rint((vectors - self.low) / self.step), 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.low + codes.astype(np.float32) * self.step
+
+    def distance_table(self, query: np.ndarray):
+        # Asymmetric: the query stays float32, q.x ~= q.low + (q * step).code
+        return query * self.step, float(query @ self.low)
+
+    def scores(self, table, codes: np.ndarray) -> np.ndarray:
+        scaled, bias = table
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ scaled + bias
+        return out
+
+    def state(self):
+        return {"low": self.low, "step": self.step}
+
+    def load_state(self, state) -> None:
+        self.low = state["low"]
+        self.step = state["step"]
+
+
+class ProductQuantizer:
+    # One byte per subspace: with 4 dims per subspace a float32 vector shrinks 16x
+
+    kind = "pq"
+    CENTROIDS = 256
+
+    def __init__(self, dimension: int, subspaces: Optional[int] = None, iterations: int = 10, seed: int = 0):
+        subspaces = subspaces or max(1, dimension // 4)
+        while dimension % subspaces:
+            subspaces -= 1
+        self.dimension = dimension
+        self.subspaces = subspaces
+        self.sub_dim = dimension // subspaces
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (subspaces, centroids, sub_dim)
+
+    @property
+    def code_size(self) -> int:
+        return self.subspaces
+
+    def train(self, vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), 32 * self.CENTROIDS), replace=False)]
+        k = min(self.CENTROIDS, len(sample))
+        codebooks = np.zeros((self.subspaces, self.CENTROIDS, self.sub_dim), dtype=np.float32)
+        for m, sub in enumerate(self._split(sample)):
+            codebooks[m, :k] = _kmeans(np.ascontiguousarray(sub), k, self.iterations, rng)
+        if k < self.CENTROIDS:
+            # Too few points for a full codebook; unused slots repeat the first centroid
+            codebooks[:, k:] = codebooks[:, :1]
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        half_norms = 0.5 * np.einsum("mkd,mkd->mk", self.codebooks, self.codebooks)
+        for m, sub in enumerate(self._split(vectors)):
+            for start in range(0, len(sub), SCORE_BLOCK_ROWS):
+                block = sub[start:start + SCORE_BLOCK_ROWS]
+                codes[start:start + len(block), m] = np.argmax(block @ self.codebooks[m].T - half_norms[m], axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def distance_table(self, query: np.ndarray) -> np.ndarray:
+        # Asymmetric distance: one (subspaces x 256) table of partial inner products per query
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.subspaces, self.sub_dim))
+        return table.ravel()
+
+    def scores(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Each code indexes its subspace's row of the flattened table; the partials sum to the score
+        offsets = np.arange(self.subspaces) * self.CENTROIDS
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = np.take(table, block + offsets).sum(axis=1)
+        return out
+
+    def state(self):
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state) -> None:
+        self.codebooks = state["codebooks"]
+        self.subspaces, _, self.sub_dim = self.codebooks.shape
+
+    def _split(self, vectors: np.ndarray):
+        return [vectors[:, m * self.sub_dim:(m + 1) * self.sub_dim] for m in range(self.subspaces)]
+
+
+QUANTIZERS = {"sq8": ScalarQuantizer, "pq": ProductQuantizer}
+
+
+def create_quantizer(kind: str, dimension: int, **params):
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantizer: {kind}")
+    return QUANTIZERS[kind](dimension, **params)
+
+
+def save_quantizer(quantizer, file) -> None:
+    np.savez(file, kind=np.array(quantizer.kind), dimension=np.array(quantizer.dimension), **quantizer.state())
+
+
+def load_quantizer(path: str):
+    with np.load(path) as state:
+        quantizer = QUANTIZERS[str(state["kind"])](int(state["dimension"]))
+        quantizer.load_state({key: state[key] for key in state.files})
+    return quantizer
@@ -1,153 +1,293 @@
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+import os
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
 import numpy as np
 
+from .ann_index import AnnCollection
+from .embedding_matrix import EmbeddingMatrix, as_float32_matrix
+
 logger = logging.getLogger(__name__)
 
+# Every backend returns hits as {"id", "score", "metadata", "text"}, best first, one list per query
+SearchResults = List[List[Dict[str, Any]]]
 
-class VectorStore:
-    
-    def __init__(self, vector_db_type: str = "chroma", **kwargs):
-        self.vector_db_type = vector_db_type
-        self.config = kwargs
-        
-        if vector_db_type == "chroma":
-            self.store = ChromaVectorStore(**kwargs)
-        elif vector_db_type == "pinecone":
-            self.store = PineconeVectorStore(**kwargs)
-        else:
-            raise ValueError(f"Unknown vector database type: {vector_db_type}")
-    
-    def add(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict[str, Any]]) -> None:
-        self.store.add(ids, embeddings, metadata)
-    
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float, Dict]]:
-        return self.store.search(query_embedding, top_k)
-    
-    def get_by_id(self, id: str) -> Optional[Tuple[np.ndarray, Dict]]:
-        return self.store.get_by_id(id)
-    
+
+def _matches(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+class VectorBackend(ABC):
+
+    name = "base"
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadata: List[Dict[str, Any]],
+               texts: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def search(self, query_embeddings: np.ndarray, top_k: int,
+               where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
     def delete(self, ids: List[str]) -> None:
-        self.store.delete(ids)
-    
-    def update(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict]) -> None:
-        self.store.update(ids, embeddings, metadata)
+        ...
 
+    @abstractmethod
+    def delete_document(self, doc_id: str) -> None:
+        ...
 
-class ChromaVectorStore:
-    
-    def __init__(self, persist_dir: str = "./data/chroma_db", **kwargs):
-        try:
-            import chromadb
-            self.client = chromadb.PersistentClient(path=persist_dir)
-            self.collection = self.client.get_or_create_collection(
-                name="documents",
-                metadata={"hnsw:space": "cosine"}
-            )
-            logger.info(f"Initialized Chroma store at {persist_dir}")
-        except ImportError:
-            raise ImportError("Please install chromadb: pip install chromadb")
-    
-    def add(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict]) -> None:
-        # Convert embeddings to list format for Chroma
-        embeddings_list = [emb.tolist() if isinstance(emb, np.ndarray) else emb for emb in embeddings]
-        
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings_list,
-            metadatas=metadata
+    def persist(self, compact: bool = False) -> None:
+        pass
+
+
+class ChromaBackend(VectorBackend):
+
+    name = "chroma"
+
+    def __init__(self, collection_name: str = "documents", persist_dir: str = "./data/chroma"):
+        import chromadb
+        persist_dir = os.path.abspath(persist_dir)
+        os.makedirs(persist_dir, exist_ok=True)
+
+        # ChromaDB 1.x+ uses PersistentClient
+        self.client = chromadb.PersistentClient(path=persist_dir)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine", "description": "RAG document chunks"}
         )
-        logger.info(f"Added {len(ids)} embeddings to Chroma")
-    
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float, Dict]]:
-        query_list = query_embedding.tolist() if isinstance(query_embedding, np.ndarray) else query_embedding
+        get_max_batch_size = getattr(self.client, "get_max_batch_size", None)
+        self.max_batch_size = get_max_batch_size() if get_max_batch_size else 5000
+        logger.info(f"[OK] ChromaDB initialized: {collection_name} at {persist_dir} ({self.collection.count()} docs)")
 
+    def upsert(self, ids, embeddings, metadata, texts) -> None:
+        # Chroma takes the (n, d) float32 array as is; batches only split at the server's limit
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=embeddings[start:end],
+                metadatas=metadata[start:end],
+                documents=texts[start:end]
+            )
+
+    def search(self, query_embeddings, top_k, where=None) -> SearchResults:
         results = self.collection.query(
-            query_embeddings=[query_list],
-            n_results=top_k
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            where=self._where(where)
         )
-        
-        # Format results
+
         output = []
-        for i, id in enumerate(results['ids'][0]):
-            distance = 1 - results['distances'][0][i]  # Convert distance to similarity
-            metadata = results['metadatas'][0][i]
-            output.append((id, distance, metadata))
-        
+        for ids, distances, metadatas, documents in zip(
+            results["ids"], results["distances"], results["metadatas"], results["documents"]
+        ):
+            # Convert cosine distances to similarities in one array operation
+            scores = (1 - np.asarray(distances, dtype=np.float32)).tolist()
+            output.append([
+                {"id": doc_id, "score": score, "metadata": meta, "text": text}
+                for doc_id, score, meta, text in zip(ids, scores, metadatas, documents)
+            ])
         return output
-    
-    def get_by_id(self, id: str) -> Optional[Tuple[np.ndarray, Dict]]:
-        try:
-            result = self.collection.get(ids=[id])
-            if result['embeddings']:
-                embedding = np.array(result['embeddings'][0], dtype=np.float32)
-                metadata = result['metadatas'][0]
-                return (embedding, metadata)
-        except Exception as e:
-            logger.warning(f"Error retrieving {id}: {str(e)}")
-        return None
-    
-    def delete(self, ids: List[str]) -> None:
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def delete(self, ids) -> None:
         self.collection.delete(ids=ids)
-        logger.info(f"Deleted {len(ids)} embeddings from Chroma")
-    
-    def update(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict]) -> None:
-        embeddings_list = [emb.tolist() if isinstance(emb, np.ndarray) else emb for emb in embeddings]
-        self.collection.update(
-            ids=ids,
-            embeddings=embeddings_list,
-            metadatas=metadata
-        )
-        logger.info(f"Updated {len(ids)} embeddings in Chroma")
 
+    def delete_document(self, doc_id) -> None:
+        self.collection.delete(where={"doc_id": doc_id})
+
+    @staticmethod
+    def _where(where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not where or len(where) == 1:
+            return where or None
+        return {"$and": [{key: value} for key, value in where.items()]}
+
+
+class PineconeBackend(VectorBackend):
+
+    name = "pinecone"
+    # Pinecone caps request size; 100 vectors per upsert is its recommended batch
+    UPSERT_BATCH_SIZE = 100
+
+    def __init__(self, index_name: str = "knowledge-base", api_key: Optional[str] = None):
+        api_key = api_key or os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY not set")
+        from pinecone import Pinecone
+        self.client = Pinecone(api_key=api_key)
+        self.index = self.client.Index(index_name)
+        logger.info(f"[OK] Pinecone initialized: {index_name}")
+
+    def upsert(self, ids, embeddings, metadata, texts) -> None:
+        for start in range(0, len(ids), self.UPSERT_BATCH_SIZE):
+            end = start + self.UPSERT_BATCH_SIZE
+            # Pinecone serializes plain lists; each batch is converted in one call at the wire boundary
+            records = [
+                {"id": doc_id, "values": values, "metadata": {**meta, "text": text}}
+                for doc_id, values, meta, text in zip(
+                    ids[start:end], embeddings[start:end].tolist(), metadata[start:end], texts[start:end]
+                )
+            ]
+            self.index.upsert(vectors=records)
+
+    def search(self, query_embeddings, top_k, where=None) -> SearchResults:
+        # Pinecone has no multi-vector query; the batch becomes one request per query
+        output = []
+        for query in query_embeddings:
+            results = self.index.query(vector=query.tolist(), top_k=top_k, include_metadata=True, filter=where)
+            hits = []
+            for match in results["matches"]:
+                metadata = dict(match.get("metadata") or {})
+                text = metadata.pop("text", "")
+                hits.append({"id": match["id"], "score": match["score"], "metadata": metadata, "text": text})
+            output.append(hits)
+        return output
 
-class PineconeVectorStore:
-    
-    def __init__(self, api_key: str, index_name: str = "knowledge-base", **kwargs):
+    def count(self) -> int:
+        return self.index.describe_index_stats()["total_vector_count"]
+
+    def delete(self, ids) -> None:
+        self.index.delete(ids=ids)
+
+    def delete_document(self, doc_id) -> None:
+        self.index.delete(filter={"doc_id": doc_id})
+
+
+class LocalBackend(VectorBackend):
+
+    name = "memory"
+
+    def __init__(self, collection_name: str = "documents", persist_dir: Optional[str] = None,
+                 ann_backend: str = "ivf", store_texts: bool = True, **ann_params):
+        if persist_dir is None:
+            self.collection = EmbeddingMatrix()
+            logger.info("[OK] In-memory vector store initialized")
+            return
+
+        path = os.path.abspath(os.path.join(persist_dir, collection_name))
         try:
-            from pinecone import Pinecone
-            self.client = Pinecone(api_key=api_key)
-            self.index = self.client.Index(index_name)
-            logger.info(f"Initialized Pinecone index: {index_name}")
-        except ImportError:
-            raise ImportError("Please install pinecone-client: pip install pinecone-client")
-    
-    def add(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict]) -> None:
-        vectors = []
-        for i, (id, emb, meta) in enumerate(zip(ids, embeddings, metadata)):
-            emb_list = emb.tolist() if isinstance(emb, np.ndarray) else emb
-            vectors.append((id, emb_list, meta))
-        
-        self.index.upsert(vectors=vectors)
-        logger.info(f"Added {len(ids)} embeddings to Pinecone")
-    
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float, Dict]]:
-        query_list = query_embedding.tolist() if isinstance(query_embedding, np.ndarray) else query_embedding
-
-        results = self.index.query(vector=query_list, top_k=top_k, include_metadata=True)
-        
-        # Format results
+            self.collection = AnnCollection(path, backend=ann_backend, store_texts=store_texts, **ann_params)
+        except ImportError as e:
+            # hnswlib is optional; the IVF index only needs NumPy
+            logger.warning(f"ANN backend {ann_backend} unavailable: {e}, using ivf")
+            self.collection = AnnCollection(path, backend="ivf", store_texts=store_texts, **ann_params)
+        logger.info(f"[OK] Local ANN vector store initialized: {path} ({len(self.collection)} docs)")
+
+    def upsert(self, ids, embeddings, metadata, texts) -> None:
+        if isinstance(self.collection, EmbeddingMatrix):
+            # The flat matrix appends; drop earlier copies of these ids first
+            self.collection.delete(ids)
+        self.collection.add(ids, embeddings, metadata, texts)
+
+    def search(self, query_embeddings, top_k, where=None) -> SearchResults:
+        if not where:
+            return self.collection.search_many(query_embeddings, top_k)
+
+        # Local indexes have no metadata index; over-fetch and filter until enough hits match
         output = []
-        for match in results['matches']:
-            output.append((match['id'], match['score'], match.get('metadata', {})))
-        
+        for query in query_embeddings:
+            fetch = top_k * 4
+            while True:
+                hits = self.collection.search_many(query[None, :], fetch)[0]
+                matched = [hit for hit in hits if _matches(hit["metadata"], where)]
+                if len(matched) >= top_k or len(hits) < fetch:
+                    break
+                fetch *= 4
+            output.append(matched[:top_k])
         return output
-    
-    def get_by_id(self, id: str) -> Optional[Tuple[np.ndarray, Dict]]:
+
+    def count(self) -> int:
+        return len(self.collection)
+
+    def delete(self, ids) -> None:
+        self.collection.delete(ids)
+
+    def delete_document(self, doc_id) -> None:
+        if isinstance(self.collection, EmbeddingMatrix):
+            items = zip(self.collection.ids, self.collection.metadata)
+        else:
+            items = self.collection.metadata.items()
+        self.delete([chunk_id for chunk_id, meta in items if meta.get("doc_id") == doc_id])
+
+    def persist(self, compact: bool = False) -> None:
+        # The local ANN index appends what changed and rewrites its snapshot when compacting;
+        # the flat matrix is memory only
+        if isinstance(self.collection, AnnCollection):
+            self.collection.save(compact)
+
+
+class VectorStore:
+
+    def __init__(self, db_type: str = "chroma", collection_name: str = "documents",
+                 persist_dir: str = "./data/chroma", pinecone_api_key: Optional[str] = None,
+                 pinecone_index_name: Optional[str] = None,
+                 ann_backend: str = "ivf", ann_persist_dir: Optional[str] = None, **ann_params):
+        self.db_type = db_type
+        self.collection_name = collection_name
+        self.backend: Optional[VectorBackend] = None
+
         try:
-            result = self.index.fetch(ids=[id])
-            if result['vectors']:
-                vector_data = result['vectors'][id]
-                embedding = np.array(vector_data['values'], dtype=np.float32)
-                metadata = vector_data.get('metadata', {})
-                return (embedding, metadata)
+            if db_type == "chroma":
+                self.backend = ChromaBackend(collection_name, persist_dir)
+            elif db_type == "pinecone":
+                self.backend = PineconeBackend(pinecone_index_name or collection_name, pinecone_api_key)
         except Exception as e:
-            logger.warning(f"Error retrieving {id}: {str(e)}")
-        return None
-    
+            logger.warning(f"{db_type} init failed: {e}, using local store")
+
+        if self.backend is None:
+            self.backend = LocalBackend(collection_name, ann_persist_dir, ann_backend, **ann_params)
+        self.db_type = self.backend.name
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadata: Optional[List[Dict[str, Any]]] = None,
+               texts: Optional[List[str]] = None) -> None:
+        if not ids:
+            return
+        # Embeddings arrive as one (n, d) float32 array; each backend converts it at most once
+        embeddings = as_float32_matrix(embeddings)
+        if len(embeddings) != len(ids):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(ids)} ids")
+        metadata = metadata if metadata is not None else [{} for _ in ids]
+        texts = texts if texts is not None else ["" for _ in ids]
+
+        try:
+            self.backend.upsert(ids, embeddings, metadata, texts)
+            logger.info(f"[OK] Upserted {len(ids)} documents to vector store")
+        except Exception as e:
+            logger.error(f"Upsert failed: {e}")
+            raise
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.search_batch(query_embedding, top_k, where)[0]
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                     where: Optional[Dict[str, Any]] = None) -> SearchResults:
+        query_embeddings = as_float32_matrix(query_embeddings)
+        if top_k <= 0:
+            return [[] for _ in query_embeddings]
+        try:
+            return self.backend.search(query_embeddings, top_k, where)
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+            return [[] for _ in query_embeddings]
+
+    def count(self) -> int:
+        return self.backend.count()
+
     def delete(self, ids: List[str]) -> None:
-        self.index.delete(ids=ids)
-        logger.info(f"Deleted {len(ids)} embeddings from Pinecone")
-    
-    def update(self, ids: List[str], embeddings: List[np.ndarray], metadata: List[Dict]) -> None:
-        self.add(ids, embeddings, metadata)
+        self.backend.delete(ids)
+
+    def delete_document(self, doc_id: str) -> None:
+        self.backend.delete_document(doc_id)
+
+    def persist(self, compact: bool = False) -> None:
+        self.backend.persist(compact)
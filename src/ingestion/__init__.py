@@ -1,5 +1,7 @@
 """Document ingestion pipeline for PDF/document processing."""
 from .document_loader import DocumentLoader
 from .chunker import DocumentChunker
+from .embedding_stage import BatchEmbeddingStage
+from .manifest import IngestManifest
 
-__all__ = ["DocumentLoader", "DocumentChunker"]
+__all__ = ["DocumentLoader", "DocumentChunker", "BatchEmbeddingStage", "IngestManifest"]
@@ -1,9 +1,53 @@
 import logging
-from typing import List, Dict, Any
+import re
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from dataclasses import dataclass
 
+from .content_store import ContentStore
+
 logger = logging.getLogger(__name__)
 
+# A sentence runs from a non-space character to terminal punctuation followed by whitespace, or to the end.
+# Matched against text with trailing whitespace excluded (endpos), so each step checks only a plain \Z.
+_SENTENCE_RE = re.compile(r'\S.*?(?:[.!?](?=\s|\Z)|\Z)', re.S)
+
+# Rough size of a token, used when a token budget is configured but no tokenizer can be loaded
+CHARS_PER_TOKEN = 4
+TOKENIZER_BATCH_SIZE = 512
+TOKEN_COUNT_CACHE_SIZE = 100000
+
+
+_tokenizers: Dict[str, Any] = {}  # model name -> tokenizer, or None once loading it has failed
+_tokenizers_lock = threading.Lock()
+
+
+def load_tokenizer(model_name: str):
+    # Loaded once per process on first use; a failure is remembered too, so it is logged once
+    # and later documents fall back to character sizing without retrying the download
+    with _tokenizers_lock:
+        if model_name not in _tokenizers:
+            _tokenizers[model_name] = _load_tokenizer(model_name)
+        return _tokenizers[model_name]
+
+
+def _load_tokenizer(model_name: str):
+    try:
+        from transformers import AutoTokenizer
+    except ImportError as e:
+        logger.warning(f"Tokenizer {model_name} unavailable ({e}); sizing chunks at {CHARS_PER_TOKEN} chars per token")
+        return None
+    # Sentence-transformers models are published under their org on the hub; try the bare name first
+    for name in (model_name, f"sentence-transformers/{model_name}"):
+        try:
+            return AutoTokenizer.from_pretrained(name, use_fast=True)
+        except Exception as e:
+            error = e
+    logger.warning(f"Tokenizer {model_name} unavailable ({error}); sizing chunks at {CHARS_PER_TOKEN} chars per token")
+    return None
+
 
 @dataclass
 class Chunk:
@@ -17,98 +61,199 @@ class Chunk:
 
 class DocumentChunker:
     
-    def __init__(self, chunk_size: int = 1024, chunk_overlap: int = 128):
+    def __init__(self, chunk_size: int = 1024, chunk_overlap: int = 128, tokenizer=None):
+        # With a tokenizer (an object or a model name) chunk_size and chunk_overlap count tokens, not characters
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer = tokenizer
+        self.tokenizer_name = tokenizer if isinstance(tokenizer, str) else None
+        self._unit_chars = 1
+        self._token_counts: OrderedDict = OrderedDict()
+        # One chunker serves ingestion threads and queries at once; the LRU is only touched under this lock
+        self._token_counts_lock = threading.Lock()
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
     
     def chunk_document(self, doc_id: str, content: str, metadata: Dict[str, Any]) -> List[Chunk]:
-        chunks = []
+        chunks = [
+            Chunk(
+                chunk_id=f"{doc_id}_chunk_{i}",
+                doc_id=doc_id,
+                content=content[start:end],
+                metadata={
+                    **metadata,
+                    "chunk_index": i,
+                    "chunk_size": end - start,
+                    "start": start,
+                    "end": end,
+                },
+                chunk_index=i,
+                total_chunks=0  # Will be updated after counting
+            )
+            for i, (start, end) in enumerate(self.iter_spans(content))
+        ]
         
-        # Simple character-based chunking
-        sentences = self._split_into_sentences(content)
-        current_chunk = []
-        current_size = 0
-        
-        for i, sentence in enumerate(sentences):
-            sentence_size = len(sentence)
-            
-            # Add sentence to current chunk
-            current_chunk.append(sentence)
-            current_size += sentence_size
-            
-            # Flush chunk if size exceeded
-            if current_size >= self.chunk_size or i == len(sentences) - 1:
-                chunk_text = ' '.join(current_chunk).strip()
-                
-                if chunk_text:  # Skip empty chunks
-                    chunk = Chunk(
-                        chunk_id=f"{doc_id}_chunk_{len(chunks)}",
-                        doc_id=doc_id,
-                        content=chunk_text,
-                        metadata={
-                            **metadata,
-                            "chunk_index": len(chunks),
-                            "chunk_size": len(chunk_text),
-                        },
-                        chunk_index=len(chunks),
-                        total_chunks=0  # Will be updated after counting
-                    )
-                    chunks.append(chunk)
-                
-                # Keep overlap for next chunk
-                overlap_size = 0
-                overlap_sentences = []
-                for sent in reversed(current_chunk):
-                    if overlap_size + len(sent) <= self.chunk_overlap:
-                        overlap_sentences.insert(0, sent)
-                        overlap_size += len(sent)
-                    else:
-                        break
-                
-                current_chunk = overlap_sentences
-                current_size = overlap_size
-        
-        # Update total chunks count
-        total = len(chunks)
         for chunk in chunks:
-            chunk.total_chunks = total
+            chunk.total_chunks = len(chunks)
         
         logger.info(f"Created {len(chunks)} chunks from document {doc_id}")
         return chunks
     
-    @staticmethod
-    def _split_into_sentences(text: str) -> List[str]:
-        # Simple sentence splitter based on common delimiters
-        import re
-        
-        # Replace newlines with spaces
-        text = text.replace('\n', ' ')
+    def chunk_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.iter_spans(text)]
+    
+    def iter_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            # Special tokens ([CLS], [SEP]) come out of the same model input budget
+            limit = self.chunk_size - tokenizer.num_special_tokens_to_add()
+            units = self._token_units(text, tokenizer, limit)
+            return self._pack(units, limit, self.chunk_overlap)
         
-        # Split by sentence boundaries
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        limit = self.chunk_size * self._unit_chars
+        return self._pack(self._char_units(text, limit), limit, self.chunk_overlap * self._unit_chars)
+    
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return [len(text) // CHARS_PER_TOKEN for text in texts]
         
-        # Clean and filter
-        sentences = [s.strip() for s in sentences if s.strip()]
+        counts = self._token_counts
+        found = {}
+        with self._token_counts_lock:
+            for text in dict.fromkeys(texts):
+                if text in counts:
+                    counts.move_to_end(text)
+                    found[text] = counts[text]
+            missing = [text for text in dict.fromkeys(texts) if text not in found]
+            self.token_cache_misses += len(missing)
+            self.token_cache_hits += len(texts) - len(missing)
         
-        return sentences
+        if missing:
+            # One batched call through the fast (Rust) tokenizer for every uncached sentence, outside the lock
+            encoded = tokenizer(missing, add_special_tokens=False)["input_ids"]
+            found.update((text, len(ids)) for text, ids in zip(missing, encoded))
+            with self._token_counts_lock:
+                for text in missing:
+                    counts[text] = found[text]
+                while len(counts) > TOKEN_COUNT_CACHE_SIZE:
+                    counts.popitem(last=False)
+        return [found[text] for text in texts]
     
-    def chunk_text(self, text: str) -> List[str]:
-        sentences = self._split_into_sentences(text)
-        chunks = []
-        current_chunk = []
-        current_size = 0
+    @staticmethod
+    def _pack(units: Iterator[Tuple[int, int, int]], limit: int, overlap: int) -> Iterator[Tuple[int, int]]:
+        # One pass over (start, end, cost) units; each enters and leaves the window once
+        window = deque()
+        total = 0
+        fresh = 0
         
-        for sentence in sentences:
-            current_chunk.append(sentence)
-            current_size += len(sentence)
+        for start, end, cost in units:
+            if window and total + cost > limit:
+                if fresh:
+                    yield window[0][0], window[-1][1]
+                    fresh = 0
+                
+                # Keep trailing sentences that fit in the overlap budget and leave room for this one
+                while window and (total > overlap or total + cost > limit):
+                    total -= window.popleft()[2]
             
-            if current_size >= self.chunk_size:
-                chunks.append(' '.join(current_chunk))
-                # Apply overlap
-                current_chunk = current_chunk[-(self.chunk_overlap // 50):]
-                current_size = sum(len(s) for s in current_chunk)
-        
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+            window.append((start, end, cost))
+            total += cost
+            fresh += 1
         
+        if fresh:
+            yield window[0][0], window[-1][1]
+    
+    def _char_units(self, text: str, limit: int) -> Iterator[Tuple[int, int, int]]:
+        # A sentence costs its length plus the gap before it, so a window's cost never understates its extent
+        previous_end = None
+        for start, end in self._bounded(self.iter_sentence_spans(text), text, limit):
+            yield start, end, end - (start if previous_end is None else previous_end)
+            previous_end = end
+    
+    def _token_units(self, text: str, tokenizer, limit: int) -> Iterator[Tuple[int, int, int]]:
+        # Whitespace between sentences adds no tokens, so a window's cost is the sum of its sentences'
+        spans = self.iter_sentence_spans(text)
+        while True:
+            batch = list(islice(spans, TOKENIZER_BATCH_SIZE))
+            if not batch:
+                return
+            sentences = [text[start:end] for start, end in batch]
+            for (start, end), sentence, count in zip(batch, sentences, self.count_tokens(sentences)):
+                if count <= limit:
+                    yield start, end, count
+                else:
+                    yield from self._split_by_tokens(sentence, start, tokenizer, limit)
+    
+    @staticmethod
+    def _split_by_tokens(sentence: str, offset: int, tokenizer, limit: int) -> Iterator[Tuple[int, int, int]]:
+        # A sentence over the budget is cut on token boundaries using the tokenizer's character offsets
+        offsets = tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        for i in range(0, len(offsets), limit):
+            piece = offsets[i:i + limit]
+            yield offset + piece[0][0], offset + piece[-1][1], len(piece)
+    
+    def warm_up(self) -> bool:
+        return self._get_tokenizer() is not None
+    
+    def _get_tokenizer(self):
+        if isinstance(self.tokenizer, str):
+            self.tokenizer = load_tokenizer(self.tokenizer)
+            if self.tokenizer is None:
+                self._unit_chars = CHARS_PER_TOKEN
+        return self.tokenizer
+    
+    @staticmethod
+    def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int]]:
+        for match in _SENTENCE_RE.finditer(text, 0, len(text.rstrip())):
+            yield match.span()
+    
+    @staticmethod
+    def _bounded(spans: Iterator[Tuple[int, int]], text: str, size: int) -> Iterator[Tuple[int, int]]:
+        # Text without sentence punctuation (tables, PDF runs) is cut at the last whitespace that fits
+        for start, end in spans:
+            while end - start > size:
+                limit = start + size
+                cut = max(text.rfind(' ', start + 1, limit + 1), text.rfind('\n', start + 1, limit + 1))
+                if cut <= start:
+                    cut = limit
+                piece_end = cut
+                while piece_end > start and text[piece_end - 1].isspace():
+                    piece_end -= 1
+                yield start, piece_end
+                start = cut
+                while start < end and text[start].isspace():
+                    start += 1
+            if end > start:
+                yield start, end
+
+
+class StreamingChunker:
+    # Chunks text that arrives in pieces (e.g. PDF pages). A chunk is emitted once a later chunk
+    # starts after it; the still-open last chunk is re-chunked together with the next piece.
+    
+    def __init__(self, chunker: DocumentChunker):
+        self.chunker = chunker
+        self._tail = ""
+        self._tail_bytes = 0  # UTF-8 offset of the tail within the whole text
+    
+    def feed(self, piece: str) -> List[Tuple[int, int, str]]:
+        self._tail += piece
+        spans = list(self.chunker.iter_spans(self._tail))
+        if not spans:
+            return self._emit([], len(self._tail))
+        return self._emit(spans[:-1], spans[-1][0])
+    
+    def finish(self) -> List[Tuple[int, int, str]]:
+        return self._emit(list(self.chunker.iter_spans(self._tail)), len(self._tail))
+    
+    def _emit(self, spans: List[Tuple[int, int]], keep: int) -> List[Tuple[int, int, str]]:
+        # Chunks come back as (byte start, byte end, text), the offsets the content store reads by
+        tail = self._tail
+        *byte_spans, (keep_bytes, _) = ContentStore.to_byte_spans(tail, spans + [(keep, keep)])
+        base = self._tail_bytes
+        chunks = [(base + b_start, base + b_end, tail[start:end])
+                  for (start, end), (b_start, b_end) in zip(spans, byte_spans)]
+        self._tail = tail[keep:]
+        self._tail_bytes = base + keep_bytes
         return chunks
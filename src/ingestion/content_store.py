@@ -0,0 +1,242 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .metadata_store import replay_journal
+
+logger = logging.getLogger(__name__)
+
+
+class ContentStore:
+
+    def __init__(self, path: str, compact_min_bytes: int = 16 * 1024 * 1024):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.compact_min_bytes = compact_min_bytes
+        # doc id -> pieces of (position in the document, file offset, length); one piece unless
+        # the document was streamed in while other documents were written
+        self._index: Optional[Dict[str, List[Tuple[int, int, int]]]] = None
+        self._file = None
+        self._size = 0
+        self._dead = 0  # Bytes no live document points at (deleted or replaced text)
+        self._mmap: Optional[mmap.mmap] = None
+        self._lock = threading.RLock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._load_index()
+
+    def put(self, doc_id: str, text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        with self._lock:
+            index = self._load_index()
+            existing = index.get(doc_id)
+            if existing is not None and len(existing) == 1 and existing[0][2] == len(data) \
+                    and self._view(*existing[0][1:]) == data:
+                return existing[0][1:]
+
+            # Text is appended once; readers map the file rather than holding strings in memory
+            offset = self._write(data)
+            self._release(index.get(doc_id))
+            index[doc_id] = [(0, offset, len(data))]
+            self._append_index({"id": doc_id, "offset": offset, "length": len(data)})
+            self._maybe_compact()
+            return offset, len(data)
+
+    def append(self, doc_id: str, text: str) -> int:
+        # Grows a document piece by piece (streamed extraction); what is written so far is readable.
+        # Interleaved writers each add pieces at the tail, so nothing written is ever copied again.
+        data = text.encode("utf-8")
+        with self._lock:
+            index = self._load_index()
+            offset = self._write(data)
+            pieces = index.setdefault(doc_id, [])
+            self._add_piece(pieces, offset, len(data))
+            self._append_index({"id": doc_id, "offset": offset, "length": len(data), "append": True})
+            return self.length(doc_id)
+
+    def read(self, doc_id: str, start: int = 0, end: Optional[int] = None) -> str:
+        view = self.read_bytes(doc_id, start, end)
+        if view is None:
+            return ""
+        try:
+            # Decodes straight from the mapped pages; 'ignore' drops a code point cut by a byte limit
+            return str(view, "utf-8", "ignore")
+        finally:
+            view.release()
+
+    def read_bytes(self, doc_id: str, start: int = 0, end: Optional[int] = None) -> Optional[memoryview]:
+        with self._lock:
+            pieces = self._load_index().get(doc_id)
+            if pieces is None:
+                return None
+            length = self._length(pieces)
+            end = length if end is None else min(end, length)
+            start = min(max(start, 0), end)
+
+            # Spans inside one piece are zero-copy views; a span across pieces is joined
+            first = bisect.bisect_right(pieces, start, key=lambda piece: piece[0]) - 1
+            views = []
+            for position, offset, piece_length in pieces[max(first, 0):]:
+                if position >= end and views:
+                    break
+                lo, hi = max(start, position), min(end, position + piece_length)
+                views.append(self._view(offset + lo - position, hi - lo))
+            if len(views) == 1:
+                return views[0]
+            joined = b"".join(views)
+            for view in views:
+                view.release()
+            return memoryview(joined)
+
+    def length(self, doc_id: str) -> int:
+        pieces = self._load_index().get(doc_id)
+        return self._length(pieces) if pieces else 0
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            pieces = self._load_index().pop(doc_id, None)
+            if pieces is not None:
+                self._release(pieces)
+                self._append_index({"id": doc_id, "deleted": True})
+                self._maybe_compact()
+
+    def compact(self) -> None:
+        # Rewrites live documents contiguously and drops deleted or replaced text.
+        # The data file is replaced before its index; _recover_compaction finishes a crashed swap.
+        with self._lock:
+            index = self._load_index()
+            tmp_path, tmp_index_path = f"{self.path}.tmp", f"{self.index_path}.tmp"
+            compacted: Dict[str, List[Tuple[int, int, int]]] = {}
+            with open(tmp_path, "wb") as data, open(tmp_index_path, "w", encoding="utf-8") as entries:
+                for doc_id, pieces in index.items():
+                    offset = data.tell()
+                    for _, piece_offset, piece_length in pieces:
+                        view = self._view(piece_offset, piece_length)
+                        try:
+                            data.write(view)
+                        finally:
+                            view.release()
+                    length = self._length(pieces)
+                    compacted[doc_id] = [(0, offset, length)]
+                    entries.write(json.dumps({"id": doc_id, "offset": offset, "length": length}) + "\n")
+                for f in (data, entries):
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            os.replace(tmp_path, self.path)
+            os.replace(tmp_index_path, self.index_path)
+            self._file.close()
+            logger.info(f"Compacted content store: {self._dead} bytes reclaimed, {len(index)} documents")
+            self._index = compacted
+            self._file = open(self.path, "ab")
+            self._size = self._file.seek(0, os.SEEK_END)
+            self._dead = 0
+            self._mmap = None  # Views handed out earlier keep the old mapping alive
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._mmap = None
+            self._index = None
+
+    @staticmethod
+    def to_byte_spans(text: str, spans: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        spans = list(spans)
+        if text.isascii():
+            return spans
+
+        # Encode each stretch between consecutive boundaries once, so conversion stays linear
+        offsets = {}
+        char_pos = byte_pos = 0
+        for boundary in sorted({pos for span in spans for pos in span}):
+            byte_pos += len(text[char_pos:boundary].encode("utf-8"))
+            char_pos = boundary
+            offsets[boundary] = byte_pos
+        return [(offsets[start], offsets[end]) for start, end in spans]
+
+    def _view(self, offset: int, length: int) -> memoryview:
+        if length == 0:
+            return memoryview(b"")
+        if self._mmap is None or offset + length > len(self._mmap):
+            # Remap after appends; the old map stays valid for views still being read
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)[offset:offset + length]
+
+    def _write(self, data: bytes) -> int:
+        offset = self._size
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        return offset
+
+    @staticmethod
+    def _length(pieces: List[Tuple[int, int, int]]) -> int:
+        position, _, length = pieces[-1]
+        return position + length
+
+    @staticmethod
+    def _add_piece(pieces: List[Tuple[int, int, int]], offset: int, length: int) -> None:
+        if pieces and pieces[-1][1] + pieces[-1][2] == offset:
+            # Written right after the previous piece: extend it instead of adding a new one
+            position, last_offset, last_length = pieces[-1]
+            pieces[-1] = (position, last_offset, last_length + length)
+        elif pieces:
+            pieces.append((ContentStore._length(pieces), offset, length))
+        else:
+            pieces.append((0, offset, length))
+
+    def _release(self, pieces: Optional[List[Tuple[int, int, int]]]) -> None:
+        if pieces:
+            self._dead += self._length(pieces)
+
+    def _maybe_compact(self) -> None:
+        # Only once dead bytes outweigh live ones, so rewriting stays linear in what was written
+        if self._dead >= self.compact_min_bytes and self._dead * 2 >= self._size:
+            self.compact()
+
+    def _recover_compaction(self) -> None:
+        tmp_path, tmp_index_path = f"{self.path}.tmp", f"{self.index_path}.tmp"
+        if os.path.exists(tmp_path):
+            # Crashed before the data file was swapped in; the old files are intact
+            os.remove(tmp_path)
+            if os.path.exists(tmp_index_path):
+                os.remove(tmp_index_path)
+        elif os.path.exists(tmp_index_path):
+            # The compacted data file is live; its index has to follow
+            os.replace(tmp_index_path, self.index_path)
+
+    def _load_index(self) -> Dict[str, List[Tuple[int, int, int]]]:
+        if self._index is not None:
+            return self._index
+
+        with self._lock:
+            if self._index is not None:
+                return self._index
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._recover_compaction()
+            index: Dict[str, List[Tuple[int, int, int]]] = {}
+            for entry in replay_journal(self.index_path):
+                if entry.get("deleted"):
+                    index.pop(entry["id"], None)
+                elif entry.get("append"):
+                    self._add_piece(index.setdefault(entry["id"], []), entry["offset"], entry["length"])
+                else:
+                    index[entry["id"]] = [(0, entry["offset"], entry["length"])]
+
+            self._file = open(self.path, "ab")
+            self._size = self._file.seek(0, os.SEEK_END)
+            self._dead = self._size - sum(self._length(pieces) for pieces in index.values())
+            self._index = index
+            return index
+
+    def _append_index(self, entry: dict) -> None:
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
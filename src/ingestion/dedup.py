@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .metadata_store import DocumentMetadataStore
+
+Owner = Tuple[str, int, Optional[int], Optional[int]]
+
+logger = logging.getLogger(__name__)
+
+
+def hash_content(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def hash_chunk(text: str) -> str:
+    # 128 bits is plenty to key chunk texts and keeps the per-document records small
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ChunkDeduplicator:
+    # Identical chunk texts share one embedding and one vector-store entry.
+    # Each document records which entry backs each of its chunks; an entry lives as long as it has owners.
+
+    def __init__(self, directory: str):
+        self.store = DocumentMetadataStore(directory)
+        self._vectors: Optional[Dict[str, str]] = None  # chunk hash -> vector id
+        # vector id -> chunks using it, as (doc id, chunk index, byte start, byte end)
+        self._owners: Dict[str, List[Owner]] = {}
+        self._lock = threading.RLock()
+        self.reused = 0
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.store
+
+    def assign(self, chunk_ids: Sequence[str], texts: Sequence[str]) -> Tuple[List[str], List[str], List[int]]:
+        # Returns each chunk's hash and vector id, plus the positions whose text has no entry yet
+        hashes = [hash_chunk(text) for text in texts]
+        vector_ids: List[str] = []
+        new_positions: List[int] = []
+        with self._lock:
+            known = self._load()
+            local: Dict[str, str] = {}
+            for i, (chunk_hash, chunk_id) in enumerate(zip(hashes, chunk_ids)):
+                vector_id = known.get(chunk_hash) or local.get(chunk_hash)
+                if vector_id is None:
+                    vector_id = local[chunk_hash] = chunk_id
+                    new_positions.append(i)
+                vector_ids.append(vector_id)
+            self.reused += len(hashes) - len(new_positions)
+        return hashes, vector_ids, new_positions
+
+    def commit(self, doc_id: str, hashes: Sequence[str], vector_ids: Sequence[Optional[str]],
+               spans: Optional[Sequence[Tuple[int, int]]] = None) -> None:
+        # A None vector id marks a chunk whose new entry failed to write; it is not shared.
+        # spans are the chunks' byte ranges in the content store, in chunk order.
+        with self._lock:
+            known = self._load()
+            record = {"hashes": list(hashes), "vector_ids": list(vector_ids)}
+            if spans is not None:
+                record["spans"] = [list(span) for span in spans]
+            self._add_owners(doc_id, record)
+            for chunk_hash, vector_id in zip(hashes, vector_ids):
+                if vector_id is not None:
+                    known.setdefault(chunk_hash, vector_id)
+            self.store.put(doc_id, record)
+
+    def spans(self, doc_id: str) -> Optional[List[Tuple[int, int]]]:
+        # A document's chunk byte ranges, in chunk order; None if they were not recorded
+        record = self.store.get(doc_id)
+        if record is None or "spans" not in record:
+            return None
+        return [tuple(span) for span in record["spans"]]
+
+    def owners(self, vector_id: str) -> List[Owner]:
+        # Every live chunk an entry stands for; the document that first wrote it may be gone
+        with self._lock:
+            self._load()
+            return list(self._owners.get(vector_id, ()))
+
+    def release(self, doc_id: str) -> Optional[List[str]]:
+        # Vector ids no other document uses any more; None if the document was never registered
+        with self._lock:
+            known = self._load()
+            record = self.store.get(doc_id)
+            if record is None:
+                return None
+            orphaned = []
+            for chunk_hash, vector_id in zip(record["hashes"], record["vector_ids"]):
+                if vector_id is None or vector_id not in self._owners:
+                    continue
+                owners = [owner for owner in self._owners[vector_id] if owner[0] != doc_id]
+                if owners:
+                    self._owners[vector_id] = owners
+                    continue
+                del self._owners[vector_id]
+                if known.get(chunk_hash) == vector_id:
+                    del known[chunk_hash]
+                orphaned.append(vector_id)
+            self.store.delete(doc_id)
+        return orphaned
+
+    def _load(self) -> Dict[str, str]:
+        if self._vectors is not None:
+            return self._vectors
+        vectors: Dict[str, str] = {}
+        for doc_id in self.store:
+            record = self.store.get(doc_id)
+            self._add_owners(doc_id, record)
+            for chunk_hash, vector_id in zip(record["hashes"], record["vector_ids"]):
+                if vector_id is not None:
+                    vectors.setdefault(chunk_hash, vector_id)
+        self._vectors = vectors
+        logger.info(f"Loaded chunk registry: {len(vectors)} unique chunks")
+        return vectors
+
+    def _add_owners(self, doc_id: str, record: dict) -> None:
+        # Records written before spans were kept resolve to no span
+        spans = record.get("spans") or [(None, None)] * len(record["vector_ids"])
+        for index, (vector_id, (start, end)) in enumerate(zip(record["vector_ids"], spans)):
+            if vector_id is not None:
+                self._owners.setdefault(vector_id, []).append((doc_id, index, start, end))
@@ -1,10 +1,18 @@
+import io
 import logging
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterator, Set, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
 
+from .chunker import DocumentChunker
+from .dedup import hash_content
+from .pdf_extractor import iter_pdf_pages
+
 logger = logging.getLogger(__name__)
 
 
@@ -15,122 +23,225 @@ class Document:
     doc_id: str
     source: str
     created_at: datetime = None
-    
+    content_hash: Optional[str] = None
+    spans: Optional[List[Tuple[int, int]]] = None  # Chunk spans, when the worker chunked the text
+    streamed: bool = False  # A PDF left for the caller to extract page by page; content is empty
+
     def __post_init__(self):
         if self.created_at is None:
             self.created_at = datetime.utcnow()
 
 
+def load_file(file_path: str, known_hash: Optional[str] = None,
+              chunk_params: Optional[Tuple[int, int, Optional[str]]] = None, stream_pdf: bool = False):
+    # Runs in a worker process: one read feeds both the content hash and the parser
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    content_hash = hash_content(content)
+    if content_hash == known_hash:
+        return content_hash, None, None
+    if stream_pdf and file_path.lower().endswith('.pdf'):
+        # Only hashed here; the caller parses the pages as it indexes them
+        return content_hash, "", None
+
+    text = DocumentLoader._load_file_content(Path(file_path).suffix.lower(), content)
+    spans = None
+    if chunk_params is not None:
+        # (chunk_size, chunk_overlap, tokenizer name); the tokenizer loads once per worker
+        spans = list(DocumentChunker(*chunk_params[:2], tokenizer=chunk_params[2]).iter_spans(text))
+    return content_hash, text, spans
+
+
 class DocumentLoader:
-    
+
     SUPPORTED_FORMATS = {'.pdf': 'pdf', '.docx': 'docx', '.txt': 'txt', '.md': 'markdown'}
-    
+
     def __init__(self, max_file_size_mb: int = 100):
         self.max_file_size_bytes = max_file_size_mb * 1024 * 1024
-    
-    def load_document(self, file_path: str) -> Optional[Document]:
+        self.stats = {"files": 0, "unchanged": 0, "loaded": 0, "failed": 0, "unreadable_dirs": 0}
+        self.seen_paths: Set[str] = set()  # Every supported file the last walk found, changed or not
+        self._stream_pdfs = False
+
+    def load_document(self, file_path: str, stat: Optional[os.stat_result] = None) -> Optional[Document]:
         path = Path(file_path)
-        
-        if not path.exists():
-            logger.error(f"File not found: {file_path}")
-            return None
-        
-        if path.stat().st_size > self.max_file_size_bytes:
+
+        if stat is None:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                logger.error(f"File not found: {file_path}")
+                return None
+
+        if stat.st_size > self.max_file_size_bytes:
             logger.error(f"File too large: {file_path}")
             return None
-        
+
         if path.suffix.lower() not in self.SUPPORTED_FORMATS:
             logger.error(f"Unsupported file format: {path.suffix}")
             return None
-        
+
         try:
-            content = self._load_file_content(path)
-            doc_id = self._generate_doc_id(file_path, content)
-            
-            metadata = {
-                "file_name": path.name,
-                "file_path": str(path),
-                "file_size_bytes": path.stat().st_size,
-                "file_format": path.suffix.lower(),
-                "created_at": datetime.fromtimestamp(path.stat().st_ctime),
-                "modified_at": datetime.fromtimestamp(path.stat().st_mtime),
-            }
-            
-            return Document(
-                content=content,
-                metadata=metadata,
-                doc_id=doc_id,
-                source=str(path)
-            )
+            content_hash, content, _ = load_file(str(path))
+            return self._build_document(str(path), stat, content_hash, content)
         except Exception as e:
             logger.error(f"Error loading document {file_path}: {str(e)}")
             return None
-    
-    def load_documents(self, directory: str, recursive: bool = True) -> List[Document]:
-        documents = []
-        path = Path(directory)
-        
-        if not path.exists():
-            logger.error(f"Directory not found: {directory}")
-            return documents
-        
-        pattern = "**/*" if recursive else "*"
-        
-        for file_path in path.glob(pattern):
-            if file_path.is_file() and file_path.suffix.lower() in self.SUPPORTED_FORMATS:
-                doc = self.load_document(str(file_path))
-                if doc:
-                    documents.append(doc)
-                    logger.info(f"Loaded document: {file_path.name}")
-        
+
+    def load_documents(self, directory: str, recursive: bool = True,
+                       max_workers: Optional[int] = None) -> List[Document]:
+        documents = list(self.iter_documents(directory, recursive, max_workers=max_workers))
         logger.info(f"Loaded {len(documents)} documents from {directory}")
         return documents
-    
+
+    def iter_files(self, directory: str, recursive: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+        # scandir hands back each entry's type for free; regular files are stat'ed exactly once
+        stack = [os.path.abspath(directory)]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError as e:
+                logger.warning(f"Cannot read directory: {e}")
+                self.stats["unreadable_dirs"] += 1
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif os.path.splitext(entry.name)[1].lower() in self.SUPPORTED_FORMATS:
+                        stat = entry.stat()
+                        if stat.st_size > self.max_file_size_bytes:
+                            logger.error(f"File too large: {entry.path}")
+                            continue
+                        yield entry.path, stat
+
+    def iter_documents(self, directory: str, recursive: bool = True, manifest=None,
+                       max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                       chunk_params: Optional[Tuple[int, int, Optional[str]]] = None,
+                       stream_pdfs: bool = False) -> Iterator[Document]:
+        # Documents are yielded as workers finish them; at most max_in_flight files are held at once.
+        # With stream_pdfs, PDFs come back unparsed (Document.streamed) so their text is never joined whole.
+        self.stats = {"files": 0, "unchanged": 0, "loaded": 0, "failed": 0, "unreadable_dirs": 0}
+        self.seen_paths = set()
+        self._stream_pdfs = stream_pdfs
+        if not os.path.isdir(directory):
+            logger.error(f"Directory not found: {directory}")
+            self.stats["unreadable_dirs"] += 1
+            return
+
+        files = self._changed_files(self.iter_files(directory, recursive), manifest)
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers <= 1:
+            for path, stat in files:
+                known_hash = manifest.known_hash(path) if manifest is not None else None
+                document = self._collect(path, stat, manifest, lambda: load_file(path, known_hash, chunk_params, stream_pdfs))
+                if document is not None:
+                    yield document
+            return
+
+        max_in_flight = max_in_flight or max_workers * 4
+        # Spawned workers do not inherit the caller's threads or loaded models
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        pending: Dict[Future, Tuple[str, os.stat_result]] = {}
+        try:
+            for path, stat in files:
+                known_hash = manifest.known_hash(path) if manifest is not None else None
+                pending[executor.submit(load_file, path, known_hash, chunk_params, stream_pdfs)] = (path, stat)
+                if len(pending) >= max_in_flight:
+                    yield from self._drain(pending, manifest)
+            while pending:
+                yield from self._drain(pending, manifest)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        logger.info(
+            f"Directory {directory}: {self.stats['loaded']} loaded, {self.stats['unchanged']} unchanged, "
+            f"{self.stats['failed']} failed of {self.stats['files']} files"
+        )
+
+    def _changed_files(self, files: Iterator[Tuple[str, os.stat_result]], manifest) -> Iterator[Tuple[str, os.stat_result]]:
+        for path, stat in files:
+            self.stats["files"] += 1
+            self.seen_paths.add(path)
+            if manifest is not None and manifest.is_unchanged(path, stat):
+                self.stats["unchanged"] += 1
+                continue
+            yield path, stat
+
+    def _drain(self, pending: Dict[Future, Tuple[str, os.stat_result]], manifest) -> Iterator[Document]:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path, stat = pending.pop(future)
+            document = self._collect(path, stat, manifest, future.result)
+            if document is not None:
+                yield document
+
+    def _collect(self, path: str, stat: os.stat_result, manifest, result) -> Optional[Document]:
+        try:
+            content_hash, content, spans = result()
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"Error loading document {path}: {str(e)}")
+            return None
+
+        if content is None:
+            # Touched but byte-identical: the indexed version is still current
+            self.stats["unchanged"] += 1
+            manifest.touch(path, stat)
+            return None
+
+        self.stats["loaded"] += 1
+        document = self._build_document(path, stat, content_hash, content, spans)
+        document.streamed = self._stream_pdfs and document.metadata["file_format"] == '.pdf'
+        return document
+
+    def _build_document(self, path: str, stat: os.stat_result, content_hash: str, content: str,
+                        spans: Optional[List[Tuple[int, int]]] = None) -> Document:
+        metadata = {
+            "file_name": os.path.basename(path),
+            "file_path": path,
+            "file_size_bytes": stat.st_size,
+            "file_format": os.path.splitext(path)[1].lower(),
+            "created_at": datetime.fromtimestamp(stat.st_ctime),
+            "modified_at": datetime.fromtimestamp(stat.st_mtime),
+            "mtime_ns": stat.st_mtime_ns,
+        }
+        return Document(
+            content=content,
+            metadata=metadata,
+            doc_id=self._generate_doc_id(path, content_hash),
+            source=path,
+            content_hash=content_hash,
+            spans=spans
+        )
+
     @staticmethod
-    def _load_file_content(file_path: Path) -> str:
-        suffix = file_path.suffix.lower()
-        
+    def _load_file_content(suffix: str, content: bytes) -> str:
         if suffix == '.txt' or suffix == '.md':
-            return file_path.read_text(encoding='utf-8')
+            return content.decode('utf-8')
         elif suffix == '.pdf':
-            return DocumentLoader._load_pdf(str(file_path))
+            return DocumentLoader._load_pdf(io.BytesIO(content))
         elif suffix == '.docx':
-            return DocumentLoader._load_docx(str(file_path))
+            return DocumentLoader._load_docx(io.BytesIO(content))
         else:
             raise ValueError(f"Unsupported file format: {suffix}")
-    
+
     @staticmethod
-    def _load_pdf(file_path: str) -> str:
-        try:
-            import PyPDF2
-            text = []
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    text.append(page.extract_text())
-            return '\n'.join(text)
-        except ImportError:
-            logger.warning("PyPDF2 not installed, trying pdfplumber")
-            try:
-                import pdfplumber
-                text = []
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        text.append(page.extract_text())
-                return '\n'.join(text)
-            except ImportError:
-                raise ImportError("Please install PyPDF2 or pdfplumber to load PDF files")
-    
+    def _load_pdf(stream: io.BytesIO) -> str:
+        # Pages are parsed one at a time (PyPDF2, else pdfplumber)
+        return '\n'.join(iter_pdf_pages(stream))
+
     @staticmethod
-    def _load_docx(file_path: str) -> str:
+    def _load_docx(stream: io.BytesIO) -> str:
         try:
             from docx import Document as DocxDocument
-            doc = DocxDocument(file_path)
+            doc = DocxDocument(stream)
             return '\n'.join([para.text for para in doc.paragraphs])
         except ImportError:
             raise ImportError("Please install python-docx to load DOCX files")
-    
+
     @staticmethod
-    def _generate_doc_id(file_path: str, content: str) -> str:
-        combined = f"{file_path}{len(content)}"
+    def _generate_doc_id(file_path: str, content_hash: str) -> str:
+        # A new version of a file gets a new id, so its old chunks can be replaced rather than merged
+        combined = f"{file_path}{content_hash}"
         return hashlib.md5(combined.encode()).hexdigest()
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+from typing import List, AsyncIterator, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchEmbeddingStage:
+
+    def __init__(self, encoder, batch_size: int = 100):
+        self.encoder = encoder
+        self.batch_size = max(1, batch_size)
+
+    async def run(self, texts: List[str]) -> AsyncIterator[Tuple[int, int, np.ndarray]]:
+        if not texts:
+            return
+
+        batches = [(start, min(start + self.batch_size, len(texts))) for start in range(0, len(texts), self.batch_size)]
+        pending = asyncio.create_task(asyncio.to_thread(self._encode, texts[batches[0][0]:batches[0][1]]))
+
+        try:
+            for i, (start, end) in enumerate(batches):
+                embeddings = await pending
+
+                # Start encoding the next batch before handing this one to the consumer,
+                # so model inference overlaps with the vector store write
+                if i + 1 < len(batches):
+                    next_start, next_end = batches[i + 1]
+                    pending = asyncio.create_task(asyncio.to_thread(self._encode, texts[next_start:next_end]))
+
+                logger.debug(f"Encoded batch {start}-{end}/{len(texts)}")
+                yield start, end, embeddings
+        finally:
+            if not pending.done():
+                pending.cancel()
+
+    def _encode(self, batch: List[str]) -> np.ndarray:
+        embeddings = self.encoder.encode(batch, batch_size=self.batch_size, convert_to_numpy=True)
+        return np.asarray(embeddings, dtype=np.float32)
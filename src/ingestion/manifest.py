@@ -0,0 +1,61 @@
+import logging
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from .metadata_store import DocumentMetadataStore
+
+logger = logging.getLogger(__name__)
+
+
+class IngestManifest:
+    # One record per source file: the size, mtime and content hash of the version last indexed
+
+    def __init__(self, directory: str):
+        self.store = DocumentMetadataStore(directory)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.store
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(path)
+
+    def is_unchanged(self, path: str, stat: os.stat_result) -> bool:
+        # Same size and mtime means the file was not rewritten; nothing is read
+        record = self.store.get(path)
+        return (record is not None and record.get("size") == stat.st_size
+                and record.get("mtime_ns") == stat.st_mtime_ns)
+
+    def known_hash(self, path: str) -> Optional[str]:
+        record = self.store.get(path)
+        return record.get("content_hash") if record else None
+
+    def record(self, document) -> None:
+        # Called only once the document is indexed, so a crash mid-file retries it next run
+        self.store.put(document.source, {
+            "size": document.metadata["file_size_bytes"],
+            "mtime_ns": document.metadata["mtime_ns"],
+            "content_hash": document.content_hash,
+            "doc_id": document.doc_id
+        })
+
+    def touch(self, path: str, stat: os.stat_result) -> None:
+        # Rewritten with identical bytes: refresh the stat so the next run skips it without hashing
+        self.store.update(path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+
+    def forget(self, path: str) -> None:
+        self.store.delete(path)
+
+    def missing(self, directory: str, seen: Set[str], recursive: bool = True) -> List[str]:
+        # Recorded files under directory that a complete walk of it no longer found
+        root = os.path.abspath(directory)
+        prefix = os.path.join(root, "")
+        return [
+            path for path in self.store
+            if path.startswith(prefix) and path not in seen and (recursive or os.path.dirname(path) == root)
+        ]
+
+    def close(self) -> None:
+        self.store.close()
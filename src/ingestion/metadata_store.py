@@ -0,0 +1,231 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def replay_journal(path: str) -> Iterator[Dict[str, Any]]:
+    # Yields each complete JSON-lines entry. A torn tail (crash mid-write) is cut off at the
+    # last good entry, so later appends start on a clean line instead of after the torn bytes.
+    if not os.path.exists(path):
+        return
+    good_end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            good_end += len(line)
+            yield entry
+        torn = f.seek(0, os.SEEK_END) - good_end
+    if torn:
+        logger.warning(f"Truncating {torn} bytes of torn journal entries from {path}")
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+
+
+class DocumentMetadataStore:
+
+    SNAPSHOT_FILE = "metadata.snapshot.json"
+    JOURNAL_FILE = "metadata.journal"
+    LEGACY_FILE = "metadata.json"
+
+    def __init__(self, directory: str, compact_every: int = 1000, fsync: bool = False,
+                 on_legacy_content: Optional[Callable[[str, str], Any]] = None,
+                 indexed_fields: Iterable[str] = ()):
+        self.directory = directory
+        self.on_legacy_content = on_legacy_content
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, self.JOURNAL_FILE)
+        self._records: Optional[Dict[str, Dict[str, Any]]] = None
+        self._transient: Dict[str, Dict[str, Any]] = {}
+        self._journal = None
+        self._journal_entries = 0
+        # Secondary indexes: field -> value -> ids of the records holding it
+        self._indexes: Dict[str, Dict[Any, Set[str]]] = {field: {} for field in indexed_fields}
+        self._lock = threading.RLock()
+
+    # Mapping-style read access; persisted records are loaded on first use, not at import time
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._transient or doc_id in self._load()
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        record = self.get(doc_id)
+        if record is None:
+            raise KeyError(doc_id)
+        return record
+
+    def __len__(self) -> int:
+        return len(self._merged())
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._merged()))
+
+    def get(self, doc_id: str, default: Any = None) -> Any:
+        record = self._transient.get(doc_id)
+        if record is None:
+            record = self._load().get(doc_id)
+        return dict(record) if record is not None else default
+
+    def values(self) -> List[Dict[str, Any]]:
+        return [dict(record) for record in self._merged().values()]
+
+    def find(self, field: str, value: Any) -> Optional[str]:
+        # Any one record whose indexed field equals value, without scanning every record
+        self._load()
+        doc_ids = self._indexes[field].get(value)
+        return next(iter(doc_ids)) if doc_ids else None
+
+    def put(self, doc_id: str, record: Dict[str, Any], persist: bool = True) -> None:
+        with self._lock:
+            self._reindex(doc_id, self.get(doc_id), record)
+            if persist:
+                self._transient.pop(doc_id, None)
+                self._load()[doc_id] = dict(record)
+                self._append({"op": "put", "id": doc_id, "record": record})
+            else:
+                # Transient records (e.g. built-in sample documents) never touch the journal
+                self._transient[doc_id] = dict(record)
+
+    def update(self, doc_id: str, **fields) -> None:
+        with self._lock:
+            if self._indexes:
+                old = self.get(doc_id)
+                self._reindex(doc_id, old, {**(old or {}), **fields})
+            if doc_id in self._transient:
+                self._transient[doc_id].update(fields)
+                return
+            self._load()[doc_id].update(fields)
+            self._append({"op": "update", "id": doc_id, "fields": fields})
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            self._reindex(doc_id, self.get(doc_id), None)
+            if self._transient.pop(doc_id, None) is None:
+                self._load().pop(doc_id, None)
+                self._append({"op": "delete", "id": doc_id})
+
+    def compact(self) -> None:
+        with self._lock:
+            records = self._load()
+            self._atomic_write(self.snapshot_path, json.dumps(records))
+
+            # The snapshot now covers every journal entry, so the journal starts over
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_path, "w", encoding="utf-8")
+            self._journal_entries = 0
+            logger.info(f"Compacted metadata store: {len(records)} documents")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _merged(self) -> Dict[str, Dict[str, Any]]:
+        return {**self._load(), **self._transient}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._records is not None:
+            return self._records
+
+        with self._lock:
+            if self._records is not None:
+                return self._records
+
+            os.makedirs(self.directory, exist_ok=True)
+            records: Dict[str, Dict[str, Any]] = {}
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+
+            replayed = 0
+            for entry in replay_journal(self.journal_path):
+                self._apply(records, entry)
+                replayed += 1
+
+            self._records = records
+            self._journal_entries = replayed
+            self._migrate_legacy()
+            for doc_id, record in records.items():
+                self._reindex(doc_id, None, record)
+            logger.info(f"Loaded metadata for {len(records)} documents ({replayed} journal entries)")
+            return records
+
+    def _migrate_legacy(self) -> None:
+        # Legacy records embed the full text; it is handed to the content store callback
+        legacy_path = os.path.join(self.directory, self.LEGACY_FILE)
+        if not os.path.exists(legacy_path):
+            return
+
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.warning(f"Failed to migrate legacy metadata: {e}")
+            return
+
+        for doc_id, record in legacy.items():
+            content = record.pop("content", None)
+            if content and self.on_legacy_content is not None:
+                self.on_legacy_content(doc_id, content)
+                record.setdefault("text_length", len(content))
+            self._records[doc_id] = record
+        self.compact()
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        logger.info(f"Migrated {len(legacy)} documents from {self.LEGACY_FILE}")
+
+    def _reindex(self, doc_id: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        for field, index in self._indexes.items():
+            old_value = old.get(field) if old else None
+            new_value = new.get(field) if new else None
+            if old_value == new_value:
+                continue
+            if old_value is not None:
+                doc_ids = index.get(old_value)
+                if doc_ids is not None:
+                    doc_ids.discard(doc_id)
+                    if not doc_ids:
+                        del index[old_value]
+            if new_value is not None:
+                index.setdefault(new_value, set()).add(doc_id)
+
+    @staticmethod
+    def _apply(records: Dict[str, Dict[str, Any]], entry: Dict[str, Any]) -> None:
+        op, doc_id = entry.get("op"), entry.get("id")
+        if op == "put":
+            records[doc_id] = entry["record"]
+        elif op == "update" and doc_id in records:
+            records[doc_id].update(entry["fields"])
+        elif op == "delete":
+            records.pop(doc_id, None)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+        self._journal_entries += 1
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    @staticmethod
+    def _atomic_write(path: str, data: str) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,47 @@
+import logging
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pages parsed per worker task; small enough that the first pages reach chunking quickly
+PDF_PAGES_PER_TASK = 16
+
+
+def pdf_page_count(source) -> int:
+    try:
+        import PyPDF2
+        return len(PyPDF2.PdfReader(source).pages)
+    except ImportError:
+        with _open_pdfplumber(source) as pdf:
+            return len(pdf.pages)
+
+
+def iter_pdf_pages(source, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    # One page is parsed at a time, so only the current page's text is held
+    try:
+        import PyPDF2
+    except ImportError:
+        logger.warning("PyPDF2 not installed, trying pdfplumber")
+        with _open_pdfplumber(source) as pdf:
+            for page in pdf.pages[start:end]:
+                yield page.extract_text() or ""
+                page.flush_cache()
+        return
+
+    reader = PyPDF2.PdfReader(source)
+    end = len(reader.pages) if end is None else min(end, len(reader.pages))
+    for number in range(start, end):
+        yield reader.pages[number].extract_text() or ""
+
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process: each worker opens the file itself and parses only its page range
+    return list(iter_pdf_pages(file_path, start, end))
+
+
+def _open_pdfplumber(source):
+    try:
+        import pdfplumber
+    except ImportError:
+        raise ImportError("Please install PyPDF2 or pdfplumber to load PDF files")
+    return pdfplumber.open(source)
@@ -0,0 +1,159 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .chunker import DocumentChunker
+from .pdf_extractor import PDF_PAGES_PER_TASK, extract_pdf_pages, iter_pdf_pages, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+
+def extract_text(content: bytes, file_ext: str) -> Tuple[str, int]:
+    if file_ext == '.pdf':
+        pages = list(iter_pdf_pages(io.BytesIO(content)))
+        text_content = "\n\n".join(pages)
+        total_pages = len(pages)
+        logger.info(f"PDF: {total_pages} pages extracted")
+
+    elif file_ext in ['.docx', '.doc']:
+        import docx
+        doc = docx.Document(io.BytesIO(content))
+        text_content = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
+        total_pages = len(doc.paragraphs)
+        logger.info(f"DOCX: {total_pages} paragraphs extracted")
+
+    elif file_ext in ['.txt', '.md']:
+        text_content = content.decode('utf-8')
+        total_pages = 1
+    else:
+        text_content = content.decode('utf-8', errors='ignore')
+        total_pages = 1
+
+    return text_content, total_pages
+
+
+def extract_and_chunk(file_path: str, file_ext: str, chunk_size: int, chunk_overlap: int,
+                      tokenizer_name: Optional[str] = None) -> Tuple[str, int, List[Tuple[int, int]]]:
+    # Runs in a worker process: reads the saved upload itself so only the path crosses the process boundary
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    text, pages = extract_text(content, file_ext)
+    # The tokenizer is named rather than passed so it loads once per worker process
+    chunker = DocumentChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=tokenizer_name)
+    spans = list(chunker.iter_spans(text))
+    return text, pages, spans
+
+
+class IngestionPipeline:
+
+    STAGES = ("saving", "extracting", "indexing", "embedding")
+
+    def __init__(self, metadata_store, max_workers: Optional[int] = None):
+        self.metadata_store = metadata_store
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def initial_stages(cls) -> Dict[str, Dict[str, Any]]:
+        return {name: {"status": "pending", "progress": 0} for name in cls.STAGES}
+
+    @classmethod
+    def overall_progress(cls, stages: Dict[str, Dict[str, Any]]) -> float:
+        if not stages:
+            return 0
+        return sum(stages.get(name, {}).get("progress", 0) for name in cls.STAGES) / len(cls.STAGES)
+
+    def start(self, job_id: str, job: Awaitable) -> str:
+        task = asyncio.get_running_loop().create_task(self._run(job_id, job))
+        self._jobs[job_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(job_id, None))
+        return job_id
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._jobs
+
+    async def run_in_process(self, fn: Callable, *args) -> Any:
+        if self._executor is None:
+            # Spawned workers do not inherit the server's threads or loaded models
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    @asynccontextmanager
+    async def stage(self, doc_id: str, name: str):
+        self._set_stage(doc_id, name, status="running", progress=0)
+        try:
+            yield lambda progress: self._set_stage(doc_id, name, progress=min(progress, 100))
+        except Exception as e:
+            self._set_stage(doc_id, name, status="error")
+            self.metadata_store.update(doc_id, status="error", error=str(e))
+            raise
+        self._set_stage(doc_id, name, status="done", progress=100)
+
+    async def stream_pdf_pages(self, file_path: str,
+                               pages_per_task: int = PDF_PAGES_PER_TASK) -> AsyncIterator[Tuple[int, int, int, List[str]]]:
+        # Page ranges parse in parallel worker processes but are yielded in page order,
+        # so the caller can chunk and embed the first pages while later ones are still parsing
+        total_pages = await asyncio.to_thread(pdf_page_count, file_path)
+        ranges = iter([(start, min(start + pages_per_task, total_pages))
+                       for start in range(0, total_pages, pages_per_task)])
+        # Bounded look-ahead keeps at most a few ranges of parsed text in memory
+        window = max(2, (self.max_workers or os.cpu_count() or 1) * 2)
+        pending = deque()
+
+        def submit():
+            page_range = next(ranges, None)
+            if page_range is not None:
+                pending.append((page_range, asyncio.ensure_future(
+                    self.run_in_process(extract_pdf_pages, file_path, *page_range)
+                )))
+
+        for _ in range(window):
+            submit()
+        try:
+            while pending:
+                (start, end), task = pending.popleft()
+                pages = await task
+                submit()
+                yield start, end, total_pages, pages
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    def skip_stage(self, doc_id: str, name: str) -> None:
+        self._set_stage(doc_id, name, status="skipped", progress=100)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, job_id: str, job: Awaitable) -> None:
+        try:
+            await job
+        except asyncio.CancelledError:
+            logger.warning(f"Ingestion job {job_id} cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}", exc_info=True)
+
+    def _set_stage(self, doc_id: str, name: str, **fields) -> None:
+        record = self.metadata_store.get(doc_id)
+        if record is None:
+            return
+        stages = dict(record.get("stages") or self.initial_stages())
+        stages[name] = {**stages.get(name, {}), **fields}
+        self.metadata_store.update(doc_id, stage=name, stages=stages)
@@ -27,13 +27,16 @@ logger = logging.getLogger(__name__)
 def _prewarm_services():
     """Pre-load heavy services so first request is fast."""
     try:
-        from src.api.routes import get_embedding_service, get_vector_store, get_llm_client
+        from src.api.routes import get_embedding_service, get_vector_store, get_reranker
         logger.info("Pre-warming: embedding model...")
         get_embedding_service()
         logger.info("Pre-warming: vector store...")
         get_vector_store()
-        logger.info("Pre-warming: LLM client...")
-        get_llm_client()
+        if get_settings().enable_reranking:
+            logger.info("Pre-warming: reranker...")
+            reranker = get_reranker()
+            if reranker != "fallback":
+                reranker.warm_up()
         logger.info("Pre-warming complete")
     except Exception as e:
         logger.warning(f"Pre-warming failed (non-fatal): {e}")
@@ -49,10 +52,33 @@ async def lifespan(app: FastAPI):
     warmup_thread = threading.Thread(target=_prewarm_services, daemon=True)
     warmup_thread.start()
     
+    from src.api.routes import get_llm_client, close_llm_client, ingestion_pipeline, load_sample_documents_when_ready
+    from src.api.routes import cache_manager
+    
+    # Expired query and rerank entries are dropped in the background, not only when read again
+    sweep_interval = get_settings().cache_sweep_interval_seconds
+    if sweep_interval:
+        cache_manager.start_sweeper(sweep_interval)
+    
+    # The LLM client is async and must be created on the serving event loop
+    llm_warmup = asyncio.create_task(get_llm_client())
+    
+    # Sample documents are kept in memory only; uploaded documents load lazily from the journal
+    sample_loading = asyncio.create_task(load_sample_documents_when_ready())
+    
     logger.info("Application startup complete - ready to accept requests")
     yield
     # Shutdown
     logger.info("Application shutdown")
+    llm_warmup.cancel()
+    sample_loading.cancel()
+    await ingestion_pipeline.shutdown()
+    await close_llm_client()
+    cache_manager.stop()
+    from src.api.routes import vector_store
+    if vector_store not in (None, "fallback"):
+        # Shutdown folds the appended delta segment into a fresh base snapshot
+        await asyncio.to_thread(vector_store.persist, compact=True)
 
 
 def create_app(settings: Settings = None) -> FastAPI:
@@ -1,5 +1,7 @@
 """RAG chain and retrieval logic."""
 from .retriever import HybridRetriever
 from .reranker import DocumentReranker
+from .bm25 import BM25Index
+from .query_cache import QueryResultCache
 
-__all__ = ["HybridRetriever", "DocumentReranker"]
+__all__ = ["HybridRetriever", "DocumentReranker", "BM25Index", "QueryResultCache"]
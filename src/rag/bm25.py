@@ -0,0 +1,209 @@
+import logging
+import math
+import re
+import heapq
+import threading
+from bisect import bisect_left
+from array import array
+from typing import List, Dict, Any, Set, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class _PostingCursor:
+    __slots__ = ("docs", "tfs", "pos", "idf", "upper_bound")
+
+    def __init__(self, docs: array, tfs: array, idf: float, upper_bound: float):
+        self.docs = docs
+        self.tfs = tfs
+        self.pos = 0
+        self.idf = idf
+        self.upper_bound = upper_bound
+
+    @property
+    def doc(self) -> int:
+        return self.docs[self.pos] if self.pos < len(self.docs) else -1
+
+    def advance_to(self, target: int) -> None:
+        self.pos = bisect_left(self.docs, target, self.pos)
+
+
+class BM25Index:
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._doc_ids: List[str] = []
+        self._payloads: List[Any] = []
+        self._doc_lengths = array('I')
+        self._id_to_index: Dict[str, int] = {}
+        self._total_length = 0
+        self._idf_cache: Dict[str, float] = {}
+        self._removed: Set[int] = set()  # Tombstoned internal ids, skipped at scoring time
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_ids) - len(self._removed)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._id_to_index
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self._total_length / len(self) if len(self) else 0.0
+
+    def add(self, doc_id: str, text: str, payload: Any = None) -> None:
+        self.add_many([(doc_id, text, payload)])
+
+    def add_many(self, documents: Iterable[Tuple[str, str, Any]]) -> int:
+        added = 0
+        with self._lock:
+            # Internal ids are dense and assigned in insertion order, so postings stay sorted
+            for doc_id, text, payload in documents:
+                if doc_id in self._id_to_index:
+                    continue
+
+                index = len(self._doc_ids)
+                terms = tokenize(text)
+                term_freqs: Dict[str, int] = {}
+                for term in terms:
+                    term_freqs[term] = term_freqs.get(term, 0) + 1
+
+                for term, tf in term_freqs.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = (array('I'), array('I'))
+                        self._postings[term] = postings
+                    postings[0].append(index)
+                    postings[1].append(tf)
+
+                self._doc_ids.append(doc_id)
+                self._payloads.append(payload)
+                self._doc_lengths.append(len(terms))
+                self._id_to_index[doc_id] = index
+                self._total_length += len(terms)
+                added += 1
+
+            if added:
+                # N changed, so every cached IDF is stale
+                self._idf_cache.clear()
+
+        if added:
+            logger.debug(f"BM25 index: added {added} documents ({len(self)} total)")
+        return added
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            # Postings are append-only arrays; removed documents stay in them as tombstones
+            for doc_id in doc_ids:
+                index = self._id_to_index.pop(doc_id, None)
+                if index is None:
+                    continue
+                self._removed.add(index)
+                self._payloads[index] = None
+                self._total_length -= self._doc_lengths[index]
+                removed += 1
+
+            if removed:
+                self._idf_cache.clear()
+        return removed
+
+    def idf(self, term: str) -> float:
+        cached = self._idf_cache.get(term)
+        if cached is not None:
+            return cached
+
+        postings = self._postings.get(term)
+        # Tombstones still count towards df until the index is rebuilt; N counts live documents only
+        n = len(self)
+        df = min(len(postings[0]), n) if postings else 0
+        value = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        self._idf_cache[term] = value
+        return value
+
+    def search(self, query: str, top_k: int = 5, normalize: bool = False) -> List[Tuple[str, float, Any]]:
+        if top_k <= 0:
+            return []
+
+        with self._lock:
+            if not len(self):
+                return []
+
+            cursors = []
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term)
+                # tf * (k1 + 1) / (tf + norm) is bounded by (k1 + 1)
+                cursors.append(_PostingCursor(postings[0], postings[1], idf, idf * (self.k1 + 1)))
+
+            if not cursors:
+                return []
+
+            hits = self._wand(cursors, top_k)
+            hits.sort(key=lambda x: (-x[0], x[1]))
+
+            # Optionally scale into [0, 1] by the best score any document could reach for this query
+            scale = 1.0 / sum(c.upper_bound for c in cursors) if normalize else 1.0
+            return [(self._doc_ids[index], score * scale, self._payloads[index]) for score, index in hits]
+
+    def _wand(self, cursors: List[_PostingCursor], top_k: int) -> List[Tuple[float, int]]:
+        k1 = self.k1
+        b = self.b
+        avgdl = self.avg_doc_length or 1.0
+        doc_lengths = self._doc_lengths
+        removed = self._removed
+
+        heap: List[Tuple[float, int]] = []
+        threshold = 0.0
+
+        while True:
+            cursors = [c for c in cursors if c.doc != -1]
+            if not cursors:
+                break
+            cursors.sort(key=lambda c: c.doc)
+
+            # Find the pivot: first cursor where accumulated upper bounds beat the threshold
+            accumulated = 0.0
+            pivot = -1
+            for i, cursor in enumerate(cursors):
+                accumulated += cursor.upper_bound
+                if accumulated > threshold:
+                    pivot = i
+                    break
+            if pivot == -1:
+                break
+
+            pivot_doc = cursors[pivot].doc
+            if cursors[0].doc == pivot_doc:
+                norm = k1 * (1 - b + b * doc_lengths[pivot_doc] / avgdl)
+                score = 0.0
+                for cursor in cursors:
+                    if cursor.doc != pivot_doc:
+                        break
+                    tf = cursor.tfs[cursor.pos]
+                    score += cursor.idf * tf * (k1 + 1) / (tf + norm)
+                    cursor.pos += 1
+
+                if pivot_doc in removed:
+                    continue
+                if len(heap) < top_k:
+                    heapq.heappush(heap, (score, pivot_doc))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, pivot_doc))
+                if len(heap) == top_k:
+                    threshold = heap[0][0]
+            else:
+                for cursor in cursors[:pivot]:
+                    cursor.advance_to(pivot_doc)
+
+        return heap
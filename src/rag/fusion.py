@@ -0,0 +1,61 @@
+import logging
+from typing import Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ("rrf", "combsum", "combmnz")
+
+RankedList = Tuple[np.ndarray, np.ndarray]
+
+
+def min_max_normalize(scores: np.ndarray) -> np.ndarray:
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 0:
+        # A list of equal scores carries no ordering signal; treat every entry as a full match
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def fuse(ranked_lists: Sequence[RankedList], weights: Optional[Sequence[float]] = None,
+         method: str = "rrf", k: int = 60, normalize: bool = True) -> RankedList:
+    # Each list is (ids, scores) ordered best first; the result uses the same shape
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method: {method}")
+    if weights is None:
+        weights = [1.0] * len(ranked_lists)
+    if len(weights) != len(ranked_lists):
+        raise ValueError("One weight is required per ranked list")
+
+    lists = [
+        (np.asarray(ids), np.asarray(scores, dtype=np.float64), weight)
+        for (ids, scores), weight in zip(ranked_lists, weights)
+    ]
+    lists = [entry for entry in lists if entry[0].size]
+    if not lists:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.float64)
+
+    # One flat array per quantity; candidates are then aggregated with bincount, not per-item Python
+    all_ids = np.concatenate([ids for ids, _, _ in lists])
+    if method == "rrf":
+        contributions = np.concatenate([
+            weight / (k + np.arange(1, ids.size + 1, dtype=np.float64))
+            for ids, _, weight in lists
+        ])
+    else:
+        contributions = np.concatenate([
+            weight * (min_max_normalize(scores) if normalize else scores)
+            for _, scores, weight in lists
+        ])
+
+    unique_ids, first_index, inverse = np.unique(all_ids, return_index=True, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions, minlength=unique_ids.size)
+    if method == "combmnz":
+        fused *= np.bincount(inverse, minlength=unique_ids.size)
+
+    # Ties keep the order in which candidates were first seen
+    order = np.lexsort((first_index, -fused))
+    return unique_ids[order], fused[order]
@@ -1,14 +1,23 @@
 import logging
-from typing import List, Dict, Any, Set
+from typing import List, Dict, Any, Set, Optional, Callable, Tuple
 import re
+import numpy as np
+
+from .bm25 import BM25Index
+from .fusion import fuse
 
 logger = logging.getLogger(__name__)
 
 
 class HybridRetriever:
     
-    def __init__(self, alpha: float = 0.7):
+    def __init__(self, alpha: float = 0.7, bm25_index: Optional[BM25Index] = None,
+                 chunk_text: Optional[Callable[[Dict[str, Any]], str]] = None, fusion_method: str = "rrf"):
         self.alpha = alpha
+        self.fusion_method = fusion_method
+        self.bm25_index = bm25_index
+        # Resolves a chunk's text when chunks are stored as spans rather than strings
+        self.chunk_text = chunk_text or (lambda chunk: chunk['content'])
     
     def retrieve(self, query: str, semantic_results: List[Dict[str, Any]], 
                  all_chunks: List[Dict[str, Any]], top_k: int = 5) -> List[Dict[str, Any]]:
@@ -26,6 +35,9 @@ class HybridRetriever:
     
     def _keyword_search(self, query: str, chunks: List[Dict[str, Any]], 
                        top_k: int) -> List[Dict[str, Any]]:
+        if self.bm25_index is not None:
+            return self._bm25_search(query, top_k)
+        
         query_terms = set(self._tokenize(query.lower()))
         scores = []
         
@@ -52,26 +64,46 @@ class HybridRetriever:
         scores.sort(key=lambda x: x['score'], reverse=True)
         return scores[:top_k]
     
+    def _bm25_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        results = []
+        for chunk_id, score, chunk in self.bm25_index.search(query, top_k, normalize=True):
+            results.append({
+                "id": chunk_id,
+                "score": score,
+                "text": self.chunk_text(chunk),
+                "metadata": {
+                    "filename": chunk.get('filename', ''),
+                    "chunk_index": chunk.get('index', 0)
+                }
+            })
+        return results
+    
+    def fuse(self, semantic_lists: List[List[Dict]], keyword_lists: List[List[Dict]],
+             top_k: int = 5, k: int = 60) -> List[Dict]:
+        # Multi-query mode: one semantic and one keyword list per query variant
+        weighted = [(results, self.alpha) for results in semantic_lists]
+        weighted += [(results, 1 - self.alpha) for results in keyword_lists]
+        return self._fuse_ranked_lists(weighted, k)[:top_k]
+    
     def _reciprocal_rank_fusion(self, list1: List[Dict], list2: List[Dict], 
                                 k: int = 60) -> List[Dict]:
-        scores = {}
-        
-        # Process semantic results
-        for rank, item in enumerate(list1, 1):
-            item_id = item['id']
-            scores[item_id] = scores.get(item_id, {'item': item, 'score': 0})
-            scores[item_id]['score'] += self.alpha * (1 / (rank + k))
-        
-        # Process keyword results
-        for rank, item in enumerate(list2, 1):
-            item_id = item['id']
-            if item_id not in scores:
-                scores[item_id] = {'item': item, 'score': 0}
-            scores[item_id]['score'] += (1 - self.alpha) * (1 / (rank + k))
+        return self._fuse_ranked_lists([(list1, self.alpha), (list2, 1 - self.alpha)], k)
+    
+    def _fuse_ranked_lists(self, weighted_lists: List[Tuple[List[Dict], float]], k: int = 60) -> List[Dict]:
+        # The first list an item appears in supplies its payload
+        items = {}
+        ranked_lists, weights = [], []
+        for results, weight in weighted_lists:
+            for item in results:
+                items.setdefault(item['id'], item)
+            ranked_lists.append((
+                np.array([item['id'] for item in results], dtype=object),
+                np.array([item.get('score', 0.0) for item in results], dtype=np.float64)
+            ))
+            weights.append(weight)
         
-        # Sort by combined score
-        ranked = sorted(scores.values(), key=lambda x: x['score'], reverse=True)
-        return [item['item'] for item in ranked]
+        fused_ids, _ = fuse(ranked_lists, weights, method=self.fusion_method, k=k)
+        return [items[item_id] for item_id in fused_ids]
     
     def _tokenize(self, text: str) -> List[str]:
         return re.findall(r'\b\w+\b', text.lower())
@@ -79,17 +111,31 @@ class HybridRetriever:
 
 class QueryRewriter:
     
+    # Words that shape a question without naming its topic, and connectives BM25 gains nothing from
+    QUESTION_WORDS = r'what|when|where|which|who|whom|why|how|is|are|was|were|do|does|did|can|could|should|would'
+    STOP_WORDS = r'the|a|an|of|in|on|at|for|to|and|or|with|about|please|tell|me|explain|describe'
+    
     def rewrite(self, query: str) -> List[str]:
         variations = [query]
+        seen = {self._key(query)}
         
-        # Add question variations
-        if not query.endswith('?'):
-            variations.append(query + '?')
-        
-        # Remove question words for keyword search
-        keywords = re.sub(r'\b(what|when|where|who|why|how|is|are|the|a|an)\b', '', query, flags=re.IGNORECASE)
-        keywords = ' '.join(keywords.split())
-        if keywords != query:
-            variations.append(keywords)
+        # Variants change the terms searched; case and punctuation changes (e.g. a trailing '?')
+        # normalize to the original and would only repeat its searches
+        statement = self._strip(query, self.QUESTION_WORDS)  # The topic as a phrase, for semantic search
+        keywords = self._strip(statement, self.STOP_WORDS)  # Content terms only, for keyword search
+        for variant in (statement, keywords):
+            key = self._key(variant)
+            if key and key not in seen:
+                seen.add(key)
+                variations.append(variant)
         
         return variations
+    
+    @staticmethod
+    def _strip(text: str, words: str) -> str:
+        text = re.sub(rf'\b({words})\b', '', text, flags=re.IGNORECASE)
+        return ' '.join(text.split()).rstrip('?.! ')
+    
+    @staticmethod
+    def _key(text: str) -> str:
+        return ' '.join(text.lower().split()).rstrip('?.! ')
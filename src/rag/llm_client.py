@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient(ABC):
+
+    provider = "base"
+
+    def __init__(self, model: str, timeout_seconds: float = 60.0):
+        self.model = model
+        self.timeout_seconds = timeout_seconds
+
+    async def generate(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> str:
+        return await asyncio.wait_for(self._generate(messages), self._timeout(timeout))
+
+    async def stream(self, messages: List[Dict[str, str]], timeout: Optional[float] = None) -> AsyncIterator[str]:
+        # The timeout bounds the whole stream, not each fragment
+        deadline = time.monotonic() + self._timeout(timeout)
+        stream = self._stream(messages)
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(stream.__anext__(), max(deadline - time.monotonic(), 0))
+                except StopAsyncIteration:
+                    break
+                if delta:
+                    yield delta
+        finally:
+            # Runs on cancellation too, so an abandoned stream releases its connection
+            await stream.aclose()
+
+    async def ping(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    @abstractmethod
+    async def _generate(self, messages: List[Dict[str, str]]) -> str:
+        ...
+
+    @abstractmethod
+    def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        ...
+
+    def _timeout(self, timeout: Optional[float]) -> float:
+        return self.timeout_seconds if timeout is None else timeout
+
+
+class OllamaLLMClient(LLMClient):
+
+    provider = "ollama"
+
+    def __init__(self, model: str = "llama3.2", host: Optional[str] = None, timeout_seconds: float = 60.0):
+        super().__init__(model, timeout_seconds)
+        from ollama import AsyncClient
+        # One AsyncClient per process keeps its HTTP connection pool alive between requests
+        self.client = AsyncClient(host=host)
+
+    async def ping(self) -> None:
+        await asyncio.wait_for(self.client.list(), self.timeout_seconds)
+
+    async def _generate(self, messages: List[Dict[str, str]]) -> str:
+        response = await self.client.chat(model=self.model, messages=messages)
+        return response['message']['content']
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self.client.chat(model=self.model, messages=messages, stream=True)
+        try:
+            async for part in stream:
+                yield part['message']['content']
+        finally:
+            await stream.aclose()
+
+    async def aclose(self) -> None:
+        client = getattr(self.client, "_client", None)
+        if client is not None:
+            await client.aclose()
+
+
+class OpenAILLMClient(LLMClient):
+
+    provider = "openai"
+
+    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo", base_url: Optional[str] = None,
+                 temperature: float = 0.7, max_tokens: int = 500, timeout_seconds: float = 60.0):
+        super().__init__(model, timeout_seconds)
+        from openai import AsyncOpenAI
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # One AsyncOpenAI per process keeps its HTTP connection pool alive between requests
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout_seconds)
+
+    async def _generate(self, messages: List[Dict[str, str]]) -> str:
+        completion = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens
+        )
+        return completion.choices[0].message.content
+
+    async def _stream(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            max_tokens=self.max_tokens,
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+async def create_llm_client(api_key: Optional[str] = None, api_base: Optional[str] = None,
+                            timeout_seconds: float = 60.0) -> Optional[LLMClient]:
+    # Try Ollama first (local, free, no API key needed)
+    client = None
+    try:
+        client = OllamaLLMClient(timeout_seconds=timeout_seconds)
+        await client.ping()
+        logger.info("[OK] Ollama local LLM initialized")
+        return client
+    except Exception as e:
+        logger.info(f"[INFO] Ollama not available: {e}")
+        if client is not None:
+            await client.aclose()
+
+    # Try OpenAI if Ollama not available
+    if api_key:
+        try:
+            client = OpenAILLMClient(api_key=api_key, base_url=api_base, timeout_seconds=timeout_seconds)
+            logger.info("[OK] OpenAI GPT client initialized")
+            return client
+        except Exception as e:
+            logger.warning(f"OpenAI failed: {e}")
+
+    return None
@@ -0,0 +1,85 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, Hashable, Optional
+import numpy as np
+
+from src.utils.cache import CacheManager
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    __slots__ = ("value", "params", "embedding")
+
+    def __init__(self, value: Any, params: Hashable, embedding: Optional[np.ndarray]):
+        self.value = value
+        self.params = params
+        self.embedding = embedding
+
+
+class QueryResultCache:
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600,
+                 similarity_threshold: float = 0.95, cache: Optional[CacheManager] = None,
+                 namespace: str = "query"):
+        self.similarity_threshold = similarity_threshold
+        # Entries live in a CacheManager namespace; similarity lookups are counted in a second one
+        self.cache = cache if cache is not None else CacheManager(ttl_seconds, max_entries)
+        self.namespace = namespace
+        self.semantic_namespace = f"{namespace}_semantic"
+        self.cache.configure(namespace, ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.cache.configure(self.semantic_namespace)
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return self.cache.stats(self.namespace)["entries"]
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return re.sub(r'\s+', ' ', query.strip().lower()).rstrip('?.! ')
+
+    def get(self, query: str, params: Hashable) -> Optional[Any]:
+        entry = self.cache.get((params, self.normalize(query)), self.namespace)
+        return entry.value if entry is not None else None
+
+    def get_similar(self, params: Hashable, query_embedding: np.ndarray) -> Optional[Any]:
+        query = self._unit(query_embedding)
+        candidates = [(key, entry) for key, entry in self.cache.items(self.namespace)
+                      if entry.params == params and entry.embedding is not None
+                      and entry.embedding.shape == query.shape]
+        entry = None
+        if candidates:
+            scores = np.stack([entry.embedding for _, entry in candidates]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                # Refreshes its LRU position; the lookup is counted once, as a semantic hit
+                entry = self.cache.get(candidates[best][0], self.namespace, record=False)
+                logger.debug(f"Semantic cache hit (similarity {scores[best]:.3f})")
+        self.cache.record_lookup(self.semantic_namespace, entry is not None)
+        return entry.value if entry is not None else None
+
+    def put(self, query: str, params: Hashable, value: Any,
+            query_embedding: Optional[np.ndarray] = None, generation: Optional[int] = None) -> None:
+        key = (params, self.normalize(query))
+        embedding = self._unit(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            # Results computed against a corpus that changed mid-request are dropped
+            if generation is not None and generation != self.generation:
+                return
+            self.cache.set(key, _CacheEntry(value, params, embedding), namespace=self.namespace)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.cache.clear(self.namespace)
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: self.cache.stats(name) for name in (self.namespace, self.semantic_namespace)}
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
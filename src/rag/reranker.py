@@ -1,23 +1,47 @@
+import hashlib
 import logging
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 import numpy as np
 
+from src.embeddings.model_registry import get_model_registry
+from src.utils.cache import CacheManager
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
 
 class DocumentReranker:
     
-    def __init__(self, model_type: str = "cross-encoder"):
+    # Rough upper bound on characters per token, used to clip passages before tokenization
+    CHARS_PER_TOKEN = 4
+    
+    def __init__(self, model_type: str = "cross-encoder", model_name: str = DEFAULT_CROSS_ENCODER,
+                 batch_size: int = 32, max_length: int = 512, score_cache: Optional[CacheManager] = None,
+                 latency_budget_ms: Optional[float] = None, probe_every: int = 10):
         self.model_type = model_type
-        self.model = self._load_model()
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.score_cache = score_cache
+        self.latency_budget_ms = latency_budget_ms
+        self.probe_every = max(1, probe_every)
+        self.model = None
+        self._unavailable = False
+        # Moving average of scoring cost per (query, passage) pair, used to predict budget overruns
+        self.pair_latency_ms: Optional[float] = None
+        self.skipped = 0
+        self._skips_since_probe = 0
     
-    def rerank(self, query: str, documents: List[Dict[str, Any]], top_k: int = 3) -> List[Dict[str, Any]]:
+    def rerank(self, query: str, documents: List[Dict[str, Any]], top_k: int = 3,
+               budget_ms: Optional[float] = None) -> List[Dict[str, Any]]:
         if len(documents) <= top_k:
             return documents
         
         try:
             if self.model_type == "cross-encoder":
-                return self._rerank_with_cross_encoder(query, documents, top_k)
+                return self._rerank_with_cross_encoder(query, documents, top_k, budget_ms)
             elif self.model_type == "llm":
                 return self._rerank_with_llm(query, documents, top_k)
             else:
@@ -27,18 +51,47 @@ class DocumentReranker:
             logger.error(f"Reranking failed: {str(e)}, returning original order")
             return documents[:top_k]
     
-    def _rerank_with_cross_encoder(self, query: str, documents: List[Dict], top_k: int) -> List[Dict]:
+    def _rerank_with_cross_encoder(self, query: str, documents: List[Dict], top_k: int,
+                                   budget_ms: Optional[float] = None) -> List[Dict]:
         try:
-            from sentence_transformers import CrossEncoder
-            
-            if not hasattr(self, '_cross_encoder'):
-                self._cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
+            model = self._load_model()
+            if model is None:
+                return documents[:top_k]
             
-            # Prepare text pairs
-            pairs = [(query, doc.get('content', '')) for doc in documents]
+            # Cached scores are reused; only unseen (query, chunk) pairs go to the model
+            query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+            scores = [self._cached_score(query_hash, doc) for doc in documents]
+            missing = [i for i, score in enumerate(scores) if score is None]
             
-            # Score pairs
-            scores = self._cross_encoder.predict(pairs)
+            probe = False
+            if missing:
+                budget_ms = self.latency_budget_ms if budget_ms is None else budget_ms
+                if self._over_budget(len(missing), budget_ms):
+                    self.skipped += 1
+                    self._skips_since_probe += 1
+                    if self._skips_since_probe < self.probe_every or budget_ms <= 0:
+                        logger.info(f"Skipping rerank: {len(missing)} pairs would exceed {budget_ms:.0f}ms budget")
+                        return documents[:top_k]
+                    # The estimate only changes when the model runs, so one slow batch would disable
+                    # reranking for good; every probe_every skips a batch that fits re-measures it
+                    probe = True
+                    missing = missing[:max(1, int(budget_ms / self.pair_latency_ms))]
+                self._skips_since_probe = 0
+                
+                max_chars = self.max_length * self.CHARS_PER_TOKEN
+                pairs = [(query, self._document_text(documents[i])[:max_chars]) for i in missing]
+                
+                start = time.perf_counter()
+                predicted = model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+                self._record_latency((time.perf_counter() - start) * 1000, len(pairs), replace=probe)
+                
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    if self.score_cache is not None and documents[i].get('id'):
+                        self.score_cache.set((query_hash, documents[i]['id']), scores[i], namespace="rerank")
+                if probe:
+                    logger.info(f"Rerank probe: {self.pair_latency_ms:.1f}ms per pair")
+                    return documents[:top_k]
             
             # Sort by score and rerank
             ranked = sorted(
@@ -49,10 +102,9 @@ class DocumentReranker:
             
             reranked = []
             for doc, score in ranked[:top_k]:
-                doc['rerank_score'] = float(score)
-                reranked.append(doc)
+                reranked.append({**doc, 'rerank_score': score})
             
-            logger.debug(f"Reranked {len(documents)} documents using cross-encoder")
+            logger.debug(f"Reranked {len(documents)} documents using cross-encoder ({len(missing)} scored)")
             return reranked
             
         except ImportError:
@@ -64,13 +116,43 @@ class DocumentReranker:
         logger.debug("LLM-based reranking (placeholder)")
         return documents[:top_k]
     
+    def warm_up(self) -> bool:
+        return self._load_model() is not None
+    
     def _load_model(self):
-        try:
-            from sentence_transformers import CrossEncoder
-            return CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-        except ImportError:
-            logger.warning("sentence-transformers not available, using placeholder model")
+        # Lazily acquired from the process-wide registry, so the CrossEncoder is loaded once
+        if self.model is None and not self._unavailable:
+            try:
+                self.model = get_model_registry().acquire("cross-encoder", self.model_name, max_length=self.max_length)
+            except ImportError:
+                logger.warning("sentence-transformers not available, using placeholder model")
+                self._unavailable = True
+        return self.model
+    
+    def _cached_score(self, query_hash: str, doc: Dict) -> Optional[float]:
+        if self.score_cache is None or not doc.get('id'):
             return None
+        return self.score_cache.get((query_hash, doc['id']), namespace="rerank")
+    
+    def _over_budget(self, pair_count: int, budget_ms: Optional[float]) -> bool:
+        if budget_ms is None:
+            return False
+        if budget_ms <= 0:
+            return True
+        # Until the first measurement there is no estimate, so the first batch always runs
+        return self.pair_latency_ms is not None and self.pair_latency_ms * pair_count > budget_ms
+    
+    def _record_latency(self, elapsed_ms: float, pair_count: int, replace: bool = False):
+        per_pair = elapsed_ms / max(pair_count, 1)
+        if self.pair_latency_ms is None or replace:
+            self.pair_latency_ms = per_pair
+        else:
+            self.pair_latency_ms = 0.8 * self.pair_latency_ms + 0.2 * per_pair
+    
+    @staticmethod
+    def _document_text(doc: Dict) -> str:
+        # Retrievers emit 'text'; older callers used 'content'
+        return doc.get('text') or doc.get('content', '')
 
 
 class RAGChain:
@@ -27,11 +27,12 @@ class HybridRetriever:
         
         # Format results
         documents = []
-        for doc_id, score, metadata in results:
+        for result in results:
             documents.append({
-                "id": doc_id,
-                "score": float(score),
-                "metadata": metadata,
+                "id": result["id"],
+                "score": float(result["score"]),
+                "metadata": result["metadata"],
+                "text": result["text"],
                 "search_type": "semantic"
             })
         
@@ -55,10 +56,17 @@ class HybridRetriever:
     
     def _keyword_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         try:
-            # This would use the BM25 index to search
-            # Placeholder implementation
-            logger.debug("BM25 keyword search (placeholder)")
-            return []
+            documents = []
+            for doc_id, score, payload in self.bm25_index.search(query, top_k, normalize=True):
+                documents.append({
+                    "id": doc_id,
+                    "score": float(score),
+                    "metadata": payload if isinstance(payload, dict) else {},
+                    "search_type": "keyword"
+                })
+            
+            logger.debug(f"BM25 keyword search returned {len(documents)} results")
+            return documents
         except Exception as e:
             logger.warning(f"Keyword search failed: {str(e)}")
             return []
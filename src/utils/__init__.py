@@ -4,6 +4,9 @@ from typing import Optional
 from datetime import datetime, timedelta
 import jwt
 
+from .cache import CacheManager, CacheStats
+from .single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 
@@ -62,30 +65,6 @@ class JWTManager:
             return None
 
 
-class CacheManager:
-    
-    def __init__(self, ttl_seconds: int = 3600):
-        self.ttl_seconds = ttl_seconds
-        self.cache = {}
-    
-    def get(self, key: str) -> Optional[object]:
-        if key in self.cache:
-            value, expiry = self.cache[key]
-            if datetime.utcnow() < expiry:
-                return value
-            else:
-                del self.cache[key]
-        return None
-    
-    def set(self, key: str, value: object, ttl_seconds: Optional[int] = None):
-        ttl = ttl_seconds or self.ttl_seconds
-        expiry = datetime.utcnow() + timedelta(seconds=ttl)
-        self.cache[key] = (value, expiry)
-    
-    def clear(self):
-        self.cache.clear()
-
-
 def hash_string(text: str) -> str:
     return hashlib.sha256(text.encode()).hexdigest()
 
@@ -0,0 +1,262 @@
+import heapq
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class _Entry:
+    __slots__ = ("value", "expiry", "size", "touched")
+
+    def __init__(self, value: Any, expiry: float, size: int, touched: int):
+        self.value = value
+        self.expiry = expiry
+        self.size = size
+        self.touched = touched
+
+
+@dataclass
+class _Limits:
+    ttl_seconds: Optional[float] = None
+    max_entries: Optional[int] = None
+    max_bytes: Optional[int] = None
+
+
+class CacheManager:
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 10000,
+                 sweep_interval_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.sweep_interval_seconds = sweep_interval_seconds
+        # namespace -> key -> entry, each in LRU order; entries also record when they were last
+        # touched, so the global bound evicts the least recently used head across namespaces
+        self._entries: Dict[str, "OrderedDict[Hashable, _Entry]"] = {}
+        self._limits: Dict[str, _Limits] = {}
+        self._count = 0
+        self._clock = 0
+        self._expiry_heap: List[Tuple[float, int, Tuple[str, Hashable]]] = []
+        self._sequence = 0
+        self._stats: Dict[str, CacheStats] = {}
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+        if sweep_interval_seconds:
+            self.start_sweeper()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def configure(self, namespace: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None,
+                  max_bytes: Optional[int] = None) -> None:
+        # Per-namespace defaults and bounds; the manager-wide max_entries still applies on top
+        with self._lock:
+            self._limits[namespace] = _Limits(ttl_seconds, max_entries, max_bytes)
+            self._namespace_stats(namespace)
+
+    def get(self, key: Hashable, namespace: str = "default", default: Any = None, record: bool = True) -> Any:
+        with self._lock:
+            stats = self._namespace_stats(namespace)
+            entries = self._entries.get(namespace)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                if record:
+                    stats.misses += 1
+                return default
+
+            if time.monotonic() >= entry.expiry:
+                # Lazy expiry on read; the sweeper handles entries that are never read again
+                self._remove(namespace, key)
+                stats.expirations += 1
+                if record:
+                    stats.misses += 1
+                return default
+
+            entries.move_to_end(key)
+            entry.touched = self._tick()
+            if record:
+                stats.hits += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None, namespace: str = "default",
+            size: int = 0):
+        limits = self._limits.get(namespace) or _Limits()
+        if ttl_seconds is None:
+            ttl_seconds = self.ttl_seconds if limits.ttl_seconds is None else limits.ttl_seconds
+        full_key = (namespace, key)
+        expiry = time.monotonic() + ttl_seconds
+
+        with self._lock:
+            stats = self._namespace_stats(namespace)
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            if key in entries:
+                self._remove(namespace, key)
+            entries[key] = _Entry(value, expiry, size, self._tick())
+            self._count += 1
+            stats.sets += 1
+            stats.entries += 1
+            stats.bytes += size
+
+            if expiry != float("inf"):
+                self._sequence += 1
+                heapq.heappush(self._expiry_heap, (expiry, self._sequence, full_key))
+                if len(self._expiry_heap) > 2 * self._count + 64:
+                    self._rebuild_heap()
+
+            while (limits.max_entries is not None and stats.entries > limits.max_entries) or \
+                    (limits.max_bytes is not None and stats.bytes > limits.max_bytes):
+                self._evict(namespace)
+            while self._count > self.max_entries:
+                self._evict(min(
+                    (name for name, named in self._entries.items() if named),
+                    key=lambda name: next(iter(self._entries[name].values())).touched
+                ))
+
+    def delete(self, key: Hashable, namespace: str = "default") -> bool:
+        with self._lock:
+            return self._remove(namespace, key) is not None
+
+    def items(self, namespace: str = "default") -> List[Tuple[Hashable, Any]]:
+        # Unexpired entries, oldest first; neither counted as lookups nor refreshed in LRU order
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.get(namespace) or {}
+            return [(key, entry.value) for key, entry in entries.items() if entry.expiry > now]
+
+    def record_lookup(self, namespace: str, hit: bool) -> None:
+        # For lookups that are not a plain get by key, e.g. a similarity search over items()
+        with self._lock:
+            stats = self._namespace_stats(namespace)
+            if hit:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any], ttl_seconds: Optional[float] = None,
+                   namespace: str = "default") -> Any:
+        value = self.get(key, namespace, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl_seconds, namespace)
+        return value
+
+    # Async variants never await while holding the lock, so they are safe to call from
+    # the event loop while worker threads use the synchronous API
+    async def aget(self, key: Hashable, namespace: str = "default", default: Any = None) -> Any:
+        return self.get(key, namespace, default)
+
+    async def aset(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None, namespace: str = "default"):
+        self.set(key, value, ttl_seconds, namespace)
+
+    async def aget_or_set(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                          ttl_seconds: Optional[float] = None, namespace: str = "default") -> Any:
+        value = self.get(key, namespace, _MISSING)
+        if value is _MISSING:
+            value = await factory()
+            self.set(key, value, ttl_seconds, namespace)
+        return value
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            for name in list(self._entries) if namespace is None else [namespace]:
+                for key in list(self._entries.get(name) or ()):
+                    self._remove(name, key)
+            if namespace is None:
+                self._expiry_heap.clear()
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            heap = self._expiry_heap
+            while heap and heap[0][0] <= now:
+                expiry, _, (namespace, key) = heapq.heappop(heap)
+                entry = (self._entries.get(namespace) or {}).get(key)
+                # Skip heap records left behind by overwrites or deletes
+                if entry is not None and entry.expiry == expiry:
+                    self._remove(namespace, key)
+                    self._namespace_stats(namespace).expirations += 1
+                    removed += 1
+        if removed:
+            logger.debug(f"Cache sweep removed {removed} expired entries")
+        return removed
+
+    def start_sweeper(self, interval_seconds: Optional[float] = None):
+        if interval_seconds is not None:
+            self.sweep_interval_seconds = interval_seconds
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def stats(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if namespace is not None:
+                return asdict(self._stats.get(namespace, CacheStats()))
+            return {name: asdict(stats) for name, stats in self._stats.items()}
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(self.sweep_interval_seconds or 60):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Cache sweep failed: {e}")
+
+    def _rebuild_heap(self):
+        heap = []
+        for namespace, entries in self._entries.items():
+            for key, entry in entries.items():
+                if entry.expiry != float("inf"):
+                    heap.append((entry.expiry, len(heap), (namespace, key)))
+        heapq.heapify(heap)
+        self._expiry_heap = heap
+
+    def _remove(self, namespace: str, key: Hashable) -> Optional[_Entry]:
+        entry = (self._entries.get(namespace) or {}).pop(key, None)
+        if entry is not None:
+            stats = self._namespace_stats(namespace)
+            stats.entries -= 1
+            stats.bytes -= entry.size
+            self._count -= 1
+        return entry
+
+    def _evict(self, namespace: str) -> None:
+        key = next(iter(self._entries[namespace]))
+        self._remove(namespace, key)
+        self._namespace_stats(namespace).evictions += 1
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def _namespace_stats(self, namespace: str) -> CacheStats:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = CacheStats()
+        return stats
@@ -1,7 +1,27 @@
 """Sample tests for the retrieval platform."""
+import json
+import os
+import re
+import threading
+import time
 import pytest
-from src.ingestion import DocumentLoader, DocumentChunker
-from src.embeddings import EmbeddingService
+from src.ingestion import DocumentLoader, DocumentChunker, BatchEmbeddingStage, IngestManifest
+from src.ingestion.chunker import StreamingChunker
+from src.ingestion.metadata_store import DocumentMetadataStore
+from src.ingestion.content_store import ContentStore
+from src.ingestion.dedup import ChunkDeduplicator
+from src.ingestion.pipeline import IngestionPipeline, extract_and_chunk
+import asyncio
+import numpy as np
+from src.embeddings import EmbeddingService, EmbeddingMatrix, ModelRegistry, EmbeddingCache, IVFFlatIndex, AnnCollection
+from src.embeddings import ScalarQuantizer, ProductQuantizer, as_float32_matrix, VectorStore
+from src.embeddings.vector_store import VectorBackend
+from src.rag import BM25Index, QueryResultCache
+from src.rag.llm_client import LLMClient
+from src.rag.reranker import DocumentReranker
+from src.rag.hybrid_retriever import HybridRetriever, QueryRewriter
+from src.rag.fusion import fuse, min_max_normalize
+from src.utils import CacheManager, SingleFlight
 
 
 class TestDocumentLoader:
@@ -18,6 +38,66 @@ class TestDocumentLoader:
         assert '.pdf' in loader.SUPPORTED_FORMATS
         assert '.docx' in loader.SUPPORTED_FORMATS
         assert '.txt' in loader.SUPPORTED_FORMATS
+    
+    @pytest.mark.parametrize("max_workers", [1, 2])
+    def test_incremental_directory_ingestion(self, tmp_path, max_workers):
+        """Test a directory walk yields each file once and skips unchanged files on later runs."""
+        source = tmp_path / "docs"
+        (source / "nested").mkdir(parents=True)
+        (source / "a.txt").write_text("alpha document")
+        (source / "nested" / "b.md").write_text("beta document")
+        (source / "ignored.bin").write_bytes(b"\x00")
+        manifest = IngestManifest(str(tmp_path / "manifest"))
+        loader = DocumentLoader()
+        
+        def run():
+            documents = list(loader.iter_documents(
+                str(source), manifest=manifest, max_workers=max_workers, chunk_params=(8, 0, None)
+            ))
+            for document in documents:
+                manifest.record(document)
+            return documents
+        
+        first = run()
+        assert sorted(doc.content for doc in first) == ["alpha document", "beta document"]
+        assert all(doc.spans and doc.content_hash for doc in first)
+        assert run() == [] and loader.stats["unchanged"] == 2
+        
+        # Rewritten with the same bytes: hashed, not re-yielded; new content gets a new doc_id
+        os.utime(source / "a.txt", ns=(0, 0))
+        (source / "nested" / "b.md").write_text("beta document, revised")
+        changed = run()
+        assert [doc.content for doc in changed] == ["beta document, revised"]
+        assert changed[0].doc_id not in {doc.doc_id for doc in first}
+        assert run() == []
+
+    def test_directory_pdfs_are_left_for_streaming(self, tmp_path):
+        """Test directory PDFs are hashed but not parsed when the caller streams their pages."""
+        PyPDF2 = pytest.importorskip("PyPDF2")
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(width=72, height=72)
+        with open(tmp_path / "a.pdf", "wb") as f:
+            writer.write(f)
+        (tmp_path / "b.txt").write_text("plain text")
+
+        documents = {
+            doc.metadata["file_name"]: doc
+            for doc in DocumentLoader().iter_documents(str(tmp_path), max_workers=1, stream_pdfs=True)
+        }
+        assert documents["a.pdf"].streamed and documents["a.pdf"].content == "" and documents["a.pdf"].content_hash
+        assert not documents["b.txt"].streamed and documents["b.txt"].content == "plain text"
+
+
+class _WhitespaceTokenizer:
+    """Stands in for a fast tokenizer: one token per whitespace-separated word."""
+    
+    def num_special_tokens_to_add(self):
+        return 2
+    
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if return_offsets_mapping:
+            return {"offset_mapping": [match.span() for match in re.finditer(r"\S+", texts)]}
+        return {"input_ids": [text.split() for text in texts]}
 
 
 class TestDocumentChunker:
@@ -29,6 +109,92 @@ class TestDocumentChunker:
         assert chunker.chunk_size == 1024
         assert chunker.chunk_overlap == 128
     
+    def test_iter_spans(self):
+        """Test span chunking covers the text with bounded chunks."""
+        chunker = DocumentChunker(chunk_size=40, chunk_overlap=20)
+        text = "One short sentence. " * 10
+        spans = list(chunker.iter_spans(text))
+        assert len(spans) > 1
+        assert spans[0][0] == 0 and spans[-1][1] == len(text.rstrip())
+        assert all(end - start <= 40 for start, end in spans)
+        assert all(text[start:end].endswith(".") for start, end in spans)
+    
+    def test_sentence_split_is_linear_in_whitespace_runs(self):
+        """Test long whitespace runs (PDF layout gaps) do not make sentence splitting quadratic."""
+        # Table cells separated by wide gaps and no sentence punctuation: one open sentence throughout
+        text = "Total." + ("  cell" + " " * 1000) * 300
+        started = time.perf_counter()
+        spans = list(DocumentChunker.iter_sentence_spans(text))
+        assert time.perf_counter() - started < 1.0
+        assert spans == [(0, 6), (8, len(text.rstrip()))]
+    
+    def test_chunk_document_uses_spans(self):
+        """Test document chunks are slices of the source and long runs are split."""
+        chunker = DocumentChunker(chunk_size=50, chunk_overlap=10)
+        text = "First sentence here. " + "word " * 40 + "\nLast one."
+        chunks = chunker.chunk_document("doc", text, {"filename": "a.txt"})
+        assert len(chunks) > 2 and all(chunk.total_chunks == len(chunks) for chunk in chunks)
+        for chunk in chunks:
+            assert chunk.content == text[chunk.metadata["start"]:chunk.metadata["end"]]
+            assert len(chunk.content) <= 50 and chunk.metadata["filename"] == "a.txt"
+    
+    def test_token_budget_chunking(self, monkeypatch):
+        """Test token-sized chunks respect the model budget and reuse cached counts."""
+        chunker = DocumentChunker(chunk_size=10, chunk_overlap=3, tokenizer=_WhitespaceTokenizer())
+        text = "one two three. four five six seven. eight nine. " * 3 + " ".join(["long"] * 20) + "."
+        spans = list(chunker.iter_spans(text))
+        # Two of the ten tokens go to the special tokens
+        assert all(len(text[start:end].split()) <= 8 for start, end in spans)
+        assert spans[-1][1] == len(text)
+        assert chunker.token_cache_hits > 0  # repeated sentences were counted once
+        
+        attempts = []
+        monkeypatch.setattr("src.ingestion.chunker._tokenizers", {})
+        monkeypatch.setattr("src.ingestion.chunker._load_tokenizer", lambda name: attempts.append(name))
+        for _ in range(2):
+            fallback = DocumentChunker(chunk_size=10, chunk_overlap=0, tokenizer="missing-model")
+            assert all(end - start <= 40 for start, end in fallback.iter_spans(text))
+        assert attempts == ["missing-model"]  # the failed load is not retried per document
+    
+    def test_token_counts_are_thread_safe(self, monkeypatch):
+        """Test threads sharing one chunker count tokens correctly while its small cache churns."""
+        monkeypatch.setattr("src.ingestion.chunker.TOKEN_COUNT_CACHE_SIZE", 8)
+        chunker = DocumentChunker(chunk_size=10, tokenizer=_WhitespaceTokenizer())
+        errors = []
+        
+        def count(seed):
+            try:
+                for i in range(300):
+                    words = (seed + i) % 13 + 1
+                    sentences = [" ".join(["w"] * words), " ".join(["x"] * (words % 5 + 1))]
+                    assert chunker.count_tokens(sentences) == [words, words % 5 + 1]
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=count, args=(seed,)) for seed in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == [] and len(chunker._token_counts) <= 8
+    
+    def test_streaming_chunker(self):
+        """Test chunks of a text fed page by page are byte-addressed slices that cover it."""
+        pages = [f"Página {i}. " + "Le café est très bon. " * 12 for i in range(5)]
+        text = "\n\n".join(pages)
+        streaming = StreamingChunker(DocumentChunker(chunk_size=80, chunk_overlap=20))
+        chunks = []
+        for i, page in enumerate(pages):
+            chunks += streaming.feed(("\n\n" if i else "") + page)
+        assert chunks  # earlier pages are chunked before the last one arrives
+        chunks += streaming.finish()
+        data = text.encode("utf-8")
+        for start, end, chunk_text in chunks:
+            assert data[start:end].decode("utf-8") == chunk_text and len(chunk_text) <= 80
+        assert chunks[-1][1] == len(text.rstrip().encode("utf-8"))
+        whole = DocumentChunker(chunk_size=80, chunk_overlap=20).iter_spans(text)
+        assert [chunk[:2] for chunk in chunks] == ContentStore.to_byte_spans(text, whole)
+    
     def test_chunking_text(self):
         """Test text chunking."""
         chunker = DocumentChunker()
@@ -38,6 +204,261 @@ class TestDocumentChunker:
         assert all(isinstance(chunk, str) for chunk in chunks)
 
 
+class TestDocumentMetadataStore:
+    """Test journaled document metadata store."""
+    
+    def test_journal_replay_and_compaction(self, tmp_path):
+        """Test updates survive a reopen, before and after compaction."""
+        store = DocumentMetadataStore(str(tmp_path), compact_every=3)
+        store.put("d1", {"status": "ready"})
+        store.update("d1", status="completed")
+        store.close()
+        
+        reopened = DocumentMetadataStore(str(tmp_path), compact_every=3)
+        assert reopened["d1"] == {"status": "completed"}
+        reopened.update("d1", indexed_chunks=4)  # third entry triggers compaction
+        reopened.close()
+        
+        compacted = DocumentMetadataStore(str(tmp_path))
+        assert compacted["d1"]["indexed_chunks"] == 4
+        assert (tmp_path / "metadata.journal").read_text() == ""
+    
+    def test_torn_journal_tail_is_truncated(self, tmp_path):
+        """Test writes after a crash mid-append survive the next reopen."""
+        store = DocumentMetadataStore(str(tmp_path))
+        store.put("d1", {"status": "ready"})
+        store.close()
+        with open(tmp_path / "metadata.journal", "a") as f:
+            f.write('{"op": "put", "id": "d2", "rec')
+        
+        recovered = DocumentMetadataStore(str(tmp_path))
+        assert "d2" not in recovered
+        recovered.put("d3", {"status": "ready"})
+        recovered.close()
+        assert set(DocumentMetadataStore(str(tmp_path))) == {"d1", "d3"}
+    
+    def test_transient_records_are_not_persisted(self, tmp_path):
+        """Test in-memory only records stay out of the journal."""
+        store = DocumentMetadataStore(str(tmp_path))
+        store.put("sample", {"status": "ready"}, persist=False)
+        assert "sample" in store
+        store.close()
+        assert "sample" not in DocumentMetadataStore(str(tmp_path))
+    
+    def test_find_by_indexed_field(self, tmp_path):
+        """Test records are found by content hash across updates, deletes and reopens."""
+        store = DocumentMetadataStore(str(tmp_path), indexed_fields=("content_hash",))
+        store.put("d1", {"content_hash": "abc"})
+        store.put("d2", {"content_hash": "def"})
+        store.update("d2", content_hash="xyz")
+        assert store.find("content_hash", "abc") == "d1"
+        assert store.find("content_hash", "def") is None
+        store.delete("d1")
+        assert store.find("content_hash", "abc") is None
+        store.close()
+        reopened = DocumentMetadataStore(str(tmp_path), indexed_fields=("content_hash",))
+        assert reopened.find("content_hash", "xyz") == "d2"
+
+
+class TestChunkDeduplicator:
+    """Test chunk-level embedding reuse."""
+    
+    def test_shared_entries_are_reference_counted(self, tmp_path):
+        """Test identical chunks map to one vector entry that outlives its first document."""
+        dedup = ChunkDeduplicator(str(tmp_path))
+        hashes, vector_ids, new = dedup.assign(["a_0", "a_1", "a_2"], ["intro", "body", "intro"])
+        assert vector_ids == ["a_0", "a_1", "a_0"] and new == [0, 1]
+        dedup.commit("a", hashes, vector_ids)
+        
+        hashes, vector_ids, new = dedup.assign(["b_0", "b_1"], ["body", "other"])
+        assert vector_ids == ["a_1", "b_1"] and new == [1]
+        dedup.commit("b", hashes, vector_ids)
+        
+        assert sorted(dedup.release("a")) == ["a_0"]  # a_1 is still used by b
+        reopened = ChunkDeduplicator(str(tmp_path))
+        assert reopened.assign(["c_0"], ["body"])[1] == ["a_1"]
+        assert sorted(reopened.release("b")) == ["a_1", "b_1"]
+        assert reopened.release("missing") is None
+    
+    def test_citations_follow_live_owners(self, api_routes):
+        """Test a shared vector hit is cited from its remaining owner once the first uploader is deleted."""
+        routes = api_routes
+        content_store, documents, dedup = routes.content_store, routes.uploaded_documents, routes.chunk_dedup
+        
+        for doc_id, chunks in (("a", ["shared text"]), ("b", ["intro", "shared text"])):
+            content_store.put(doc_id, " ".join(chunks))
+            documents.put(doc_id, {"filename": f"{doc_id}.txt"})
+            hashes, vector_ids, _ = dedup.assign([f"{doc_id}_chunk_{i}" for i in range(len(chunks))], chunks)
+            spans, start = [], 0
+            for chunk in chunks:
+                spans.append((start, start + len(chunk)))
+                start += len(chunk) + 1
+            dedup.commit(doc_id, hashes, vector_ids, spans)
+        hit = {"id": "a_chunk_0", "score": 0.9, "metadata": {"filename": "a.txt", "doc_id": "a", "chunk_index": 0}, "text": ""}
+        assert [result["id"] for result in routes.resolve_vector_hits([hit])] == ["a_chunk_0", "b_chunk_1"]
+        
+        dedup.release("a")
+        content_store.delete("a")
+        documents.delete("a")
+        citations = routes.build_citations(routes.resolve_vector_hits([hit]))
+        assert [(citation["id"], citation["metadata"]["filename"]) for citation in citations] == [("b_chunk_1", "b.txt")]
+        assert citations[0]["metadata"]["chunk_index"] == 1
+        assert citations[0]["metadata"]["preview"].startswith("shared text")
+
+
+class TestContentStore:
+    """Test memory-mapped content store."""
+    
+    def test_span_reads(self, tmp_path):
+        """Test byte spans read back the same text as character slices."""
+        store = ContentStore(str(tmp_path / "content.bin"))
+        text = "Café au lait. Second sentence."
+        store.put("doc", text)
+        store.put("doc", text)  # identical re-put is a no-op
+        char_spans = [(0, 13), (14, 30)]
+        byte_spans = ContentStore.to_byte_spans(text, char_spans)
+        assert [store.read("doc", *span) for span in byte_spans] == [text[a:b] for a, b in char_spans]
+        assert store.length("doc") == len(text.encode("utf-8"))
+        store.close()
+        assert ContentStore(str(tmp_path / "content.bin")).read("doc") == text
+    
+    def test_torn_index_tail_is_truncated(self, tmp_path):
+        """Test entries written after a torn index line survive the next reopen."""
+        path = str(tmp_path / "content.bin")
+        store = ContentStore(path)
+        store.put("a", "first")
+        store.close()
+        with open(f"{path}.idx", "a") as f:
+            f.write('{"id": "b", "off')
+        
+        recovered = ContentStore(path)
+        assert "b" not in recovered
+        recovered.put("c", "third")
+        recovered.close()
+        reopened = ContentStore(path)
+        assert reopened.read("a") == "first" and reopened.read("c") == "third"
+    
+    def test_streamed_appends(self, tmp_path):
+        """Test a document grown by appends reads back whole when another is written between."""
+        store = ContentStore(str(tmp_path / "content.bin"))
+        store.append("doc", "page one")
+        store.put("other", "unrelated")
+        store.append("doc", "\n\npage two")
+        assert store.read("doc") == "page one\n\npage two"
+        assert store.read("doc", 6, 12) == "ne\n\npa"
+        assert store.read("other") == "unrelated"
+        store.close()
+        assert ContentStore(str(tmp_path / "content.bin")).read("doc") == "page one\n\npage two"
+    
+    def test_interleaved_writers(self, tmp_path):
+        """Test two documents streamed in alternately are written once, not relocated."""
+        path = tmp_path / "content.bin"
+        store = ContentStore(str(path))
+        pages = {doc: [f"{doc} page {i}. " * 20 for i in range(50)] for doc in ("a", "b")}
+        for page_a, page_b in zip(pages["a"], pages["b"]):
+            store.append("a", page_a)
+            store.append("b", page_b)
+        
+        texts = {doc: "".join(doc_pages) for doc, doc_pages in pages.items()}
+        assert path.stat().st_size == sum(len(text) for text in texts.values())
+        assert store.read("a") == texts["a"] and store.read("b") == texts["b"]
+        # Spans crossing piece boundaries read the same as slices of the whole text
+        for start, end in [(0, 1), (300, 900), (len(pages["a"][0]) - 3, len(pages["a"][0]) + 3)]:
+            assert store.read("a", start, end) == texts["a"][start:end]
+        store.close()
+        assert ContentStore(str(path)).read("b") == texts["b"]
+    
+    def test_compaction_reclaims_removed_text(self, tmp_path):
+        """Test deleted and replaced text is dropped once it outweighs live text."""
+        path = tmp_path / "content.bin"
+        store = ContentStore(str(path), compact_min_bytes=10)
+        store.append("keep", "kept ")
+        store.put("gone", "x" * 100)
+        store.append("keep", "text")
+        store.put("replaced", "old version")
+        store.put("replaced", "new")
+        store.delete("gone")
+        assert path.stat().st_size == len("kept text") + len("new")
+        assert store.read("keep") == "kept text" and store.read("replaced") == "new"
+        store.append("keep", "!")
+        store.close()
+        reopened = ContentStore(str(path))
+        assert reopened.read("keep") == "kept text!" and "gone" not in reopened
+
+
+class TestIngestionPipeline:
+    """Test staged ingestion pipeline."""
+    
+    def test_stage_progress(self, tmp_path):
+        """Test stages record progress and failures in the metadata store."""
+        store = DocumentMetadataStore(str(tmp_path))
+        pipeline = IngestionPipeline(store, max_workers=1)
+        store.put("d1", {"status": "processing", "stages": IngestionPipeline.initial_stages()})
+        path = tmp_path / "doc.txt"
+        path.write_text("First sentence. Second sentence.")
+        
+        async def job():
+            async with pipeline.stage("d1", "saving"):
+                pass
+            async with pipeline.stage("d1", "extracting"):
+                text, pages, spans = await pipeline.run_in_process(extract_and_chunk, str(path), ".txt", 512, 50)
+                assert spans == [(0, len(text))]
+            pipeline.skip_stage("d1", "indexing")
+            async with pipeline.stage("d1", "embedding") as report_progress:
+                report_progress(50)
+                assert store["d1"]["stages"]["embedding"] == {"status": "running", "progress": 50}
+                raise RuntimeError("store unavailable")
+        
+        async def run():
+            pipeline.start("d1", job())
+            assert pipeline.is_running("d1")
+            await asyncio.sleep(0)
+            while pipeline.is_running("d1"):
+                await asyncio.sleep(0.05)
+            await pipeline.shutdown()
+        
+        asyncio.run(run())
+        record = store["d1"]
+        assert record["status"] == "error" and record["error"] == "store unavailable"
+        assert [record["stages"][name]["status"] for name in IngestionPipeline.STAGES] == ["done", "done", "skipped", "error"]
+        assert IngestionPipeline.overall_progress(record["stages"]) == 87.5
+
+
+class _StubEncoder:
+    """Encodes a text as [len(text), batch call number]."""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def encode(self, texts, batch_size, convert_to_numpy):
+        self.batches.append(list(texts))
+        return [[len(text), len(self.batches)] for text in texts]
+
+
+class TestBatchEmbeddingStage:
+    """Test the overlapped batch embedding stage."""
+    
+    def test_batches_in_order(self):
+        """Test batch boundaries, encoder calls and output order against a stub encoder."""
+        encoder = _StubEncoder()
+        stage = BatchEmbeddingStage(encoder, batch_size=3)
+        texts = ["a" * n for n in range(1, 8)]
+        
+        async def collect():
+            return [batch async for batch in stage.run(texts)]
+        
+        batches = asyncio.run(collect())
+        assert [(start, end) for start, end, _ in batches] == [(0, 3), (3, 6), (6, 7)]
+        assert encoder.batches == [texts[0:3], texts[3:6], texts[6:7]]
+        assert all(embeddings.dtype == np.float32 for _, _, embeddings in batches)
+        lengths = np.concatenate([embeddings[:, 0] for _, _, embeddings in batches])
+        assert lengths.tolist() == list(range(1, 8))
+        assert [embeddings[:, 1].tolist() for _, _, embeddings in batches] == [[1, 1, 1], [2, 2, 2], [3]]
+        
+        texts = []
+        assert asyncio.run(collect()) == [] and len(encoder.batches) == 3
+
+
 class TestEmbeddingService:
     """Test embedding generation."""
     
@@ -54,7 +475,753 @@ class TestEmbeddingService:
         assert len(embedding) > 0
 
 
+class TestEmbeddingCache:
+    """Test bounded embedding cache."""
+    
+    def test_lru_eviction_and_stats(self):
+        """Test least recently used entries are evicted first."""
+        cache = EmbeddingCache(max_entries=2)
+        cache.put("m", "a", np.ones(4))
+        cache.put("m", "b", np.ones(4))
+        assert cache.get("m", "a") is not None
+        cache.put("m", "c", np.ones(4))
+        assert cache.get("m", "b") is None
+        assert cache.get("other-model", "a") is None
+        assert cache.stats()["embedding"]["evictions"] == 1
+        assert cache.stats()["embedding"]["bytes"] == 2 * 4 * 4
+    
+    def test_persistence(self, tmp_path):
+        """Test cached embeddings survive a reload."""
+        path = str(tmp_path / "embeddings")
+        cache = EmbeddingCache(persist_path=path)
+        cache.put("m", "a", np.arange(3))
+        cache.save()
+        restored = EmbeddingCache(persist_path=path)
+        assert np.array_equal(restored.get("m", "a"), np.arange(3, dtype=np.float32))
+
+
+class TestModelRegistry:
+    """Test shared model registry."""
+    
+    def test_model_loaded_once(self):
+        """Test repeated acquires share one loaded model."""
+        loads = []
+        registry = ModelRegistry()
+        registry.register_loader("dummy", lambda name: loads.append(name) or object())
+        first = registry.acquire("dummy", "m")
+        second = registry.acquire("dummy", "m")
+        assert first is second
+        assert loads == ["m"]
+        assert registry.refcount("dummy", "m") == 2
+        registry.release("dummy", "m")
+        assert registry.release("dummy", "m", unload=True) == 0
+        assert not registry.is_loaded("dummy", "m")
+
+
+class TestEmbeddingMatrix:
+    """Test in-memory embedding matrix."""
+    
+    def test_search_returns_nearest_first(self):
+        """Test cosine top-k over a grown matrix."""
+        matrix = EmbeddingMatrix(initial_capacity=2)
+        vectors = np.eye(4, dtype=np.float32)
+        matrix.add(["a", "b", "c", "d"], vectors, texts=["ta", "tb", "tc", "td"])
+        results = matrix.search(np.array([0.1, 0.9, 0.0, 0.0]), top_k=2)
+        assert len(matrix) == 4
+        assert [r["id"] for r in results] == ["b", "a"]
+        assert results[0]["text"] == "tb"
+        assert results[0]["score"] == pytest.approx(0.9 / np.sqrt(0.82), rel=1e-5)
+    
+    def test_float32_matrix_handoff(self):
+        """Test float32 matrices pass through without a copy and other inputs convert once."""
+        matrix = np.ones((3, 4), dtype=np.float32)
+        assert as_float32_matrix(matrix) is matrix
+        assert as_float32_matrix(np.ones(4)).shape == (1, 4)
+        assert as_float32_matrix([np.ones(4), np.zeros(4)]).dtype == np.float32
+        assert as_float32_matrix([], dimension=4).shape == (0, 4)
+    
+    def test_vector_store_accepts_arrays(self):
+        """Test the memory vector store takes a 2-D batch and a 1-D query array."""
+        store = VectorStore(db_type="memory")
+        store.upsert(["a", "b"], np.eye(3, dtype=np.float32)[:2], [{}, {}], ["ta", "tb"])
+        assert store.search(np.array([0.0, 1.0, 0.0], dtype=np.float32), top_k=1)[0]["id"] == "b"
+
+
+class TestVectorStore:
+    """Test the unified vector store protocol on the local backends."""
+    
+    @pytest.mark.parametrize("ann_persist_dir", [None, "ann"])
+    def test_batched_filtered_search_and_document_delete(self, tmp_path, ann_persist_dir):
+        """Test upsert, multi-query search, metadata filters and delete-by-document."""
+        persist_dir = str(tmp_path / ann_persist_dir) if ann_persist_dir else None
+        store = VectorStore(db_type="memory", ann_persist_dir=persist_dir)
+        vectors = np.eye(4, dtype=np.float32)
+        metadata = [{"doc_id": "d1"}, {"doc_id": "d1"}, {"doc_id": "d2"}, {"doc_id": "d2"}]
+        store.upsert(["c0", "c1", "c2", "c3"], vectors, metadata, ["t0", "t1", "t2", "t3"])
+        store.upsert(["c0"], vectors[3:], [{"doc_id": "d1"}], ["t0 v2"])
+        assert store.count() == 4
+        
+        results = store.search_batch(vectors[[1, 3]], top_k=1)
+        assert [hits[0]["id"] for hits in results] == ["c1", "c0"]
+        
+        hits = store.search(vectors[3], top_k=2, where={"doc_id": "d2"})
+        assert [hit["id"] for hit in hits][0] == "c3" and all(hit["metadata"]["doc_id"] == "d2" for hit in hits)
+        
+        store.delete_document("d1")
+        assert store.count() == 2
+        assert {hit["id"] for hit in store.search(vectors[0], top_k=4)} == {"c2", "c3"}
+    
+    def test_backend_protocol_is_abstract(self):
+        """Test a backend missing part of the protocol cannot be instantiated."""
+        class Partial(VectorBackend):
+            def count(self):
+                return 0
+        
+        with pytest.raises(TypeError):
+            Partial()
+    
+    def test_ivf_fallback_keeps_configuration(self, tmp_path, monkeypatch):
+        """Test falling back from HNSW (no hnswlib) to IVF keeps the configured IVF parameters."""
+        import sys
+        monkeypatch.setitem(sys.modules, "hnswlib", None)
+        store = VectorStore(db_type="memory", ann_persist_dir=str(tmp_path), ann_backend="hnsw",
+                            nprobe=3, quantizer="sq8", rescore_factor=2, ef=32)
+        store.upsert(["c0"], np.eye(4, dtype=np.float32)[:1])
+        index = store.backend.collection.index
+        assert isinstance(index, IVFFlatIndex)
+        assert (index.nprobe, index.quantizer_kind, index.rescore_factor) == (3, "sq8", 2)
+
+
+class TestIVFFlatIndex:
+    """Test the NumPy IVF-flat ANN index."""
+    
+    def _vectors(self, n=600, dim=16):
+        rng = np.random.default_rng(0)
+        return rng.normal(size=(n, dim)).astype(np.float32)
+    
+    def test_search_insert_delete(self):
+        """Test trained search finds exact matches and honours deletes."""
+        vectors = self._vectors()
+        index = IVFFlatIndex(16, nprobe=4, train_threshold=200)
+        index.add([f"v{i}" for i in range(len(vectors))], vectors)
+        assert index.is_trained and len(index) == 600
+        
+        ids, scores = index.search(vectors[:3], top_k=2)
+        assert [row[0] for row in ids] == ["v0", "v1", "v2"]
+        assert np.allclose([row[0] for row in scores], 1.0)
+        
+        index.delete(["v0"])
+        ids, _ = index.search(vectors[0], top_k=2)
+        assert "v0" not in ids[0] and len(index) == 599
+    
+    def test_save_and_load(self, tmp_path):
+        """Test a saved index reloads memory-mapped and stays writable."""
+        vectors = self._vectors()
+        collection = AnnCollection(str(tmp_path / "ann"), nprobe=4, train_threshold=200)
+        collection.add([f"v{i}" for i in range(len(vectors))], vectors,
+                       [{"i": i} for i in range(len(vectors))], [f"text {i}" for i in range(len(vectors))])
+        collection.save()
+        
+        reloaded = AnnCollection(str(tmp_path / "ann"))
+        assert isinstance(reloaded.index._base, np.memmap)
+        result = reloaded.search(vectors[5], top_k=1)[0]
+        assert result["id"] == "v5" and result["metadata"] == {"i": 5} and result["text"] == "text 5"
+        
+        reloaded.add(["new"], vectors[7] * 2)
+        reloaded.delete(["v7"])
+        assert reloaded.search(vectors[7], top_k=1)[0]["id"] == "new"
+
+    def test_incremental_save(self, tmp_path):
+        """Test a save after small changes appends the delta and leaves the base files alone."""
+        vectors = self._vectors()
+        path = str(tmp_path / "ann")
+        collection = AnnCollection(path, nprobe=4, train_threshold=200, store_texts=False)
+        collection.add([f"v{i}" for i in range(500)], vectors[:500], [{"i": i} for i in range(500)])
+        collection.save()
+        base_files = {name: os.path.getmtime(os.path.join(path, name)) for name in os.listdir(path) if name.startswith("g1-")}
+
+        collection.add(["v0"] + [f"v{i}" for i in range(500, 510)], vectors[[1] + list(range(500, 510))],
+                       [{"i": i} for i in [1] + list(range(500, 510))])
+        collection.delete(["v2"])
+        collection.save()
+        assert {name: os.path.getmtime(os.path.join(path, name)) for name in base_files} == base_files
+        assert os.path.exists(os.path.join(path, "g1-delta.f32"))
+
+        reloaded = AnnCollection(path, store_texts=False)
+        assert len(reloaded) == 509 and reloaded.index._delta_size == 11
+        assert reloaded.search(vectors[505], top_k=1)[0]["id"] == "v505"
+        assert reloaded.search(vectors[1], top_k=2)[0]["metadata"] == {"i": 1}
+        assert "v2" not in reloaded.metadata and reloaded.metadata["v0"] == {"i": 1}
+
+        reloaded.save(compact=True)
+        compacted = AnnCollection(path)
+        assert compacted.index._generation == 2 and compacted.index._delta_size == 0
+        assert len(compacted) == 509 and not any(name.startswith("g1-") for name in os.listdir(path))
+
+
+class TestQuantization:
+    """Test compressed embedding codes and asymmetric scoring."""
+    
+    def test_quantizers_approximate_inner_product(self):
+        """Test SQ8 and PQ codes shrink vectors and keep scores close."""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(2000, 32)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        query = vectors[0]
+        exact = vectors @ query
+        
+        for quantizer, ratio, tolerance in ((ScalarQuantizer(32), 4, 0.02), (ProductQuantizer(32, subspaces=8), 16, 0.35)):
+            quantizer.train(vectors)
+            codes = quantizer.encode(vectors)
+            assert vectors.nbytes // codes.nbytes == ratio
+            approx = quantizer.scores(quantizer.distance_table(query), codes)
+            assert np.abs(approx - exact).mean() < tolerance
+    
+    def test_quantized_index_rescores(self, tmp_path):
+        """Test a PQ index reloads its codes and rescoring restores exact ranking."""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(600, 16)).astype(np.float32)
+        index = IVFFlatIndex(16, nprobe=4, train_threshold=200, quantizer="pq", pq_subspaces=4)
+        index.add([f"v{i}" for i in range(len(vectors))], vectors)
+        index.save(str(tmp_path / "ivf"))
+        
+        reloaded = IVFFlatIndex.load(str(tmp_path / "ivf"))
+        assert reloaded.quantizer.kind == "pq" and reloaded._base_codes.shape == (600, 4)
+        ids, scores = reloaded.search(vectors[:3], top_k=1)
+        assert [row[0] for row in ids] == ["v0", "v1", "v2"]
+        assert np.allclose([row[0] for row in scores], 1.0, atol=1e-5)
+
+    def test_compaction_keeps_codes(self, tmp_path, monkeypatch):
+        """Test compaction copies existing codes and encodes only the delta rows."""
+        rng = np.random.default_rng(2)
+        vectors = rng.normal(size=(620, 16)).astype(np.float32)
+        index = IVFFlatIndex(16, nprobe=4, train_threshold=200, quantizer="sq8")
+        index.add([f"v{i}" for i in range(600)], vectors[:600])
+        index.save(str(tmp_path / "ivf"))
+        before = {doc_id: index._base_codes[row].copy() for doc_id, row in index._rows.items()}
+
+        index.add([f"v{i}" for i in range(600, 620)], vectors[600:])
+        encoded = []
+        encode = index.quantizer.encode
+        monkeypatch.setattr(index.quantizer, "encode", lambda rows: encoded.append(len(rows)) or encode(rows))
+        index.save(str(tmp_path / "ivf"), compact=True)
+        assert sum(encoded) == 20 and len(index._base) == 620
+        assert all(np.array_equal(index._base_codes[index._rows[doc_id]], codes) for doc_id, codes in before.items())
+
+
+class TestBM25Index:
+    """Test BM25 keyword index."""
+    
+    def test_search_ranks_matching_documents(self):
+        """Test documents containing the query terms rank first."""
+        index = BM25Index()
+        index.add("a", "The first World Cup was held in Uruguay.")
+        index.add("b", "The FA Cup is the oldest competition.")
+        index.add("c", "Football is popular worldwide.")
+        results = index.search("world cup uruguay", top_k=2)
+        assert [doc_id for doc_id, _, _ in results] == ["a", "b"]
+        normalized = index.search("world cup uruguay", top_k=2, normalize=True)
+        assert all(0 < score <= 1 for _, score, _ in normalized)
+    
+    def test_incremental_add(self):
+        """Test documents added later become searchable."""
+        index = BM25Index()
+        index.add("a", "alpha beta")
+        assert index.search("gamma") == []
+        index.add_many([("b", "gamma delta", {"filename": "b.txt"})])
+        results = index.search("gamma")
+        assert results[0][0] == "b"
+        assert results[0][2] == {"filename": "b.txt"}
+        assert len(index) == 2
+    
+    def test_remove(self):
+        """Test removed documents drop out of results and can be re-added."""
+        index = BM25Index()
+        index.add_many([("a", "gamma delta", None), ("b", "gamma epsilon", None)])
+        assert index.remove(["a", "missing"]) == 1
+        assert [doc_id for doc_id, _, _ in index.search("gamma")] == ["b"]
+        assert "a" not in index and len(index) == 1
+        index.add("a", "delta")
+        assert index.search("delta")[0][0] == "a"
+
+
+class TestQueryResultCache:
+    """Test query response cache."""
+    
+    def test_exact_and_semantic_hits(self):
+        """Test normalized exact lookups and similar-embedding lookups."""
+        cache = QueryResultCache(similarity_threshold=0.9)
+        cache.put("Who won?", (5, 3), "answer", np.array([1.0, 0.0]))
+        assert cache.get("  who WON ", (5, 3)) == "answer"
+        assert cache.get("who won", (10, 3)) is None
+        assert cache.get_similar((5, 3), np.array([0.99, 0.05])) == "answer"
+        assert cache.get_similar((5, 3), np.array([0.0, 1.0])) is None
+        stats = cache.stats()
+        assert stats["query"]["hits"] == 1 and stats["query"]["misses"] == 1
+        assert stats["query_semantic"]["hits"] == 1 and stats["query_semantic"]["misses"] == 1
+    
+    def test_caches_share_one_manager(self):
+        """Test query and embedding caches report through one CacheManager."""
+        manager = CacheManager()
+        queries = QueryResultCache(cache=manager)
+        embeddings = EmbeddingCache(cache=manager)
+        queries.get("q", ())
+        embeddings.put("m", "a", np.ones(4))
+        assert embeddings.get("m", "a") is not None
+        stats = manager.stats()
+        assert stats["query"]["misses"] == 1 and stats["embedding"]["hits"] == 1
+        assert stats["embedding"]["bytes"] == 16 and len(manager) == 1
+    
+    def test_invalidate_drops_stale_results(self):
+        """Test invalidation clears entries and rejects in-flight puts."""
+        cache = QueryResultCache()
+        generation = cache.generation
+        cache.invalidate()
+        cache.put("q", (), "stale", generation=generation)
+        assert cache.get("q", ()) is None
+
+
+class TestCacheManager:
+    """Test LRU/TTL cache manager."""
+    
+    def test_lru_bound_and_namespace_stats(self):
+        """Test capacity eviction and per-namespace counters."""
+        cache = CacheManager(max_entries=2)
+        cache.set("a", 1, namespace="x")
+        cache.set("b", 2, namespace="y")
+        assert cache.get("a", namespace="x") == 1
+        cache.set("c", 3, namespace="x")
+        assert cache.get("b", namespace="y") is None
+        assert cache.stats("x")["hits"] == 1
+        assert cache.stats("y") == {"hits": 0, "misses": 1, "sets": 1, "evictions": 1, "expirations": 0,
+                                    "entries": 0, "bytes": 0}
+    
+    def test_namespace_limits(self):
+        """Test per-namespace entry and byte bounds evict only within their namespace."""
+        cache = CacheManager(max_entries=10)
+        cache.configure("small", max_entries=2)
+        cache.configure("sized", max_bytes=100)
+        cache.set("keep", 0, namespace="other")
+        for i in range(3):
+            cache.set(i, i, namespace="small")
+            cache.set(i, i, namespace="sized", size=40)
+        assert [key for key, _ in cache.items("small")] == [1, 2]
+        assert cache.stats("sized")["bytes"] == 80 and cache.stats("sized")["evictions"] == 1
+        assert cache.get("keep", namespace="other") == 0 and len(cache) == 5
+        cache.clear("small")
+        assert cache.stats("small")["entries"] == 0 and len(cache) == 3
+    
+    def test_sweep_removes_expired_entries(self):
+        """Test expired entries are removed without being read."""
+        cache = CacheManager()
+        cache.set("gone", 1, ttl_seconds=0)
+        cache.set("kept", 2)
+        assert cache.sweep() == 1
+        assert len(cache) == 1
+        assert cache.get("kept") == 2
+    
+    def test_background_sweeper_expires_unread_entries(self):
+        """Test the sweeper thread drops expired entries that are never read again."""
+        cache = CacheManager(sweep_interval_seconds=0.02)
+        try:
+            cache.set("gone", 1, ttl_seconds=0.01, namespace="query")
+            deadline = time.monotonic() + 2
+            while len(cache) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(cache) == 0 and cache.stats("query")["expirations"] == 1
+            assert cache.stats("query")["misses"] == 0  # removed without a read
+        finally:
+            cache.stop()
+    
+    @pytest.mark.asyncio
+    async def test_async_get_or_set(self):
+        """Test async factory is only awaited on a miss."""
+        cache = CacheManager()
+        calls = []
+        
+        async def factory():
+            calls.append(1)
+            return "value"
+        
+        assert await cache.aget_or_set("k", factory) == "value"
+        assert await cache.aget_or_set("k", factory) == "value"
+        assert len(calls) == 1
+
+
 @pytest.mark.asyncio
 async def test_async_placeholder():
     """Test async functionality placeholder."""
     assert True
+
+
+class _SlowLLM(LLMClient):
+    provider = "test"
+    
+    def __init__(self):
+        super().__init__("test-model", timeout_seconds=0.2)
+        self.closed = False
+    
+    async def _generate(self, messages):
+        await asyncio.sleep(1)
+        return "late"
+    
+    async def _stream(self, messages):
+        try:
+            for delta in ["a", "b", "c"]:
+                await asyncio.sleep(0.08)
+                yield delta
+        finally:
+            self.closed = True
+
+
+class TestLLMClient:
+    """Test the shared async LLM client behaviour."""
+    
+    def test_generate_timeout(self):
+        """Test generation is bounded by the per-request timeout."""
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(_SlowLLM().generate([]))
+    
+    def test_stream_deadline_closes_upstream(self):
+        """Test the stream deadline covers the whole stream and closes the provider stream."""
+        llm = _SlowLLM()
+        received = []
+        
+        async def consume():
+            async for delta in llm.stream([]):
+                received.append(delta)
+        
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(consume())
+        assert received == ["a", "b"]
+        assert llm.closed
+    
+    def test_client_protocol_is_abstract(self):
+        """Test a client missing its streaming method cannot be instantiated."""
+        class Partial(LLMClient):
+            async def _generate(self, messages):
+                return ""
+        
+        with pytest.raises(TypeError):
+            Partial("model")
+
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight calls."""
+    
+    def test_shared_call(self):
+        """Test concurrent callers share one computation."""
+        flight = SingleFlight()
+        calls = []
+        
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+        
+        async def run():
+            results = await asyncio.gather(*[flight.do("q", compute) for _ in range(5)])
+            assert results == ["answer"] * 5
+            assert "q" not in flight
+            assert await flight.do("q", compute) == "answer"
+        
+        asyncio.run(run())
+        assert len(calls) == 2
+        assert flight.stats == {"in_flight": 0, "started": 2, "shared": 4}
+    
+    def test_cancellation(self):
+        """Test the shared work is cancelled only when every caller has gone."""
+        flight = SingleFlight()
+        cancelled = []
+        
+        async def compute():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        
+        async def run():
+            first = asyncio.ensure_future(flight.do("q", compute))
+            second = asyncio.ensure_future(flight.do("q", compute))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            await asyncio.sleep(0.01)
+            assert not cancelled and "q" in flight
+            second.cancel()
+            await asyncio.sleep(0.01)
+            assert cancelled and "q" not in flight
+        
+        asyncio.run(run())
+
+
+class _FakeCrossEncoder:
+    def __init__(self):
+        self.calls = []
+    
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        self.calls.append((pairs, batch_size))
+        return [passage.count("match") for _, passage in pairs]
+
+
+class TestDocumentReranker:
+    """Test cross-encoder reranking stage."""
+    
+    def _documents(self):
+        return [
+            {"id": "a", "text": "nothing here"},
+            {"id": "b", "text": "match match " * 200},
+            {"id": "c", "text": "one match"},
+        ]
+    
+    def test_batched_rerank_with_score_cache(self):
+        """Test reranking scores 'text', truncates passages and reuses cached scores."""
+        reranker = DocumentReranker(batch_size=8, max_length=16, score_cache=CacheManager())
+        reranker.model = _FakeCrossEncoder()
+        
+        ranked = reranker.rerank("query", self._documents(), top_k=2)
+        assert [doc["id"] for doc in ranked] == ["b", "c"]
+        pairs, batch_size = reranker.model.calls[0]
+        assert batch_size == 8
+        assert all(len(passage) <= 16 * DocumentReranker.CHARS_PER_TOKEN for _, passage in pairs)
+        
+        assert reranker.rerank("query", self._documents(), top_k=2) == ranked
+        assert len(reranker.model.calls) == 1
+    
+    def test_latency_budget_skips_rerank(self):
+        """Test reranking is skipped when the predicted cost exceeds the budget."""
+        reranker = DocumentReranker(latency_budget_ms=10)
+        reranker.model = _FakeCrossEncoder()
+        reranker.pair_latency_ms = 5.0
+        
+        ranked = reranker.rerank("query", self._documents(), top_k=2)
+        assert [doc["id"] for doc in ranked] == ["a", "b"]
+        assert reranker.skipped == 1 and not reranker.model.calls
+    
+    def test_skipped_rerank_resumes_after_probe(self):
+        """Test a stale slow estimate is re-measured by a probe and reranking resumes."""
+        reranker = DocumentReranker(latency_budget_ms=1000, probe_every=3)
+        reranker.model = _FakeCrossEncoder()
+        reranker.pair_latency_ms = 5000.0  # One slow batch, e.g. a cold model
+        
+        for _ in range(2):
+            assert [doc["id"] for doc in reranker.rerank("query", self._documents(), top_k=2)] == ["a", "b"]
+        assert reranker.skipped == 2 and not reranker.model.calls
+        
+        reranker.rerank("query", self._documents(), top_k=2)  # third skip probes a single pair
+        assert len(reranker.model.calls[0][0]) == 1 and reranker.pair_latency_ms < 1000
+        
+        ranked = reranker.rerank("query", self._documents(), top_k=2)
+        assert [doc["id"] for doc in ranked] == ["b", "c"] and reranker.skipped == 3
+
+
+class TestHybridRetriever:
+    """Test fusion of ranked lists from several query variants."""
+    
+    def test_multi_list_fusion(self):
+        """Test items ranked well across variants and sources come first."""
+        retriever = HybridRetriever(alpha=0.5)
+        semantic = [[{"id": "a"}, {"id": "b"}], [{"id": "b"}, {"id": "c"}]]
+        keyword = [[{"id": "b"}, {"id": "d"}]]
+        fused = retriever.fuse(semantic, keyword, top_k=3)
+        assert [item["id"] for item in fused] == ["b", "a", "c"]
+    
+    @pytest.mark.parametrize("query", ["What is the history of football?", "what is the history of football"])
+    def test_query_variants_differ(self, query):
+        """Test rewritten variants are distinct searches, with or without a trailing question mark."""
+        variants = QueryRewriter().rewrite(query)
+        assert variants == [query, "the history of football", "history football"]
+        assert len({QueryResultCache.normalize(variant) for variant in variants}) == len(variants)
+        assert QueryRewriter().rewrite("football") == ["football"]
+
+
+class TestFusion:
+    """Test N-way rank fusion."""
+    
+    def test_weighted_rrf(self):
+        """Test RRF sums weighted reciprocal ranks across lists."""
+        ids, scores = fuse(
+            [(np.array(["a", "b"]), np.array([0.9, 0.8])), (np.array(["b", "c"]), np.array([5.0, 1.0]))],
+            weights=[1.0, 2.0], k=0
+        )
+        assert list(ids) == ["b", "a", "c"]  # a and c tie; a was seen first
+        assert np.allclose(scores, [0.5 + 2.0, 1.0, 1.0])
+    
+    def test_comb_methods(self):
+        """Test CombSUM and CombMNZ over min-max normalized scores."""
+        lists = [(np.array(["a", "b", "c"]), np.array([3.0, 2.0, 1.0])), (np.array(["c", "d"]), np.array([10.0, 0.0]))]
+        ids, scores = fuse(lists, method="combsum")
+        assert list(ids) == ["a", "c", "b", "d"]
+        assert np.allclose(scores, [1.0, 1.0, 0.5, 0.0])
+        ids, scores = fuse(lists, method="combmnz")
+        assert list(ids) == ["c", "a", "b", "d"] and scores[0] == 2.0
+        assert np.allclose(min_max_normalize(np.array([2.0, 2.0])), [1.0, 1.0])
+
+
+@pytest.fixture
+def api_routes(tmp_path, monkeypatch):
+    """The API routes module with its stores and indexes swapped for empty ones under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    from src.api import routes
+    monkeypatch.setattr(routes, "content_store", ContentStore(str(tmp_path / "content.bin")))
+    monkeypatch.setattr(routes, "uploaded_documents", DocumentMetadataStore(str(tmp_path / "docs"), indexed_fields=("content_hash",)))
+    monkeypatch.setattr(routes, "chunk_dedup", ChunkDeduplicator(str(tmp_path / "refs")))
+    monkeypatch.setattr(routes, "bm25_index", BM25Index())
+    monkeypatch.setattr(routes, "document_chunks", [])
+    monkeypatch.setattr(routes, "chunk_embeddings", EmbeddingMatrix())
+    monkeypatch.setattr(routes, "vector_store", "fallback")
+    return routes
+
+
+class TestDocumentRoutes:
+    """Test document routes against in-process stores."""
+    
+    def _client(self, routes):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        app = FastAPI()
+        app.include_router(routes.router)
+        return TestClient(app)
+    
+    def _upload(self, routes, monkeypatch, content):
+        started = []
+        def start(job_id, job):
+            job.close()
+            started.append(job_id)
+            return job_id
+        monkeypatch.setattr(routes.ingestion_pipeline, "start", start)
+        response = self._client(routes).post("/api/v1/documents/upload", files={"file": ("notes.txt", content)})
+        assert response.status_code == 200
+        return response.json(), started
+    
+    def _ingested(self, routes, doc_id, content, status):
+        from src.ingestion.dedup import hash_content
+        text = content.decode("utf-8")
+        routes.content_store.put(doc_id, text)
+        routes.uploaded_documents.put(doc_id, {
+            "id": doc_id, "filename": "notes.txt", "content_hash": hash_content(content),
+            "status": status, "chunk_count": 1
+        })
+        chunks = [text]
+        hashes, vector_ids, _ = routes.chunk_dedup.assign([f"{doc_id}_chunk_0"], chunks)
+        routes.chunk_dedup.commit(doc_id, hashes, vector_ids, [(0, len(content))])
+    
+    def test_reupload_after_restart_restores_keyword_index(self, api_routes, monkeypatch):
+        """Test an identical upload of a completed document missing from memory restores its chunks."""
+        content = b"The first World Cup was held in Uruguay."
+        self._ingested(api_routes, "doc_1", content, "completed")
+        
+        body, started = self._upload(api_routes, monkeypatch, content)
+        assert body["duplicate"] and body["doc_id"] == "doc_1" and not started
+        assert "doc_1_chunk_0" in api_routes.bm25_index
+        assert api_routes.bm25_index.search("uruguay", top_k=1)[0][0] == "doc_1_chunk_0"
+    
+    def test_stale_processing_duplicate_is_reingested(self, api_routes, monkeypatch):
+        """Test an identical upload replaces a document left processing by a worker that is gone."""
+        content = b"Half-ingested text."
+        self._ingested(api_routes, "doc_1", content, "processing")
+        
+        body, started = self._upload(api_routes, monkeypatch, content)
+        assert not body.get("duplicate") and body["doc_id"] != "doc_1" and started == [body["doc_id"]]
+        assert "doc_1" not in api_routes.uploaded_documents and "doc_1" not in api_routes.chunk_dedup
+    
+    def test_deleted_source_files_are_pruned(self, api_routes, monkeypatch, tmp_path):
+        """Test a directory re-walk drops the documents and manifest entries of deleted files."""
+        source = tmp_path / "source"
+        source.mkdir()
+        (source / "a.txt").write_text("alpha document")
+        (source / "b.txt").write_text("beta document")
+        manifest = IngestManifest(str(tmp_path / "manifest"))
+        monkeypatch.setattr(api_routes, "ingest_manifest", manifest)
+        loader = DocumentLoader()
+        for document in loader.iter_documents(str(source), manifest=manifest, max_workers=1):
+            self._ingested(api_routes, document.doc_id, document.content.encode("utf-8"), "completed")
+            manifest.record(document)
+        doc_ids = {path: manifest.get(path)["doc_id"] for path in manifest.store}
+        
+        def rewalk(directory):
+            job = {"removed_documents": 0}
+            assert list(loader.iter_documents(directory, manifest=manifest, max_workers=1)) == []
+            asyncio.run(api_routes.remove_deleted_sources(job, loader, directory, True))
+            return job["removed_documents"]
+        
+        (source / "b.txt").unlink()
+        assert rewalk(str(source)) == 1
+        deleted, kept = str(source / "b.txt"), str(source / "a.txt")
+        assert deleted not in manifest and doc_ids[deleted] not in api_routes.uploaded_documents
+        assert doc_ids[deleted] not in api_routes.chunk_dedup and doc_ids[kept] in api_routes.uploaded_documents
+        # An incomplete walk prunes nothing
+        os.rename(source, tmp_path / "moved")
+        assert rewalk(str(source)) == 0 and kept in manifest
+    
+    def _streaming(self, routes, monkeypatch):
+        # Retrieval and reranking stubbed out so the stream goes straight to the LLM
+        results = [{"id": "doc_1_chunk_0", "score": 0.9, "text": "alpha.", "metadata": {"filename": "a.txt"}}]
+        llm = _SlowLLM()
+        llm.timeout_seconds = 5
+        
+        async def retrieve_for_query(query, top_k, cache_params):
+            return None, results, results, None
+        
+        async def rerank_results(query, final_results, rerank_k):
+            return final_results
+        
+        async def get_llm_client():
+            return llm
+        
+        routes.document_chunks.append({"id": "doc_1_chunk_0"})
+        monkeypatch.setattr(routes, "query_cache", QueryResultCache())
+        monkeypatch.setattr(routes, "retrieve_for_query", retrieve_for_query)
+        monkeypatch.setattr(routes, "rerank_results", rerank_results)
+        monkeypatch.setattr(routes, "get_llm_client", get_llm_client)
+        return llm
+    
+    def test_query_stream_event_order(self, api_routes, monkeypatch):
+        """Test the SSE stream sends citations, then each token, then done with time to first token."""
+        self._streaming(api_routes, monkeypatch)
+        response = self._client(api_routes).post("/api/v1/query/stream", json={"query": "alpha"})
+        assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        
+        assert [event for event, _ in events] == ["citations", "token", "token", "token", "done"]
+        assert events[0][1]["citations"][0]["id"] == "doc_1_chunk_0"
+        assert "".join(data["text"] for event, data in events if event == "token") == "abc"
+        done = events[-1][1]
+        assert not done["cached"] and 0 < done["time_to_first_token_ms"] <= done["processing_time_ms"]
+    
+    def test_query_stream_stops_when_closed(self, api_routes, monkeypatch):
+        """Test closing the event stream mid-generation closes the upstream LLM stream."""
+        llm = self._streaming(api_routes, monkeypatch)
+        
+        async def run():
+            events = api_routes.stream_query_events(api_routes.QueryRequest(query="alpha"))
+            received = [await events.__anext__(), await events.__anext__()]
+            await events.aclose()
+            return received
+        
+        received = asyncio.run(run())
+        assert [event.split("\n")[0] for event in received] == ["event: citations", "event: token"]
+        assert llm.closed
+    
+    def test_concurrent_queries_embed_pending_chunks_once(self, api_routes):
+        """Test queries racing to embed new chunks add each chunk to the in-memory matrix once."""
+        text = "alpha. beta. gamma."
+        api_routes.content_store.put("doc_1", text)
+        api_routes.index_chunks("doc_1", "a.txt", [(0, 6, "alpha."), (7, 12, "beta."), (13, 19, "gamma.")])
+        calls = []
+        
+        class SlowEmbedder:
+            def encode(self, texts, convert_to_numpy=True):
+                calls.append(len(texts))
+                time.sleep(0.05)
+                return np.ones((len(texts), 4), dtype=np.float32)
+        
+        threads = [threading.Thread(target=api_routes.embed_pending_chunks, args=(SlowEmbedder(),)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [3] and len(api_routes.chunk_embeddings) == 3